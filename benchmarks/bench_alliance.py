@@ -0,0 +1,61 @@
+"""
+Micro-benchmark of preprocess_alliance_df against its former implementation (four full length masks, an unanchored
+regular expression over the gene CURIEs and NCBI_Gene renamed on every row before filtering), on a synthetic
+Alliance file of full size (see monarch_gene_mapping/synthetic.py), read as generate reads it.
+
+    python benchmarks/bench_alliance.py --rows 5000000
+"""
+
+import argparse
+import timeit
+from typing import List
+
+import pandas as pd
+from pandas.core.frame import DataFrame
+
+from monarch_gene_mapping.cli_utils import preprocess_alliance_df
+from monarch_gene_mapping.mapping_spec import load_mapping_spec
+from monarch_gene_mapping.synthetic import source_blocks
+
+
+def legacy_preprocess_alliance_df(
+    df: DataFrame, exclude_taxon: List, include_curie: List, include_xref_curie: List
+) -> DataFrame:
+    """
+    preprocess_alliance_df as it was before the single mask implementation
+    """
+    taxon_filter = ~df["TaxonID"].isin(exclude_taxon)
+    curie_filter = df["GeneID"].str.contains("|".join(include_curie))
+    self_filter = df["GeneID"] != df["GlobalCrossReferenceID"]
+    xref_curie_filter = df["GlobalCrossReferenceID"].str.startswith(tuple(include_xref_curie))
+    df.loc[:, "GlobalCrossReferenceID"] = df["GlobalCrossReferenceID"].str.replace("NCBI_Gene:", "NCBIGene:")
+    df_filtered = df.loc[taxon_filter & curie_filter & self_filter & xref_curie_filter, :]
+    return df_filtered.copy()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-r", "--rows", type=int, default=5_000_000, help="Number of rows of the synthetic file")
+    parser.add_argument("-n", "--repeat", type=int, default=3, help="Number of timed runs, the best one is reported")
+    args = parser.parse_args()
+
+    preprocess = load_mapping_spec().sources["alliance"].preprocess
+    kwargs = {key: value for key, value in preprocess.items() if key not in ("function", "columns")}
+    [df] = source_blocks("alliance", args.rows, block_size=args.rows)
+    # the columns generate reads, as strings
+    df = df[preprocess["columns"]].astype("string")
+
+    expected = legacy_preprocess_alliance_df(df.copy(), **kwargs)
+    pd.testing.assert_frame_equal(preprocess_alliance_df(df, **kwargs), expected)
+    # the former implementation renames NCBI_Gene in place, each run is given a copy (a copy being timed as well)
+    legacy = min(
+        timeit.repeat(lambda: legacy_preprocess_alliance_df(df.copy(), **kwargs), number=1, repeat=args.repeat)
+    )
+    copy = min(timeit.repeat(lambda: df.copy(), number=1, repeat=args.repeat))
+    current = min(timeit.repeat(lambda: preprocess_alliance_df(df, **kwargs), number=1, repeat=args.repeat))
+    legacy -= copy
+    print(f"{len(df)} -> {len(expected)} rows: {legacy:.3f}s -> {current:.3f}s ({legacy / current:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""
+Micro-benchmark of explode_column against its former pandas implementation (str.split, DataFrame.explode and
+str.strip), on synthetic UniProt ID mapping rows (see monarch_gene_mapping/synthetic.py): one accession per row,
+and a GeneID column which is missing for some rows and holds a '; ' separated list for a few others.
+
+    python benchmarks/bench_explode.py --rows 1000000
+"""
+
+import argparse
+import timeit
+
+import numpy as np
+import pandas as pd
+from pandas.core.frame import DataFrame
+
+from monarch_gene_mapping.cli_utils import explode_column
+from monarch_gene_mapping.synthetic import source_blocks
+
+
+def legacy_explode_column(df: DataFrame, column: str, delimiter: str) -> DataFrame:
+    """
+    explode_column as it was before the array based implementation
+    """
+    values = pd.Series(np.where(pd.isnull(df[column]), df[column], df[column].astype(str)), index=df.index)
+    df_exploded = df.assign(**{column: values.str.split(delimiter)}).explode(column).copy()
+    df_exploded[column] = df_exploded[column].str.strip()
+    return df_exploded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-r", "--rows", type=int, default=1_000_000, help="Number of rows of the synthetic frame")
+    parser.add_argument("-n", "--repeat", type=int, default=3, help="Number of timed runs, the best one is reported")
+    args = parser.parse_args()
+
+    [df] = source_blocks("uniprot", args.rows, block_size=args.rows)
+    for column in ["GeneID", "UniProtKB-AC"]:
+        expected = legacy_explode_column(df, column, ";")
+        assert expected[column].fillna("").tolist() == explode_column(df, column, ";")[column].fillna("").tolist()
+        legacy = min(timeit.repeat(lambda: legacy_explode_column(df, column, ";"), number=1, repeat=args.repeat))
+        current = min(timeit.repeat(lambda: explode_column(df, column, ";"), number=1, repeat=args.repeat))
+        print(
+            f"{column:<14} {len(df)} -> {len(expected)} rows: {legacy:.3f}s -> {current:.3f}s ({legacy / current:.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
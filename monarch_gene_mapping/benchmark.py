@@ -0,0 +1,247 @@
+"""
+Throughput benchmarks of the mapping pipeline stages on synthetic source files (see synthetic.py).
+
+Each stage records its wall and CPU time, rows in and out, rows per second and the peak resident set size of the
+benchmark process while it ran. Results are saved as JSON, and compared to a saved baseline to catch regressions.
+"""
+
+import json
+import platform
+from dataclasses import replace
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import pandas as pd
+
+from monarch_gene_mapping.cli_utils import (
+    UNIPROT_ID_MAPPING_SELECTED_COLUMNS,
+    df_mappings,
+    explode_column,
+    preprocess_alliance_df,
+    run_source_plan,
+)
+from monarch_gene_mapping.defaults import DEFAULT_BENCHMARK_DIRECTORY, DEFAULT_TOLERANCE
+from monarch_gene_mapping.instrumentation import stage_metrics
+from monarch_gene_mapping.mapping_spec import SourcePlan, load_mapping_spec, plan_mappings
+from monarch_gene_mapping.synthetic import METADATA_FILENAME, SOURCES, generate_sources
+from monarch_gene_mapping.uniprot_idmapping_preprocess import filter_uniprot_id_mapping_file, read_manifest
+
+
+class BenchmarkStage(NamedTuple):
+    """
+    One benchmarked stage: setup prepares (untimed) the arguments of run, which returns its rows in and rows out
+    """
+
+    name: str
+    setup: Callable[[Path], Tuple]
+    run: Callable[..., Tuple[int, int]]
+
+
+def measure(function: Callable[..., Tuple[int, int]], *args) -> Dict[str, float]:
+    """
+    Run a function returning its rows in and rows out, and measure it
+    :return: Dictionary of seconds, cpu_seconds, rows_in, rows_out, rows_per_second and peak_rss_mb
+    """
+    with stage_metrics(function.__name__) as metrics:
+        rows_in, rows_out = function(*args)
+    return {
+        "seconds": round(metrics.seconds, 4),
+        "cpu_seconds": round(metrics.cpu_seconds, 4),
+        "rows_in": rows_in,
+        "rows_out": rows_out,
+        "rows_per_second": round(rows_in / metrics.seconds, 1) if metrics.seconds else 0.0,
+        "peak_rss_mb": round(metrics.peak_rss_mb, 1),
+    }
+
+
+def _uniprot_directory(root: Path) -> str:
+    return str(root / "data" / "uniprot")
+
+
+def _filtered_uniprot(root: Path) -> pd.DataFrame:
+    # a no-op when the manifest says the filtered archive is up to date
+    filter_uniprot_id_mapping_file(_uniprot_directory(root), "idmapping_selected.tab", "idmapping_filtered.tsv")
+    return pd.read_csv(
+        root / "data" / "uniprot" / "idmapping_filtered.tsv.gz",
+        sep="\t",
+        names=UNIPROT_ID_MAPPING_SELECTED_COLUMNS,
+        usecols=["UniProtKB-AC", "GeneID", "NCBI-taxon"],
+        dtype={"UniProtKB-AC": str, "GeneID": str},
+    )
+
+
+def _prefilter(root: str) -> Tuple[int, int]:
+    directory = _uniprot_directory(Path(root))
+    filter_uniprot_id_mapping_file(directory, "idmapping_selected.tab", "idmapping_filtered.tsv", force=True)
+    manifest = read_manifest(f"{directory}/idmapping_filtered.tsv.manifest.json")
+    return manifest["lines_read"], manifest["lines_kept"]
+
+
+def _alliance(root: Path) -> Tuple:
+    source = load_mapping_spec().sources["alliance"]
+    preprocess = source.preprocess
+    # read as generate reads it, with only the columns needed
+    df = pd.read_csv(root / source.path, **dict(source.read_options, usecols=preprocess["columns"]))
+    kwargs = {key: value for key, value in preprocess.items() if key not in ("function", "columns")}
+    return df, kwargs
+
+
+def _run_preprocess_alliance(df: pd.DataFrame, kwargs: Dict[str, Any]) -> Tuple[int, int]:
+    return len(df), len(preprocess_alliance_df(df.copy(), **kwargs))
+
+
+def _run_explode(df: pd.DataFrame) -> Tuple[int, int]:
+    return len(df), len(explode_column(df, "GeneID", ";"))
+
+
+def _run_df_mappings(df: pd.DataFrame) -> Tuple[int, int]:
+    [mapping] = [mapping for mapping in load_mapping_spec().mappings if mapping.name == "uniprot_to_ncbi"]
+    return len(df), len(df_mappings(df, **mapping.df_mappings_kwargs()))
+
+
+def _source_rows(root: Path, source: str) -> int:
+    if source == "uniprot":
+        return read_manifest(f"{_uniprot_directory(root)}/idmapping_filtered.tsv.manifest.json")["lines_kept"]
+    return json.loads((root / METADATA_FILENAME).read_text())[source]["rows"]
+
+
+def _source_plan_setup(source: str) -> Callable[[Path], Tuple]:
+    def setup(root: Path) -> Tuple:
+        if source == "uniprot":
+            _filtered_uniprot(root)
+        [plan] = [plan for plan in plan_mappings(load_mapping_spec()) if plan.source.name == source]
+        # synthetic sources are far smaller than the real ones
+        mappings = [replace(mapping, min_count=0) for mapping in plan.mappings]
+        source_spec = replace(plan.source, path=str(root / plan.source.path))
+        if source_spec.arrow is not None:
+            source_spec = replace(source_spec, arrow=str(root / source_spec.arrow))
+        plan = replace(plan, source=source_spec, mappings=mappings)
+        return plan, _source_rows(root, source)
+
+    return setup
+
+
+def _run_source_plan(plan: SourcePlan, rows: int) -> Tuple[int, int]:
+    return rows, sum(len(mappings) for mappings in run_source_plan(plan, cache_directory=None))
+
+
+STAGES: List[BenchmarkStage] = [
+    BenchmarkStage("uniprot_prefilter", lambda root: (str(root),), _prefilter),
+    BenchmarkStage("preprocess_alliance_df", _alliance, _run_preprocess_alliance),
+    BenchmarkStage("explode_column", lambda root: (_filtered_uniprot(root),), _run_explode),
+    BenchmarkStage("df_mappings", lambda root: (_filtered_uniprot(root),), _run_df_mappings),
+    *[
+        BenchmarkStage(f"mapping:{source}", _source_plan_setup(source), _run_source_plan)
+        for source in ["alliance", "hgnc", "ncbi", "uniprot"]
+    ],
+]
+
+
+def run_benchmarks(
+    directory: str = DEFAULT_BENCHMARK_DIRECTORY,
+    rows: int = 100_000,
+    seed: int = 0,
+    only: Optional[List[str]] = None,
+    source_rows: Optional[Dict[str, int]] = None,
+) -> Dict[str, Any]:
+    """
+    Generate (or reuse) synthetic source files, and benchmark the mapping pipeline stages on them
+    :param directory: Directory of the synthetic source files
+    :param rows: Number of rows of each synthetic source file
+    :param seed: Random seed of the synthetic source files
+    :param only: Names of the stages to run (default: all, see STAGES)
+    :param source_rows: Number of rows of the synthetic file of some sources, instead of rows, i.e. a full size
+                        Alliance file with {"alliance": 5_000_000}
+    :return: Dictionary of the benchmark settings, and of the measures of each stage under 'stages'
+    """
+    stages = STAGES
+    if only:
+        unknown = set(only) - {stage.name for stage in STAGES}
+        if unknown:
+            raise ValueError(
+                f"Unknown benchmark stage(s) {', '.join(sorted(unknown))}, "
+                f"expected one of {', '.join(stage.name for stage in STAGES)}"
+            )
+        stages = [stage for stage in STAGES if stage.name in only]
+
+    source_rows = source_rows or {}
+    unknown = set(source_rows) - set(SOURCES)
+    if unknown:
+        raise ValueError(f"Unknown source(s) {', '.join(sorted(unknown))}, expected one of {', '.join(SOURCES)}")
+    root = Path(directory)
+    for source in SOURCES:
+        generate_sources(str(root), source_rows.get(source, rows), seed, sources=[source])
+    results: Dict[str, Any] = {
+        "rows": rows,
+        "source_rows": source_rows,
+        "seed": seed,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "stages": {},
+    }
+    for stage in stages:
+        print(f"Benchmarking {stage.name}...")
+        results["stages"][stage.name] = measure(stage.run, *stage.setup(root))
+    return results
+
+
+def save_results(results: Dict[str, Any], path: str):
+    """
+    Save benchmark results as JSON, i.e. as a baseline for later runs
+    :param results: Benchmark results, see run_benchmarks()
+    :param path: Path of the JSON file
+    """
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    Path(path).write_text(json.dumps(results, indent=2))
+
+
+def load_results(path: str) -> Dict[str, Any]:
+    """
+    :param path: Path of saved benchmark results
+    :return: Benchmark results
+    """
+    return json.loads(Path(path).read_text())
+
+
+def compare_results(
+    results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float = DEFAULT_TOLERANCE
+) -> pd.DataFrame:
+    """
+    Compare benchmark results to a baseline: a stage regresses when its throughput drops,
+    or its peak memory grows, by more than the tolerance
+    :param results: Benchmark results, see run_benchmarks()
+    :param baseline: Baseline benchmark results
+    :param tolerance: Relative change tolerated, i.e. 0.2 for 20%
+    :return: DataFrame of stage, metric, baseline, current, change (relative) and regression, for the stages of both
+    """
+    comparisons = []
+    for name, measures in results["stages"].items():
+        if name not in baseline["stages"]:
+            continue
+        for metric, higher_is_better in [("rows_per_second", True), ("peak_rss_mb", False)]:
+            before, after = baseline["stages"][name][metric], measures[metric]
+            change = (after - before) / before if before else 0.0
+            regression = change < -tolerance if higher_is_better else change > tolerance
+            comparisons.append(
+                {
+                    "stage": name,
+                    "metric": metric,
+                    "baseline": before,
+                    "current": after,
+                    "change": round(change, 3),
+                    "regression": regression,
+                }
+            )
+    return pd.DataFrame(comparisons, columns=["stage", "metric", "baseline", "current", "change", "regression"])
+
+
+def format_results(results: Dict[str, Any]) -> str:
+    """
+    :param results: Benchmark results, see run_benchmarks()
+    :return: Table of the measures of each stage
+    """
+    table = pd.DataFrame.from_dict(results["stages"], orient="index")
+    table.index.name = "stage"
+    return table.to_string()
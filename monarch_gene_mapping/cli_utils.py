@@ -1,8 +1,32 @@
-from typing import List
+from functools import partial
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
 import numpy as np
 import pandas as pd
 from pandas.core.frame import DataFrame
+from pandas.core.series import Series
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:  # pragma: no cover - exercised only without pyarrow
+    pa = None
+    pc = None
+
+from monarch_gene_mapping.dedup import deduplicate_sources, drop_duplicate_mappings
+from monarch_gene_mapping.instrumentation import RunReport, instrumented, mapping_context, record_rows, record_step
+from monarch_gene_mapping.mapping_spec import (
+    DEFAULT_MAPPING_SPEC,
+    MappingSpec,
+    SourcePlan,
+    SourceSpec,
+    load_mapping_spec,
+    plan_mappings,
+)
+from monarch_gene_mapping.scheduler import MappingStage, run_stages
+from monarch_gene_mapping.shards import plan_shards, read_shard, shard_directory, shards_available, write_shard
+from monarch_gene_mapping.source_cache import DEFAULT_CACHE_DIRECTORY, read_source
+from monarch_gene_mapping.validation import MAPPING_COLUMNS, MappingValidationError, validate_mappings
 
 # The UniProtKB mapping tsv file lacks a header line
 UNIPROT_ID_MAPPING_SELECTED_COLUMNS = [
@@ -30,6 +54,12 @@ UNIPROT_ID_MAPPING_SELECTED_COLUMNS = [
     "Additional PubMed",
 ]
 
+# Number of rows parsed at a time by the streaming mapping stages
+CHUNK_SIZE: int = 250_000
+
+# Mapping columns taking a single value per mapping, kept as categoricals rather than a string per row
+TERM_COLUMNS: List[str] = ["predicate_id", "mapping_justification"]
+
 
 def add_prefix(prefix: str, column: pd.Series) -> pd.Series:
     """
@@ -41,6 +71,35 @@ def add_prefix(prefix: str, column: pd.Series) -> pd.Series:
     return prefix + column.astype("str")
 
 
+def term_column(value: str, length: int) -> pd.Categorical:
+    """
+    :param value: Term, i.e. a predicate
+    :param length: Number of rows
+    :return: Categorical repeating the term
+    """
+    return pd.Categorical.from_codes(np.zeros(length, dtype=np.int8), categories=[value])
+
+
+def concat_mappings(frames: List[DataFrame]) -> DataFrame:
+    """
+    Concatenate mapping DataFrames, keeping their term columns categorical even when their categories differ
+    (pd.concat falls back to object columns then)
+    :param frames: DataFrames of mappings
+    :return: DataFrame of mappings
+    """
+    frames = list(frames)
+    for column in TERM_COLUMNS:
+        if not frames or not all(isinstance(frame[column].dtype, pd.CategoricalDtype) for frame in frames):
+            continue
+        categories = pd.Index(pd.unique(np.concatenate([frame[column].cat.categories for frame in frames])))
+        for position, frame in enumerate(frames):
+            if not frame[column].cat.categories.equals(categories):
+                frame = frame.copy(deep=False)
+                frame[column] = frame[column].cat.set_categories(categories)
+                frames[position] = frame
+    return pd.concat(frames)
+
+
 def df_mappings(
     df: DataFrame,
     subject_column: str,  # "GeneID"
@@ -68,40 +127,128 @@ def df_mappings(
     :return:
     """
     # Filtering could be extracted and done before passing df but I think there is value keeping it here.
+    # Only the subject and object columns are taken along, so we never copy the whole source DataFrame.
     if (filter_column is not None) and isinstance(filter_ids, list):
-        # Create a copy to guarantee we aren't working on a slice
-        df_filtered = df.loc[df[filter_column].isin(filter_ids), :].copy()
+        df_filtered = df.loc[df[filter_column].isin(filter_ids), [subject_column, object_column]]
+        record_step("taxon_filter", len(df), len(df_filtered))
     else:
-        # Create copy so we don't modify the original DataFrame
-        df_filtered = df.copy()
-
-    df_filtered["predicate_id"] = predicate_id
-    df_filtered["mapping_justification"] = mapping_justification
+        df_filtered = df.loc[:, [subject_column, object_column]]
 
     columns = {subject_column: "subject_id", object_column: "object_id"}
-    select_columns = ["subject_id", "predicate_id", "object_id", "mapping_justification"]
-    df_select = df_filtered.rename(columns=columns).loc[:, select_columns].copy()
+    df_select = df_filtered.rename(columns=columns)
+    df_select.insert(1, "predicate_id", term_column(predicate_id, len(df_select)))
+    df_select["mapping_justification"] = term_column(mapping_justification, len(df_select))
 
     # Create a copy of the DataFrame with unmapped values
     # df_unmapped = df_select[df_select['subject_id'].isna() | df_select['object_id'].isna()]
 
     # Drop rows with missing values
+    rows = len(df_select)
     df_select = df_select.dropna(subset=["subject_id", "object_id"], how="any")
-    df_select = df_select.drop_duplicates()
+    record_step("dropna", rows, len(df_select))
+    rows = len(df_select)
+    df_select = drop_duplicate_mappings(df_select, ["subject_id", "object_id"])
+    record_step("dedup", rows, len(df_select))
 
     # Expand rows with semicolon in subject_id or object_id to multiple rows
+    rows = len(df_select)
     df_select = explode_column(df_select, "subject_id", entity_delimiter)
     df_select = explode_column(df_select, "object_id", entity_delimiter)
+    record_step("explode", rows, len(df_select))
 
     if subject_curie_prefix is not None:
         df_select["subject_id"] = add_prefix(subject_curie_prefix, df_select["subject_id"])
     if object_curie_prefix is not None:
         df_select["object_id"] = add_prefix(object_curie_prefix, df_select["object_id"])
 
-    df_map = df_select.drop_duplicates().dropna().copy()
+    # predicate_id and mapping_justification are constant
+    df_map = drop_duplicate_mappings(df_select, ["subject_id", "object_id"]).dropna()
+    record_step("final_dedup", len(df_select), len(df_map))
     return df_map  # , df_unmapped
 
 
+def df_mappings_stream(chunks: Iterable[DataFrame], **kwargs) -> Iterator[DataFrame]:
+    """
+    Streaming version of df_mappings, for sources read in chunks (i.e. with pd.read_csv(..., chunksize=CHUNK_SIZE))
+    so that peak memory depends on the chunk size rather than on the size of the source file.
+    Mappings already yielded for an earlier chunk are dropped, so concatenating the yielded
+    DataFrames gives the same result as calling df_mappings on the whole source.
+    :param chunks: Iterable of DataFrame chunks of the mapping source
+    :param kwargs: df_mappings keyword arguments (other than df)
+    :return: Iterator of mapping DataFrames, one per chunk
+    """
+    seen: Set[Tuple[str, str]] = set()
+    for chunk in chunks:
+        yield drop_seen(df_mappings(df=chunk, **kwargs), seen)
+
+
+def drop_seen(df_map: DataFrame, seen: Set[Tuple[str, str]]) -> DataFrame:
+    """
+    Drop the mappings of a chunk already generated for an earlier chunk of the same source
+    :param df_map: DataFrame of mappings generated (with the same predicate and justification) from one chunk
+    :param seen: (subject_id, object_id) pairs generated so far, updated with those of df_map
+    :return: DataFrame of the mappings not seen before
+    """
+    # predicate_id and mapping_justification are constant for a given set of df_mappings kwargs
+    keys = list(zip(df_map["subject_id"], df_map["object_id"]))
+    unseen = [key not in seen for key in keys]
+    seen.update(keys)
+    df_unseen = df_map.loc[unseen]
+    record_step("chunk_dedup", len(df_map), len(df_unseen))
+    return df_unseen
+
+
+def split_values(values: Series, delimiter: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """
+    Split delimiter separated lists into a flat array of whitespace stripped values.
+    Only the rows holding a delimiter (or surrounding whitespace) are split, with pyarrow when it is installed;
+    missing values are kept as they are.
+    :param values: Series of delimiter separated lists
+    :param delimiter: Delimiter for splitting values
+    :return: Object array of the values of every row in turn, and the number of values of each row
+             (None when no row holds more than one value, the array then being aligned with the rows)
+    """
+    if pd.api.types.infer_dtype(values, skipna=True) == "string":
+        strings = values.to_numpy(dtype=object)
+    else:
+        # cast non-null items to string
+        strings = np.where(pd.isnull(values), values, values.astype(str)).astype(object)
+
+    if pc is not None:
+        array = pa.array(strings, type=pa.string(), from_pandas=True)
+        padded = pc.not_equal(pc.binary_length(pc.utf8_trim_whitespace(array)), pc.binary_length(array))
+        to_split = pc.or_kleene(pc.match_substring(array, delimiter), padded)
+        rows = np.flatnonzero(pc.fill_null(to_split, False).to_numpy(zero_copy_only=False))
+        if len(rows) == 0:
+            return strings, None
+        lists = pc.split_pattern(array.take(rows), delimiter)
+        parts = pc.utf8_trim_whitespace(lists.flatten()).to_numpy(zero_copy_only=False)
+        counts = pc.list_value_length(lists).to_numpy()
+    else:
+        rows = np.flatnonzero(
+            [isinstance(value, str) and (delimiter in value or value != value.strip()) for value in strings]
+        )
+        if len(rows) == 0:
+            return strings, None
+        lists = [strings[row].split(delimiter) for row in rows]
+        parts = np.array([part.strip() for parts in lists for part in parts], dtype=object)
+        counts = np.array([len(parts) for parts in lists], dtype=np.int64)
+
+    if (counts == 1).all():
+        flat = strings.copy()
+        flat[rows] = parts
+        return flat, None
+
+    repeats = np.ones(len(strings), dtype=np.int64)
+    repeats[rows] = counts
+    flat = np.repeat(strings, repeats)
+    # position of each part: where the row starts in the flat array, plus the rank of the part in the row
+    row_starts = np.cumsum(repeats) - repeats
+    part_ranks = np.arange(len(parts)) - np.repeat(np.cumsum(counts) - counts, counts)
+    flat[np.repeat(row_starts[rows], counts) + part_ranks] = parts
+    return flat, repeats
+
+
 def explode_column(df: DataFrame, column: str, delimiter: str) -> DataFrame:
     """
     Expand columns with delimiter separated lists to multiple rows for each
@@ -110,165 +257,289 @@ def explode_column(df: DataFrame, column: str, delimiter: str) -> DataFrame:
     :param delimiter: Delimiter for splitting column
     :return:
     """
-    # cast non-null items in column to string
-    df[column] = np.where(pd.isnull(df[column]),df[column],df[column].astype(str))
+    flat, repeats = split_values(df[column], delimiter)
+    if repeats is None:
+        # no row to expand: share the other columns, df may be shared with other mapping stages
+        df_exploded = df.copy(deep=False)
+    else:
+        df_exploded = df.take(np.repeat(np.arange(len(df)), repeats))
+    df_exploded[column] = flat
+    return df_exploded
 
-    assign_kwargs = {column: df[column].str.split(delimiter)}
-    df_exploded = df.assign(**assign_kwargs).explode(column).copy()
 
-    # remove whitespace
-    df_exploded[column] = df_exploded[column].str.strip()
-    return df_exploded
+def _string_array(values: Series):
+    """
+    :param values: Series of strings
+    :return: pyarrow string array of the values, None without pyarrow or if some values are not strings
+    """
+    if pc is None:
+        return None
+    try:
+        # the strings of the array backing the values, without checking for missing values again
+        return pa.array(np.asarray(values.array, dtype=object), type=pa.string(), from_pandas=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return None
+
+
+def _starts_with(values: Series, starts: List[str], array=None) -> np.ndarray:
+    """
+    :param values: Series of strings
+    :param starts: Beginnings of the values to match
+    :param array: Optional pyarrow string array of the values, see _string_array()
+    :return: Boolean array of the values starting with one of the beginnings
+    """
+    if array is None:
+        return values.str.startswith(tuple(starts)).to_numpy(dtype=bool, na_value=False)
+    mask = np.zeros(len(array), dtype=bool)
+    for start in starts:
+        mask |= pc.fill_null(pc.starts_with(array, start), False).to_numpy(zero_copy_only=False)
+    return mask
 
 
 def preprocess_alliance_df(
     df: DataFrame, exclude_taxon: List, include_curie: List, include_xref_curie: List
 ) -> DataFrame:
-    taxon_filter = ~df["TaxonID"].isin(exclude_taxon)
-    curie_filter = df["GeneID"].str.contains("|".join(include_curie))
-    self_filter = df["GeneID"] != df["GlobalCrossReferenceID"]
-    xref_curie_filter = df["GlobalCrossReferenceID"].str.startswith(tuple(include_xref_curie))
-    df.loc[:, "GlobalCrossReferenceID"] = df["GlobalCrossReferenceID"].str.replace("NCBI_Gene:", "NCBIGene:")
-    df_filtered = df.loc[taxon_filter & curie_filter & self_filter & xref_curie_filter, :]
-    return df_filtered.copy()
-
-
-def alliance_mapping() -> DataFrame:
-    alliance_file = "data/alliance/GENECROSSREFERENCE_COMBINED.tsv.gz"
-    alliance_df = pd.read_csv(alliance_file, sep="\t", dtype="string", comment="#")
-    alliance_df_filtered = preprocess_alliance_df(
-        df=alliance_df,
-        exclude_taxon=["NCBITaxon:9606", "NCBITaxon:2697049"],
-        include_curie=["MGI:", "RGD:", "FB:", "WB:", "ZFIN:", "Xenbase:"],
-        include_xref_curie=["ENSEMBL:", "NCBI_Gene:", "UniProtKB:"],
-    )
-    alliance_mappings = df_mappings(
-        df=alliance_df_filtered,
-        subject_column="GeneID",
-        subject_curie_prefix="",
-        object_column="GlobalCrossReferenceID",
-        object_curie_prefix="",
-        predicate_id="skos:exactMatch",
-        mapping_justification="semapv:UnspecifiedMatching",
-    )
-
-    return alliance_mappings
-
-
-def generate_gene_mappings() -> DataFrame:
-    mapping_dataframes = []
-
-    ### Alliance mappings
-    print("Generating Alliance mappings...")
-    alliance_mappings = alliance_mapping()
-    print(f"Generated {len(alliance_mappings)} Alliance mappings")
-    assert len(alliance_mappings) > 400000
-    mapping_dataframes.append(alliance_mappings)
-
-    ### HGNC mappings
-
-    print("\nGenerating HGNC to NCBI Gene mappings...")
-    hgnc_df = pd.read_csv("data/hgnc/hgnc_complete_set.txt", sep="\t", dtype="string")
-    hgnc_to_ncbi = df_mappings(
-        df=hgnc_df,
-        subject_column="hgnc_id",
-        object_column="entrez_id",
-        object_curie_prefix="NCBIGene:",
-        predicate_id="skos:exactMatch",
-        mapping_justification="semapv:UnspecifiedMatching",
-    )
-    print(f"Generated {len(hgnc_to_ncbi)} HGNC-NCBI Gene mappings")
-    assert len(hgnc_to_ncbi) > 40000
-    mapping_dataframes.append(hgnc_to_ncbi)
-
-    print("\nGenerating HGNC to OMIM mappings...")
-    hgnc_to_omim = df_mappings(
-        df=explode_column(hgnc_df, "omim_id", "|"),
-        subject_column="hgnc_id",
-        object_column="omim_id",
-        object_curie_prefix="OMIM:",
-        predicate_id="skos:exactMatch",
-        mapping_justification="semapv:UnspecifiedMatching",
-    )
-    print(f"Generated {len(hgnc_to_omim)} HGNC-OMIM mappings")
-    assert len(hgnc_to_omim) > 16000
-    mapping_dataframes.append(hgnc_to_omim)
-
-    print("\nGenerating HGNC to UniProtKB mappings...")
-    hgnc_to_uniprot = df_mappings(
-        df=explode_column(hgnc_df, "uniprot_ids", "|"),
-        subject_column="hgnc_id",
-        object_column="uniprot_ids",
-        object_curie_prefix="UniProtKB:",
-        predicate_id="skos:closeMatch",
-        mapping_justification="semapv:UnspecifiedMatching",
-    )
-    print(f"Generated {len(hgnc_to_uniprot)} HGNC-UniProtKB mappings")
-    assert len(hgnc_to_uniprot) > 20000
-    mapping_dataframes.append(hgnc_to_uniprot)
-
-    print("\nGenerating HGNC to ENSEMBL Gene mappings...")
-    hgnc_to_ensemble = df_mappings(
-        df=hgnc_df,
-        subject_column="hgnc_id",
-        object_column="ensembl_gene_id",
-        object_curie_prefix="ENSEMBL:",
-        predicate_id="skos:exactMatch",
-        mapping_justification="semapv:UnspecifiedMatching",
-    )
-    print(f"Generated {len(hgnc_to_ensemble)} HGNC-ENSEMBL Gene mappings")
-    assert len(hgnc_to_ensemble) > 40000
-    mapping_dataframes.append(hgnc_to_ensemble)
-
-    ### NCBI mappings
-
-    print("\nGenerating NCBIGene to ENSEMBL Gene mappings...")
-    ensembl_df = pd.read_csv("data/ncbi/gene2ensembl.gz", compression="gzip", sep="\t")
-    ensembl_to_ncbi = df_mappings(
-        df=ensembl_df,
-        subject_column="GeneID",
-        subject_curie_prefix="NCBIGene:",
-        object_column="Ensembl_gene_identifier",
-        object_curie_prefix="ENSEMBL:",
-        predicate_id="skos:exactMatch",
-        mapping_justification="semapv:UnspecifiedMatching",
-        filter_column="#tax_id",
-        # Chicken: 9031, Dog: 9615, Cow, 9913, Pig: 9823, Aspergillus ('Emericella') nidulans: 227321
-        filter_ids=[9031, 9615, 9913, 9823, 227321],
-    )
-    print(f"Generated {len(ensembl_to_ncbi)} ENSEMBL-NCBIGene Gene mappings")
-    assert len(ensembl_to_ncbi) > 70000
-    mapping_dataframes.append(ensembl_to_ncbi)
-
-    ### UniProtKB mappings
-
-    print("\nGenerating UniProtKB to NCBI Gene mappings...")
-    uniprot_df = pd.read_csv(
-        "data/uniprot/idmapping_filtered.tsv.gz",  # filtered down to target species
-        names=UNIPROT_ID_MAPPING_SELECTED_COLUMNS,
-        compression="gzip",
-        sep="\t",
-        low_memory=False,
-    )
-    uniprot_to_ncbi = df_mappings(
-        df=uniprot_df,
-        subject_column="GeneID",
-        subject_curie_prefix="NCBIGene:",
-        predicate_id="skos:exactMatch",
-        object_column="UniProtKB-AC",
-        object_curie_prefix="UniProtKB:",
-        mapping_justification="semapv:UnspecifiedMatching",
-        filter_column="NCBI-taxon",
-        # Chicken: 9031, Dog: 9615, Cow, 9913, Pig: 9823, Aspergillus ('Emericella') nidulans: 227321
-        filter_ids=[9031, 9615, 9913, 9823, 227321],
-        entity_delimiter=";",
-    )
-    print(f"Generated {len(uniprot_to_ncbi)} UniProtKB-NCBIGene Gene mappings")
-    assert len(uniprot_to_ncbi) > 70000
-    mapping_dataframes.append(uniprot_to_ncbi)
-
-    mappings = pd.concat(mapping_dataframes)
-    for row in mappings.itertuples():
-        assert not ("<NA>" in row.subject_id)
-        assert not ("<NA>" in row.object_id)
+    """
+    Keep the Alliance cross references of the included gene CURIEs to the included cross reference CURIEs (but the
+    ones of excluded taxa and of genes to themselves), NCBI_Gene cross references being renamed to NCBIGene
+    :param df: DataFrame of the Alliance file
+    :param exclude_taxon: Taxa to leave out
+    :param include_curie: Beginnings of the gene CURIEs to keep, i.e. 'MGI:'
+    :param include_xref_curie: Beginnings of the cross reference CURIEs to keep, i.e. 'ENSEMBL:'
+    :return: DataFrame of the kept rows
+    """
+    # a single mask of the rows to keep, computed with Arrow kernels when possible, the rows being taken once
+    genes, xrefs = _string_array(df["GeneID"]), _string_array(df["GlobalCrossReferenceID"])
+    keep = ~df["TaxonID"].isin(exclude_taxon).to_numpy(dtype=bool)
+    keep &= _starts_with(df["GeneID"], include_curie, genes)
+    keep &= _starts_with(df["GlobalCrossReferenceID"], include_xref_curie, xrefs)
+    if genes is not None and xrefs is not None:
+        keep &= pc.fill_null(pc.not_equal(genes, xrefs), False).to_numpy(zero_copy_only=False)
+    else:
+        keep &= (df["GeneID"] != df["GlobalCrossReferenceID"]).to_numpy(dtype=bool, na_value=False)
+
+    rows = np.flatnonzero(keep)
+    df_filtered = df.take(rows)
+    # only the cross references kept, and holding NCBI_Gene, are renamed
+    column = "GlobalCrossReferenceID"
+    if xrefs is None:
+        df_filtered[column] = df_filtered[column].str.replace("NCBI_Gene:", "NCBIGene:", regex=False)
+    else:
+        kept = xrefs.take(pa.array(rows))
+        renamed = np.flatnonzero(
+            pc.fill_null(pc.match_substring(kept, "NCBI_Gene:"), False).to_numpy(zero_copy_only=False)
+        )
+        values = np.array(df_filtered[column].array, dtype=object)
+        values[renamed] = pc.replace_substring(kept.take(pa.array(renamed)), "NCBI_Gene:", "NCBIGene:").to_numpy(
+            zero_copy_only=False
+        )
+        df_filtered[column] = pd.Series(values, index=df_filtered.index, dtype=df[column].dtype)
+    return df_filtered
+
+
+# Preprocessing functions which can be named in the 'preprocess' section of a source in mappings.yaml
+PREPROCESSORS: Dict[str, Callable[..., DataFrame]] = {"alliance": preprocess_alliance_df}
+
+# Lists of column names which can be named in the 'names' read option of a source in mappings.yaml
+COLUMN_NAMES: Dict[str, List[str]] = {"UNIPROT_ID_MAPPING_SELECTED_COLUMNS": UNIPROT_ID_MAPPING_SELECTED_COLUMNS}
+
+
+def source_read_options(plan: SourcePlan) -> Dict[str, Any]:
+    """
+    pd.read_csv keyword arguments of a planned source, reading only the columns needed by its mappings
+    :param plan: Source plan
+    :return: Dictionary of keyword arguments
+    """
+    read_options = dict(plan.source.read_options, usecols=plan.usecols)
+    if isinstance(read_options.get("names"), str):
+        read_options["names"] = COLUMN_NAMES[read_options["names"]]
+    return read_options
+
+
+def preprocess_source_df(df: DataFrame, source: SourceSpec) -> DataFrame:
+    """
+    Apply the preprocessing function of a source, if any, to a DataFrame of the source
+    """
+    if not source.preprocess:
+        return df
+    kwargs = {key: value for key, value in source.preprocess.items() if key not in ("function", "columns")}
+    df_preprocessed = PREPROCESSORS[source.preprocess["function"]](df=df, **kwargs)
+    record_step("preprocess", len(df), len(df_preprocessed))
+    return df_preprocessed
+
+
+def mapping_df(df: DataFrame, mapping: MappingSpec) -> DataFrame:
+    """
+    Generate one specified mapping from a DataFrame of its source
+    """
+    with mapping_context(mapping.name):
+        for column, delimiter in mapping.explode.items():
+            rows = len(df)
+            df = explode_column(df, column, delimiter)
+            record_step(f"explode_{column}", rows, len(df))
+        return df_mappings(df=df, **mapping.df_mappings_kwargs())
+
+
+def run_source_plan(plan: SourcePlan, cache_directory: Optional[str] = DEFAULT_CACHE_DIRECTORY) -> List[DataFrame]:
+    """
+    Read a source file once and generate all its planned mappings
+    :param plan: Source plan
+    :param cache_directory: Directory of the parsed source file cache; None to always parse the source file
+    :return: List of mapping DataFrames, in the order of plan.mappings
+    """
+    source = plan.source
+    print(f"\nGenerating {', '.join(mapping.description for mapping in plan.mappings)} mappings...")
+    read_options = source_read_options(plan)
+    if source.chunked:
+        mapped: Dict[str, List[DataFrame]] = {mapping.name: [] for mapping in plan.mappings}
+        seen: Dict[str, Set[Tuple[str, str]]] = {mapping.name: set() for mapping in plan.mappings}
+        chunks = read_source(
+            source.path, cache_directory=cache_directory, chunksize=CHUNK_SIZE, arrow=source.arrow, **read_options
+        )
+        for chunk in chunks:
+            record_rows(rows_in=len(chunk))
+            chunk = preprocess_source_df(chunk, source)
+            for mapping in plan.mappings:
+                with mapping_context(mapping.name):
+                    mapped[mapping.name].append(drop_seen(mapping_df(chunk, mapping), seen[mapping.name]))
+        # a source may yield no chunk at all, i.e. an empty file after filtering
+        mapping_dataframes = [
+            pd.concat(mapped[mapping.name]) if mapped[mapping.name] else DataFrame(columns=MAPPING_COLUMNS)
+            for mapping in plan.mappings
+        ]
+    else:
+        df = read_source(source.path, cache_directory=cache_directory, arrow=source.arrow, **read_options)
+        record_rows(rows_in=len(df))
+        df = preprocess_source_df(df, source)
+        mapping_dataframes = [mapping_df(df, mapping) for mapping in plan.mappings]
+
+    for mapping, mappings in zip(plan.mappings, mapping_dataframes):
+        record_rows(rows_out=len(mappings))
+        print(f"Generated {len(mappings)} {mapping.description} mappings")
+        assert (
+            len(mappings) > mapping.min_count
+        ), f"Expected more than {mapping.min_count} {mapping.description} mappings"
+    return mapping_dataframes
+
+
+def run_sharded_source_plan(
+    plan: SourcePlan,
+    shards: Optional[Dict[str, Dict[str, Any]]],
+    cache_directory: Optional[str] = DEFAULT_CACHE_DIRECTORY,
+) -> List[DataFrame]:
+    """
+    Load the mappings of a source file from their shards if they are all saved, otherwise generate them (see
+    run_source_plan) and save their shards
+    :param plan: Source plan
+    :param shards: Shard of each mapping of the plan (see plan_shards), None to always generate the mappings
+    :param cache_directory: Cache directory
+    :return: List of mapping DataFrames, in the order of plan.mappings
+    """
+    if shards is None or cache_directory is None:
+        return run_source_plan(plan, cache_directory)
+    directory = shard_directory(cache_directory)
+    if all((directory / shards[mapping.name]["filename"]).exists() for mapping in plan.mappings):
+        try:
+            mapping_dataframes = [read_shard(directory, shards[mapping.name]) for mapping in plan.mappings]
+        except (OSError, pa.ArrowException) as error:
+            print(f"\nRegenerating the mappings of {plan.source.path}, a shard being unreadable: {error}")
+        else:
+            print(f"\nReusing {', '.join(mapping.description for mapping in plan.mappings)} mappings (unchanged)")
+            for mappings in mapping_dataframes:
+                record_rows(rows_out=len(mappings))
+            return mapping_dataframes
+
+    mapping_dataframes = run_source_plan(plan, cache_directory)
+    for mapping, mappings in zip(plan.mappings, mapping_dataframes):
+        write_shard(directory, shards[mapping.name], mappings)
+    return mapping_dataframes
+
+
+def generate_gene_mappings(
+    cache_directory: Optional[str] = DEFAULT_CACHE_DIRECTORY,
+    jobs: int = 1,
+    executor: str = "thread",
+    only: Optional[List[str]] = None,
+    spec_path: str = DEFAULT_MAPPING_SPEC,
+    converter: Optional[Any] = None,
+    run_report: Optional[RunReport] = None,
+    deduplicate: bool = True,
+) -> DataFrame:
+    """
+    Generate the gene mappings specified in a mapping specification
+    :param cache_directory: Directory of the parsed source file cache and of the mapping shards, only the sources
+                            which changed since they were sharded being mapped again; None to always map every source
+    :param jobs: Number of source files processed concurrently
+    :param executor: Kind of worker pool processing source files concurrently, 'thread' or 'process'
+    :param only: Names of the mappings to generate (default: all)
+    :param spec_path: Path of the YAML mapping specification
+    :param converter: Optional curies.Converter to check the prefixes of the mapped identifiers against
+    :param run_report: Optional RunReport recording the measures of each mapping stage and of the validation, and
+                       the shard of each mapping (under 'shards') and the duplicates removed (under 'duplicates')
+    :param deduplicate: Drop the mappings (subject_id, predicate_id, object_id triples) generated by several mappings,
+                        keeping them for the first one in the order of the mapping specification
+    :return: DataFrame of mappings, in the order of the mapping specification
+    :raises MappingValidationError: if the mappings fail validation (see monarch_gene_mapping.validation)
+    """
+    spec = load_mapping_spec(spec_path)
+    plans = plan_mappings(spec, only=only)
+    if run_report is None:
+        run_report = RunReport()
+    # concurrent threads share the peak memory of the process, worker processes each have their own
+    exclusive = jobs <= 1 or executor == "process"
+    sharded = cache_directory is not None and shards_available()
+    plan_shard = {plan.source.name: plan_shards(plan, cache_directory) if sharded else None for plan in plans}
+    stages = [
+        MappingStage(
+            plan.source.name,
+            partial(
+                instrumented,
+                plan.source.name,
+                run_sharded_source_plan,
+                plan,
+                plan_shard[plan.source.name],
+                exclusive=exclusive,
+            ),
+        )
+        for plan in plans
+    ]
+    if sharded:
+        directory = shard_directory(cache_directory)
+        run_report.details["shards"] = {
+            name: dict(shard, reused=(directory / shard["filename"]).exists())
+            for shards in plan_shard.values()
+            if shards is not None
+            for name, shard in shards.items()
+        }
+    results = run_stages(stages, jobs=jobs, executor=executor, cache_directory=cache_directory)
+    for _, metrics in results:
+        run_report.add(metrics)
+
+    mapping_dataframes = {
+        mapping.name: mappings
+        for plan, (result, _) in zip(plans, results)
+        for mapping, mappings in zip(plan.mappings, result)
+    }
+    names = [mapping.name for mapping in spec.mappings if mapping.name in mapping_dataframes]
+    with run_report.stage("concat"):
+        mappings = concat_mappings([mapping_dataframes[name] for name in names])
+        record_rows(rows_out=len(mappings))
+    if deduplicate:
+        with run_report.stage("dedup"):
+            record_rows(rows_in=len(mappings))
+            lengths = [len(mapping_dataframes[name]) for name in names]
+            mappings, duplicates = deduplicate_sources(mappings, names, lengths)
+            record_rows(rows_out=len(mappings))
+        run_report.details["duplicates"] = duplicates
+        if any(duplicates.values()):
+            removed = ", ".join(f"{count} {name}" for name, count in duplicates.items() if count)
+            print(f"\nRemoved mappings already generated by a preferred source: {removed}")
+    with run_report.stage("validation"):
+        record_rows(rows_in=len(mappings), rows_out=len(mappings))
+        report = validate_mappings(mappings, converter)
+    run_report.details["validation"] = report.counts().to_dict(orient="records")
+    if report.has_errors:
+        raise MappingValidationError(report)
+    if not report.issues.empty:
+        print(f"\n{report.summary()}\n")
     return mappings
@@ -0,0 +1,178 @@
+"""
+Bulk standardization of the CURIEs of generated mappings.
+
+converter.pd_standardize_curie() parses and standardizes one CURIE at a time, though a mapping column only holds
+a handful of distinct prefixes. Here the prefix and local identifier of every CURIE are split with array string
+operations (on Arrow strings when the optional pyarrow package is installed), the prefixes are dictionary encoded,
+each distinct prefix is standardized once through the converter, and only the CURIEs whose prefix is changed are
+rebuilt. The result is the one of converter.pd_standardize_curie(..., strict=True).
+
+Building the merged prefixmaps converter takes seconds, so it is built once per version of prefixmaps and curies,
+and then loaded from a pickle saved in the cache directory.
+"""
+
+import os
+import pickle
+import threading
+from functools import lru_cache
+from importlib.metadata import version
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from curies.api import CURIEStandardizationError
+from pandas.core.frame import DataFrame
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:  # pragma: no cover - exercised only without pyarrow
+    pa = None
+    pc = None
+
+from monarch_gene_mapping.defaults import DEFAULT_CACHE_DIRECTORY
+
+
+def converter_cache_path(names: Tuple[str, ...], cache_directory: str) -> Path:
+    """
+    :param names: prefixmaps context names
+    :param cache_directory: Cache directory
+    :return: Path of the pickled converter, which changes with the versions of prefixmaps and curies
+    """
+    key = f"{'+'.join(names)}-prefixmaps{version('prefixmaps')}-curies{version('curies')}"
+    return Path(cache_directory) / f"converter-{key}.pickle"
+
+
+@lru_cache(maxsize=None)
+def load_converter(names: Tuple[str, ...] = ("merged",), cache_directory: Optional[str] = DEFAULT_CACHE_DIRECTORY):
+    """
+    Load a prefixmaps converter from the cache directory, building it (and caching it) on the first call
+    :param names: prefixmaps context names
+    :param cache_directory: Cache directory, None to always build the converter
+    :return: curies.Converter
+    """
+    path = None if cache_directory is None else converter_cache_path(names, cache_directory)
+    if path is not None and path.exists():
+        try:
+            with open(path, "rb") as converter_file:
+                return pickle.load(converter_file)
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+            print(f"Rebuilding the unreadable cached converter {path}")
+
+    from prefixmaps import load_converter as load_prefixmaps_converter
+
+    converter = load_prefixmaps_converter(list(names))
+    if path is not None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temporary_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(temporary_path, "wb") as converter_file:
+            pickle.dump(converter, converter_file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary_path, path)
+    return converter
+
+
+class UnknownPrefixError(CURIEStandardizationError):
+    """
+    CURIEs of a column whose prefix the converter can't standardize, reported together
+    """
+
+    def __init__(self, column: str, prefixes: Dict[str, int], examples: Dict[str, str]):
+        """
+        :param column: Column name
+        :param prefixes: Number of CURIEs of each unknown prefix
+        :param examples: A CURIE of each unknown prefix
+        """
+        self.column = column
+        self.prefixes = prefixes
+        self.examples = examples
+        details = ", ".join(f"{prefix} ({count} CURIEs, i.e. {examples[prefix]})" for prefix, count in prefixes.items())
+        super().__init__(f"Unknown CURIE prefixes in {column}: {details}")
+
+
+def split_curies(values: np.ndarray, delimiter: str = ":") -> Tuple[np.ndarray, np.ndarray, Any, np.ndarray]:
+    """
+    Split CURIEs on their first delimiter, the prefixes being dictionary encoded
+    :param values: Object array of CURIEs
+    :param delimiter: Delimiter between prefix and local identifier
+    :return: Tuple of the distinct prefixes, the prefix code of each CURIE, the local identifiers (as a pyarrow
+             string array, a pandas Series without pyarrow), and a boolean mask of the values which are not strings
+             holding the delimiter
+    """
+    if pc is not None:
+        try:
+            array = pa.array(values, type=pa.string(), from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            # values other than strings, which are not CURIEs anyway
+            array = None
+        if array is not None:
+            invalid = pc.invert(pc.fill_null(pc.match_substring(array, delimiter), False))
+            # every value split in two, the invalid ones being masked
+            parts = pc.split_pattern(pc.if_else(invalid, delimiter, array), delimiter, max_splits=1)
+            encoded = pc.dictionary_encode(pc.list_element(parts, 0))
+            return (
+                np.asarray(encoded.dictionary.to_pylist(), dtype=object),
+                encoded.indices.to_numpy(zero_copy_only=False),
+                pc.list_element(parts, 1),
+                invalid.to_numpy(zero_copy_only=False),
+            )
+
+    series = pd.Series(values, dtype=object)
+    invalid = ~series.str.contains(delimiter, regex=False, na=False).to_numpy()
+    parts = series.where(~invalid, delimiter).str.partition(delimiter)
+    codes, prefixes = pd.factorize(parts[0].to_numpy(dtype=object))
+    return np.asarray(prefixes, dtype=object), codes, parts[2], invalid
+
+
+def _take(values, rows: np.ndarray) -> np.ndarray:
+    """
+    :param values: pyarrow array or pandas Series
+    :param rows: Positions
+    :return: Object array of the values at the positions
+    """
+    if isinstance(values, pd.Series):
+        return values.to_numpy(dtype=object)[rows]
+    return values.take(pa.array(rows)).to_numpy(zero_copy_only=False)
+
+
+def standardize_curies(
+    df: DataFrame, columns: List[str], converter: Any, target_columns: Optional[List[str]] = None
+) -> Dict[str, int]:
+    """
+    Standardize the CURIEs of DataFrame columns in place, as converter.pd_standardize_curie(..., strict=True) does
+    :param df: DataFrame
+    :param columns: Columns of CURIEs
+    :param converter: curies.Converter
+    :param target_columns: Columns to put the standardized CURIEs in (default: the columns themselves)
+    :return: Dictionary of the number of CURIEs whose prefix was changed, by column
+    :raises UnknownPrefixError: if some prefixes of a column can't be standardized, listing all of them
+    """
+    delimiter = converter.delimiter
+    changed = {}
+    for column, target_column in zip(columns, target_columns or columns):
+        values = df[column].to_numpy(dtype=object)
+        prefixes, codes, identifiers, invalid = split_curies(values, delimiter)
+        if invalid.any():
+            # not a CURIE at all: fail the way the converter does on the first one
+            converter.standardize_curie(values[invalid.argmax()], strict=True)
+            raise CURIEStandardizationError(values[invalid.argmax()])
+
+        standard = np.array([converter.standardize_prefix(prefix) for prefix in prefixes], dtype=object)
+        unknown = pd.isnull(standard)
+        if unknown.any():
+            counts = np.bincount(codes, minlength=len(prefixes))
+            unknown_codes = np.flatnonzero(unknown)
+            raise UnknownPrefixError(
+                column,
+                {prefixes[code]: int(counts[code]) for code in unknown_codes},
+                {prefixes[code]: values[(codes == code).argmax()] for code in unknown_codes},
+            )
+
+        rows = np.flatnonzero((standard != prefixes)[codes])
+        result = values.copy() if len(rows) else values
+        if len(rows):
+            # the local identifiers are only materialized for the CURIEs being rebuilt
+            result[rows] = standard[codes[rows]] + delimiter + _take(identifiers, rows)
+        df[target_column] = pd.Series(result, index=df.index, dtype=object)
+        changed[column] = len(rows)
+    return changed
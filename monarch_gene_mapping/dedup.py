@@ -0,0 +1,122 @@
+"""
+Deduplication of mappings on integer codes of their terms.
+
+Each compared column is turned into integer codes once: the codes of a categorical column as they are, strings being
+dictionary encoded by Arrow when the optional pyarrow package is installed (in about half the time pandas takes to
+factorize them), other values being factorized by pandas. The codes of the columns are combined into one int64 key
+per mapping, and duplicates are found on those keys.
+
+generate_gene_mappings deduplicates the concatenated mappings of every source in a single pass over their
+(subject_id, predicate_id, object_id) triples, keeping a triple for the first mapping of the specification which
+generated it: mappings.yaml lists the mappings in the order of preference of their sources (naming authorities, then
+the source of the identifier, then third parties).
+"""
+
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from pandas.core.frame import DataFrame
+from pandas.core.series import Series
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:  # pragma: no cover - exercised only without pyarrow
+    pa = None
+    pc = None
+
+from monarch_gene_mapping.validation import TRIPLE_COLUMNS
+
+# Bound of the combined keys, compacted (factorized) before a column would make them overflow int64
+KEY_BOUND: int = 2**62
+
+
+def _strings(values: Series):
+    """
+    :param values: Series
+    :return: pyarrow string array of the values, None without pyarrow or if they are not all strings (or missing)
+    """
+    if pc is None or not (values.dtype == object or isinstance(values.dtype, pd.StringDtype)):
+        return None
+    try:
+        return pa.array(np.asarray(values.array, dtype=object), type=pa.string(), from_pandas=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # i.e. numbers and strings mixed in an object column
+        return None
+
+
+def term_codes(values: Series) -> Tuple[np.ndarray, int]:
+    """
+    :param values: Series of terms
+    :return: Tuple of the int64 code of each term (missing values sharing code 0) and of the number of codes
+    """
+    strings = _strings(values)
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        codes, count = values.cat.codes.to_numpy(), len(values.cat.categories)
+    elif strings is not None:
+        encoded = pc.dictionary_encode(strings)
+        codes, count = pc.fill_null(encoded.indices, -1).to_numpy(), len(encoded.dictionary)
+    else:
+        codes, uniques = pd.factorize(values)
+        count = len(uniques)
+    # missing values are coded -1
+    return codes.astype(np.int64) + 1, count + 1
+
+
+def mapping_keys(mappings: DataFrame, columns: Optional[Sequence[str]] = None) -> np.ndarray:
+    """
+    :param mappings: DataFrame of mappings
+    :param columns: Columns to compare (default: all)
+    :return: int64 key of each mapping, equal for the mappings whose values are equal in every column
+    """
+    keys = np.zeros(len(mappings), dtype=np.int64)
+    size = 1
+    for column in mappings.columns if columns is None else columns:
+        codes, count = term_codes(mappings[column])
+        if size * count >= KEY_BOUND:
+            keys, uniques = pd.factorize(keys)
+            size = len(uniques)
+        keys = keys * count + codes
+        size *= count
+    return keys
+
+
+def duplicated_mappings(mappings: DataFrame, columns: Optional[Sequence[str]] = None) -> np.ndarray:
+    """
+    :param mappings: DataFrame of mappings
+    :param columns: Columns to compare (default: all)
+    :return: Boolean array, True for the mappings equal to an earlier one, as DataFrame.duplicated()
+    """
+    return pd.Index(mapping_keys(mappings, columns)).duplicated()
+
+
+def drop_duplicate_mappings(mappings: DataFrame, columns: Optional[Sequence[str]] = None) -> DataFrame:
+    """
+    Drop duplicate mappings, keeping the first one, as DataFrame.drop_duplicates()
+    :param mappings: DataFrame of mappings
+    :param columns: Columns to compare (default: all)
+    :return: DataFrame of the distinct mappings
+    """
+    return mappings.take(np.flatnonzero(~duplicated_mappings(mappings, columns)))
+
+
+def deduplicate_sources(
+    mappings: DataFrame, names: List[str], lengths: List[int], columns: Sequence[str] = TRIPLE_COLUMNS
+) -> Tuple[DataFrame, Dict[str, int]]:
+    """
+    Drop the mappings generated by several mappings of the specification, in a single pass over their concatenation
+    :param mappings: Concatenated DataFrames of mappings, in their order of preference
+    :param names: Name of each mapping concatenated
+    :param lengths: Number of rows of each mapping concatenated
+    :param columns: Columns identifying a mapping
+    :return: Tuple of the DataFrame of the mappings kept (for the first mapping generating them), and of the number
+             of duplicates removed from each mapping
+    """
+    duplicated = duplicated_mappings(mappings, columns)
+    origins = np.repeat(np.arange(len(names)), lengths)
+    removed = np.bincount(origins[duplicated], minlength=len(names))
+    counts = {name: int(count) for name, count in zip(names, removed)}
+    if not duplicated.any():
+        return mappings, counts
+    return mappings.take(np.flatnonzero(~duplicated)), counts
@@ -0,0 +1,12 @@
+"""
+Default settings shared by the command line and the modules implementing it.
+
+Kept free of heavy imports (pandas, pyarrow, prefixmaps...), so that the command line can build its options
+without importing the modules they are meant for, which are imported by each command when it runs.
+"""
+
+DEFAULT_CACHE_DIRECTORY: str = "data/cache"
+DEFAULT_BENCHMARK_DIRECTORY: str = "data/bench"
+DEFAULT_TOLERANCE: float = 0.2
+# Number of source files downloaded concurrently
+DEFAULT_DOWNLOAD_JOBS: int = 4
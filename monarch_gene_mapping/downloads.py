@@ -0,0 +1,460 @@
+"""
+Concurrent, resumable downloads of the source files listed in download.yaml.
+
+Every file is fetched in its own thread (standard library only), written to a '.part' file next to its destination
+and moved in place once complete. A state file ('.download.json') records the URL, ETag, Last-Modified date, size and
+SHA-256 checksum of each file, so that a later run:
+
+- skips a file the server answers a conditional GET (If-None-Match / If-Modified-Since) for with 304 Not Modified;
+- resumes an interrupted transfer from the end of its '.part' file with an HTTP Range request, guarded by If-Range
+  so that a file which changed on the server is downloaded again from its start.
+
+A transfer cut short is resumed the same way (up to RETRIES times). Once complete, the size of a file is checked
+against the size announced by the server, and its checksum against the one given in download.yaml (an optional
+'sha256' key of an entry), a file failing either check being discarded.
+
+A file being downloaded can be read while it is in flight (see Downloads.stream()), i.e. by the UniProt prefilter,
+reads waiting for the bytes not written yet.
+"""
+
+import hashlib
+import http.client
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+import yaml
+
+from monarch_gene_mapping.defaults import DEFAULT_DOWNLOAD_JOBS
+
+DEFAULT_DOWNLOAD_YAML: str = str(Path(__file__).parent / "download.yaml")
+BLOCK_SIZE: int = 1024 * 1024
+# Attempts at resuming a transfer cut short, or failing with a server error
+RETRIES: int = 3
+RETRY_DELAY: float = 1.0
+# Seconds without a byte received before a transfer is considered cut short
+TIMEOUT: float = 60.0
+
+PART_SUFFIX: str = ".part"
+STATE_SUFFIX: str = ".download.json"
+
+
+class DownloadError(Exception):
+    """
+    Download which can't be completed, or whose file fails verification
+    """
+
+
+@dataclass
+class DownloadEntry:
+    """
+    A file to download, as listed in download.yaml
+    """
+
+    url: str
+    local_name: str
+    tag: Optional[str] = None
+    # expected SHA-256 checksum of the file, if known
+    sha256: Optional[str] = None
+
+    @property
+    def name(self) -> str:
+        return self.tag or self.local_name
+
+
+def load_download_entries(path: str = DEFAULT_DOWNLOAD_YAML, tags: Optional[List[str]] = None) -> List[DownloadEntry]:
+    """
+    :param path: Path of the YAML list of files to download
+    :param tags: Tags of the files to download (default: all)
+    :return: List of DownloadEntry
+    """
+    with open(path) as download_file:
+        entries = [DownloadEntry(**entry) for entry in yaml.safe_load(download_file) or []]
+    if tags:
+        unknown = set(tags) - {entry.tag for entry in entries}
+        if unknown:
+            raise ValueError(
+                f"Unknown download tag(s) {', '.join(sorted(unknown))}, "
+                f"expected one of {', '.join(entry.name for entry in entries)}"
+            )
+        entries = [entry for entry in entries if entry.tag in tags]
+    return entries
+
+
+class Transfer:
+    """
+    Progress of a download, shared with the readers streaming its file
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        # file being written, set once it can be read from its start
+        self.path: Optional[Path] = None
+        self.written = 0
+        self.finished = False
+        self.error: Optional[BaseException] = None
+
+    def begin(self, path: Path, written: int):
+        """
+        :param path: Path of the file being written
+        :param written: Number of bytes already in the file
+        """
+        with self.condition:
+            self.path, self.written = path, written
+            self.condition.notify_all()
+
+    def advance(self, size: int):
+        """
+        :param size: Number of bytes written (and flushed) to the file
+        """
+        with self.condition:
+            self.written += size
+            self.condition.notify_all()
+
+    def complete(self, part_path: Path, path: Path):
+        """
+        Move the complete file in place, the readers having it open reading on
+        """
+        with self.condition:
+            os.replace(part_path, path)
+            self.path = path
+            self.finished = True
+            self.condition.notify_all()
+
+    def finish(self, error: Optional[BaseException] = None):
+        """
+        Mark the download as finished without a transfer (i.e. the file is unchanged), or as failed
+        """
+        with self.condition:
+            self.finished = True
+            self.error = error
+            self.condition.notify_all()
+
+    def reader(self) -> Optional["TransferReader"]:
+        """
+        Wait for the transfer to start
+        :return: Binary file object reading the file as it is written, None if no file is transferred
+        :raises DownloadError: if the download failed
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: self.path is not None or self.finished)
+            if self.error is not None:
+                raise DownloadError(f"Download failed: {self.error}") from self.error
+            if self.path is None:
+                return None
+            return TransferReader(self, open(self.path, "rb"))
+
+
+class TransferReader:
+    """
+    Read-only binary file object over a file being downloaded, waiting for the bytes not written yet
+    """
+
+    def __init__(self, transfer: Transfer, file):
+        self.transfer = transfer
+        self.file = file
+        self.position = 0
+        self.mode = "rb"
+
+    def read(self, size: int = -1) -> bytes:
+        transfer = self.transfer
+        with transfer.condition:
+            transfer.condition.wait_for(lambda: transfer.written > self.position or transfer.finished)
+            if transfer.error is not None:
+                raise DownloadError(f"Download failed: {transfer.error}") from transfer.error
+            available = transfer.written - self.position
+        data = self.file.read(available if size < 0 else min(size, available))
+        self.position += len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def _read_state(path: Path) -> Dict[str, Any]:
+    if not path.exists():
+        return {}
+    with open(path) as state_file:
+        return json.load(state_file)
+
+
+def _write_state(path: Path, state: Dict[str, Any]):
+    temporary_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(temporary_path, "w") as state_file:
+        json.dump(state, state_file, indent=2)
+    os.replace(temporary_path, path)
+
+
+def _content_range(value: Optional[str]) -> Tuple[int, Optional[int]]:
+    """
+    :param value: Content-Range header, i.e. 'bytes 100-199/1000'
+    :return: Tuple of the first byte position and of the total size (None if unknown)
+    """
+    try:
+        _, spec = value.split(" ", 1)
+        positions, total = spec.split("/", 1)
+        return int(positions.split("-", 1)[0]), None if total == "*" else int(total)
+    except (AttributeError, ValueError):
+        raise DownloadError(f"Invalid Content-Range '{value}'")
+
+
+def download_file(
+    entry: DownloadEntry,
+    directory: str = ".",
+    transfer: Optional[Transfer] = None,
+    force: bool = False,
+    retries: int = RETRIES,
+    timeout: float = TIMEOUT,
+) -> Dict[str, Any]:
+    """
+    Download a file, unless the server says it is unchanged, resuming a previous partial transfer
+    :param entry: File to download
+    :param directory: Directory the local name of the file is relative to
+    :param transfer: Transfer to report progress to, for streaming readers
+    :param force: Download the whole file, even if it is unchanged or partially downloaded
+    :param retries: Number of attempts at resuming a transfer cut short
+    :param timeout: Seconds without a byte received before a transfer is considered cut short
+    :return: Description of the download: its name, path, status (unchanged, downloaded or resumed), the number of
+             bytes transferred, the size and SHA-256 checksum of the file, and the seconds it took
+    :raises DownloadError: if the file can't be downloaded, or fails verification
+    """
+    transfer = transfer if transfer is not None else Transfer()
+    try:
+        return _download_file(entry, Path(directory) / entry.local_name, transfer, force, retries, timeout)
+    except BaseException as error:
+        transfer.finish(error)
+        raise
+
+
+def _download_file(
+    entry: DownloadEntry, path: Path, transfer: Transfer, force: bool, retries: int, timeout: float
+) -> Dict[str, Any]:
+    start = time.perf_counter()
+    part_path = path.with_name(path.name + PART_SUFFIX)
+    state_path = path.with_name(path.name + STATE_SUFFIX)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    state = {} if force else _read_state(state_path)
+    if state.get("url") != entry.url:
+        state = {}
+
+    headers: Dict[str, str] = {}
+    offset = 0
+    complete = state.get("completed") and path.exists() and path.stat().st_size == state.get("size")
+    if complete:
+        if state.get("etag"):
+            headers["If-None-Match"] = state["etag"]
+        if state.get("last_modified"):
+            headers["If-Modified-Since"] = state["last_modified"]
+    elif part_path.exists() and (state.get("etag") or state.get("last_modified")):
+        offset = part_path.stat().st_size
+
+    resumed = offset > 0
+    validators: Optional[Tuple[Optional[str], Optional[str]]] = None
+    total: Optional[int] = None
+    transferred = 0
+    digest = hashlib.sha256()
+    attempt = 0
+    while True:
+        request_headers = dict(headers)
+        if offset:
+            request_headers["Range"] = f"bytes={offset}-"
+            # the server sends the whole file instead if it changed since the transfer started
+            etag, last_modified = validators or (state.get("etag"), state.get("last_modified"))
+            request_headers["If-Range"] = etag or last_modified
+        try:
+            response = urlopen(Request(entry.url, headers=request_headers), timeout=timeout)
+        except HTTPError as error:
+            if error.code == 304:
+                transfer.finish()
+                print(f"{entry.name}: {path} is unchanged")
+                return {
+                    "name": entry.name,
+                    "path": str(path),
+                    "status": "unchanged",
+                    "bytes": 0,
+                    "size": state["size"],
+                    "sha256": state.get("sha256"),
+                    "seconds": round(time.perf_counter() - start, 3),
+                }
+            if error.code == 416 and offset and transfer.path is None:
+                # the partial file isn't a prefix of the file on the server
+                part_path.unlink()
+                offset, resumed = 0, False
+                continue
+            if error.code < 500 or attempt >= retries:
+                raise DownloadError(f"Could not download {entry.url}: HTTP {error.code} {error.reason}")
+            attempt += 1
+            time.sleep(RETRY_DELAY)
+            continue
+        except OSError as error:
+            if attempt >= retries:
+                raise DownloadError(f"Could not download {entry.url}: {error}")
+            attempt += 1
+            time.sleep(RETRY_DELAY)
+            continue
+
+        with response:
+            response_validators = (response.headers.get("ETag"), response.headers.get("Last-Modified"))
+            if validators is None:
+                validators = response_validators
+                # the file changed (or is downloaded for the first time), the next requests resume its transfer
+                headers = {}
+                state = {
+                    "url": entry.url,
+                    "etag": validators[0],
+                    "last_modified": validators[1],
+                    "completed": False,
+                }
+                _write_state(state_path, state)
+            elif response_validators != validators:
+                raise DownloadError(f"{entry.url} changed on the server while it was being downloaded")
+
+            skip = 0
+            if response.status == 206:
+                first, total = _content_range(response.headers.get("Content-Range"))
+                if first != offset:
+                    raise DownloadError(f"{entry.url} was sent from byte {first}, expected {offset}")
+            else:
+                length = response.headers.get("Content-Length")
+                total = int(length) if length is not None else None
+                if transfer.path is not None:
+                    # the transfer being streamed, the bytes already written are skipped rather than written again
+                    skip = offset
+                else:
+                    offset, resumed = 0, False
+
+            if transfer.path is None:
+                if offset:
+                    with open(part_path, "rb") as part_file:
+                        for block in iter(lambda: part_file.read(BLOCK_SIZE), b""):
+                            digest.update(block)
+                else:
+                    part_path.write_bytes(b"")
+                transfer.begin(part_path, offset)
+                print(f"{entry.name}: {f'resuming {entry.url} from byte {offset}' if resumed else entry.url}")
+
+            try:
+                with open(part_path, "ab", buffering=0) as part_file:
+                    while skip:
+                        skipped = len(response.read(min(skip, BLOCK_SIZE)))
+                        if not skipped:
+                            break
+                        skip -= skipped
+                    # read1 returns the bytes received so far, for streaming readers to follow the transfer closely
+                    for block in iter(lambda: response.read1(BLOCK_SIZE), b""):
+                        part_file.write(block)
+                        digest.update(block)
+                        offset += len(block)
+                        transferred += len(block)
+                        transfer.advance(len(block))
+                    if total is not None and offset < total:
+                        raise http.client.IncompleteRead(b"", total - offset)
+            except (OSError, http.client.HTTPException) as error:
+                if attempt >= retries:
+                    raise DownloadError(f"Could not download {entry.url}: {error}")
+                attempt += 1
+                print(f"{entry.name}: transfer cut short at byte {offset} ({error}), resuming")
+                time.sleep(RETRY_DELAY)
+                continue
+        break
+
+    if total is not None and offset != total:
+        raise DownloadError(f"{entry.url}: received {offset} bytes, expected {total}")
+    checksum = digest.hexdigest()
+    if entry.sha256 is not None and checksum != entry.sha256.lower():
+        part_path.unlink()
+        raise DownloadError(f"{entry.url}: SHA-256 checksum {checksum}, expected {entry.sha256}")
+
+    state.update(size=offset, sha256=checksum, completed=datetime.now().isoformat(timespec="seconds"))
+    _write_state(state_path, state)
+    transfer.complete(part_path, path)
+    seconds = time.perf_counter() - start
+    print(f"{entry.name}: {path} {'resumed' if resumed else 'downloaded'}, {transferred} bytes in {seconds:.1f}s")
+    return {
+        "name": entry.name,
+        "path": str(path),
+        "status": "resumed" if resumed else "downloaded",
+        "bytes": transferred,
+        "size": offset,
+        "sha256": checksum,
+        "seconds": round(seconds, 3),
+    }
+
+
+class Downloads:
+    """
+    Files downloaded concurrently, in worker threads started on entering the context
+    """
+
+    def __init__(
+        self, entries: List[DownloadEntry], directory: str = ".", jobs: int = DEFAULT_DOWNLOAD_JOBS, force: bool = False
+    ):
+        """
+        :param entries: Files to download
+        :param directory: Directory the local names of the files are relative to
+        :param jobs: Number of files downloaded concurrently
+        :param force: Download the whole files, even if they are unchanged or partially downloaded
+        """
+        self.entries = entries
+        self.directory = directory
+        self.jobs = max(jobs, 1)
+        self.force = force
+        self.transfers: Dict[str, Transfer] = {entry.name: Transfer() for entry in entries}
+        self.executor: Optional[ThreadPoolExecutor] = None
+        self.futures: List[Future] = []
+
+    def __enter__(self) -> "Downloads":
+        self.executor = ThreadPoolExecutor(self.jobs, thread_name_prefix="download")
+        self.futures = [
+            self.executor.submit(download_file, entry, self.directory, self.transfers[entry.name], self.force)
+            for entry in self.entries
+        ]
+        return self
+
+    def __exit__(self, *exc_info):
+        self.executor.shutdown(wait=True)
+
+    def stream(self, name: str) -> Optional[TransferReader]:
+        """
+        :param name: Tag (or local name) of a file
+        :return: Binary file object reading the file as it is downloaded, None if the file is unchanged
+        :raises DownloadError: if the download failed
+        """
+        return self.transfers[name].reader()
+
+    def wait(self) -> List[Dict[str, Any]]:
+        """
+        :return: Descriptions of the downloads, see download_file()
+        :raises DownloadError: if a download failed, once they are all finished
+        """
+        for future in self.futures:
+            future.exception()
+        return [future.result() for future in self.futures]
+
+
+def download_files(
+    path: str = DEFAULT_DOWNLOAD_YAML,
+    directory: str = ".",
+    jobs: int = DEFAULT_DOWNLOAD_JOBS,
+    force: bool = False,
+    tags: Optional[List[str]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Download the files listed in a YAML file concurrently
+    :param path: Path of the YAML list of files to download
+    :param directory: Directory the local names of the files are relative to
+    :param jobs: Number of files downloaded concurrently
+    :param force: Download the whole files, even if they are unchanged or partially downloaded
+    :param tags: Tags of the files to download (default: all)
+    :return: Descriptions of the downloads, see download_file()
+    """
+    with Downloads(load_download_entries(path, tags), directory, jobs, force) as downloads:
+        return downloads.wait()
@@ -0,0 +1,379 @@
+"""
+In-memory lookup index of the generated gene mappings, resolving any mapped CURIE to its preferred gene identifier.
+
+The distinct CURIEs of the mappings are interned once: they are ordered by their 64-bit hash (pd.util.hash_array),
+so that the position of a CURIE is found by a binary search of its hash, and their UTF-8 text is stored as a single
+byte buffer with the offsets of each CURIE. The mappings themselves are arrays of CURIE positions and predicate codes,
+with CSR style adjacency lists in both directions (subject to objects and object to subjects).
+
+A CURIE resolves to the best ranked of itself and the CURIEs it is directly mapped to, following the strategy of the
+README: a gene naming authority (HGNC, the Model Organism Databases) first, then NCBIGene, then third party sources,
+ties going to the CURIE itself and then to the mapping coming first in the mappings (i.e. in mappings.yaml order).
+The resolution of every CURIE is computed when the index is built, so resolve_many() is a hash lookup and a gather.
+
+The index is saved as a directory of .npy arrays and a JSON description, and loaded memory-mapped.
+"""
+
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+from pandas.core.frame import DataFrame
+from pandas.core.series import Series
+
+try:
+    import pyarrow as pa
+except ImportError:  # pragma: no cover - exercised only without pyarrow
+    pa = None
+
+from monarch_gene_mapping.curie_utils import split_curies
+
+# Prefixes of the gene naming authorities, preferred over NCBIGene, itself preferred over any other prefix
+NAMING_AUTHORITIES: List[str] = [
+    "HGNC",
+    "MGI",
+    "RGD",
+    "FB",
+    "WB",
+    "ZFIN",
+    "Xenbase",
+    "dictyBase",
+    "PomBase",
+    "SGD",
+]
+FALLBACK_PREFIX: str = "NCBIGene"
+
+INDEX_FORMAT: int = 1
+DESCRIPTION_FILENAME: str = "index.json"
+ARRAYS: List[str] = [
+    "hashes",
+    "offsets",
+    "text",
+    "ranks",
+    "resolved",
+    "subjects",
+    "objects",
+    "predicates",
+    "out_indptr",
+    "out_edges",
+    "in_indptr",
+    "in_edges",
+]
+
+
+def prefix_ranks(curies: np.ndarray, authorities: Sequence[str] = NAMING_AUTHORITIES) -> np.ndarray:
+    """
+    :param curies: Object array of CURIEs
+    :param authorities: Prefixes of the gene naming authorities
+    :return: int8 array of the preference rank of each CURIE: 0 for a naming authority, 1 for NCBIGene, 2 otherwise
+    """
+    prefixes, codes, _, invalid = split_curies(curies)
+    prefix_rank = np.array(
+        [0 if prefix in authorities else 1 if prefix == FALLBACK_PREFIX else 2 for prefix in prefixes], dtype=np.int8
+    )
+    ranks = prefix_rank[codes] if len(prefixes) else np.full(len(curies), 2, dtype=np.int8)
+    ranks[invalid] = 2
+    return ranks
+
+
+def _adjacency(sources: np.ndarray, size: int):
+    """
+    :param sources: Source CURIE position of each mapping
+    :param size: Number of CURIEs
+    :return: Tuple of the index pointer (of size + 1 offsets) and of the mappings of each source, in mapping order
+    """
+    edges = np.argsort(sources, kind="stable").astype(np.int32)
+    indptr = np.zeros(size + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=size), out=indptr[1:])
+    return indptr, edges
+
+
+def _resolution(ranks: np.ndarray, subjects: np.ndarray, objects: np.ndarray) -> np.ndarray:
+    """
+    :param ranks: Preference rank of each CURIE
+    :param subjects: Subject CURIE position of each mapping
+    :param objects: Object CURIE position of each mapping
+    :return: int32 array of the position of the best ranked of each CURIE and of the CURIEs it is mapped to
+    """
+    size = len(ranks)
+    positions = np.arange(size, dtype=np.int32)
+    sources = np.concatenate([positions, subjects, objects])
+    candidates = np.concatenate([positions, objects, subjects])
+    # the CURIE itself first, then the mappings in their order
+    order = np.concatenate([np.full(size, -1), np.arange(len(subjects)), np.arange(len(subjects))])
+    best = np.lexsort((order, ranks[candidates], sources))
+    # every CURIE is a source of its own, the first candidate of each source is its resolution
+    first = np.flatnonzero(np.diff(sources[best], prepend=-1))
+    return candidates[best[first]].astype(np.int32)
+
+
+class GeneMappingIndex:
+    """
+    Compact, memory-mappable index of gene mappings, see the module documentation
+    """
+
+    def __init__(self, arrays: Dict[str, np.ndarray], predicate_ids: List[str], authorities: List[str]):
+        """
+        :param arrays: Arrays of the index, see ARRAYS
+        :param predicate_ids: Predicate of each predicate code
+        :param authorities: Prefixes of the gene naming authorities the index was ranked with
+        """
+        self.arrays = arrays
+        self.predicate_ids = predicate_ids
+        self.authorities = authorities
+        self._resolutions: Dict[FrozenSet[int], np.ndarray] = {}
+        self._terms = None
+
+    def __len__(self) -> int:
+        """
+        :return: Number of mappings
+        """
+        return len(self.arrays["subjects"])
+
+    @property
+    def size(self) -> int:
+        """
+        :return: Number of distinct CURIEs
+        """
+        return len(self.arrays["hashes"])
+
+    @classmethod
+    def from_mappings(cls, mappings: DataFrame, authorities: Sequence[str] = NAMING_AUTHORITIES) -> "GeneMappingIndex":
+        """
+        Build the index of mappings, i.e. of the DataFrame returned by generate_gene_mappings()
+        :param mappings: DataFrame of mappings, with subject_id, predicate_id and object_id columns, in preference order
+        :param authorities: Prefixes of the gene naming authorities
+        :return: GeneMappingIndex
+        """
+        subject_ids = np.asarray(mappings["subject_id"], dtype=object)
+        object_ids = np.asarray(mappings["object_id"], dtype=object)
+        codes, curies = pd.factorize(np.concatenate([subject_ids, object_ids]))
+        if (codes < 0).any():
+            raise ValueError("Missing subject_id or object_id in the mappings")
+        curies = np.asarray(curies, dtype=object)
+
+        hashes = pd.util.hash_array(curies)
+        order = np.argsort(hashes, kind="stable")
+        positions = np.empty(len(order), dtype=np.int32)
+        positions[order] = np.arange(len(order), dtype=np.int32)
+        curies, hashes, codes = curies[order], hashes[order], positions[codes]
+
+        encoded = [curie.encode("utf-8") for curie in curies]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(value) for value in encoded], out=offsets[1:])
+        text = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+        predicates, predicate_ids = pd.factorize(np.asarray(mappings["predicate_id"], dtype=object))
+        subjects, objects = codes[: len(mappings)], codes[len(mappings) :]
+        ranks = prefix_ranks(curies, authorities)
+        out_indptr, out_edges = _adjacency(subjects, len(curies))
+        in_indptr, in_edges = _adjacency(objects, len(curies))
+        arrays = {
+            "hashes": hashes,
+            "offsets": offsets,
+            "text": text,
+            "ranks": ranks,
+            "resolved": _resolution(ranks, subjects, objects),
+            "subjects": subjects,
+            "objects": objects,
+            "predicates": predicates.astype(np.int8),
+            "out_indptr": out_indptr,
+            "out_edges": out_edges,
+            "in_indptr": in_indptr,
+            "in_edges": in_edges,
+        }
+        return cls(arrays, [str(predicate_id) for predicate_id in predicate_ids], list(authorities))
+
+    @classmethod
+    def from_sssom(cls, path: str, authorities: Sequence[str] = NAMING_AUTHORITIES) -> "GeneMappingIndex":
+        """
+        Build the index of a mapping file saved by 'generate'
+        :param path: Path of an SSSOM TSV file (optionally compressed), or of a .parquet or .arrow file
+        :param authorities: Prefixes of the gene naming authorities
+        :return: GeneMappingIndex
+        """
+        columns = ["subject_id", "predicate_id", "object_id"]
+        if path.endswith(".parquet"):
+            mappings = pd.read_parquet(path, columns=columns)
+        elif path.endswith(".arrow"):
+            if pa is None:
+                raise ValueError("Reading Arrow IPC files requires pyarrow, please install it first")
+            with pa.memory_map(path) as source:
+                mappings = pa.ipc.open_file(source).read_all().select(columns).to_pandas()
+        else:
+            mappings = pd.read_csv(path, sep="\t", comment="#", usecols=columns, dtype=str)
+        return cls.from_mappings(mappings, authorities)
+
+    @classmethod
+    def generate(cls, authorities: Sequence[str] = NAMING_AUTHORITIES, **kwargs: Any) -> "GeneMappingIndex":
+        """
+        Generate the gene mappings and build their index
+        :param authorities: Prefixes of the gene naming authorities
+        :param kwargs: Keyword arguments of generate_gene_mappings()
+        :return: GeneMappingIndex
+        """
+        from monarch_gene_mapping.cli_utils import generate_gene_mappings
+
+        return cls.from_mappings(generate_gene_mappings(**kwargs), authorities)
+
+    def save(self, path: str):
+        """
+        Save the index as a directory of .npy arrays, replacing it
+        :param path: Path of the index directory
+        """
+        temporary_path = Path(f"{path}.{os.getpid()}.tmp")
+        shutil.rmtree(temporary_path, ignore_errors=True)
+        temporary_path.mkdir(parents=True)
+        try:
+            for name in ARRAYS:
+                np.save(temporary_path / f"{name}.npy", self.arrays[name])
+            description = {
+                "format": INDEX_FORMAT,
+                "mappings": len(self),
+                "curies": self.size,
+                "predicate_ids": self.predicate_ids,
+                "authorities": self.authorities,
+            }
+            with open(temporary_path / DESCRIPTION_FILENAME, "w") as description_file:
+                json.dump(description, description_file, indent=2)
+            previous_path = Path(f"{path}.{os.getpid()}.old")
+            if Path(path).exists():
+                os.replace(path, previous_path)
+            os.replace(temporary_path, path)
+            shutil.rmtree(previous_path, ignore_errors=True)
+        finally:
+            shutil.rmtree(temporary_path, ignore_errors=True)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "GeneMappingIndex":
+        """
+        :param path: Path of an index directory saved by save()
+        :param mmap: Memory-map the arrays instead of reading them
+        :return: GeneMappingIndex
+        """
+        with open(Path(path) / DESCRIPTION_FILENAME) as description_file:
+            description = json.load(description_file)
+        if description.get("format") != INDEX_FORMAT:
+            raise ValueError(f"Unsupported gene mapping index format {description.get('format')} in {path}")
+        arrays = {name: np.load(Path(path) / f"{name}.npy", mmap_mode="r" if mmap else None) for name in ARRAYS}
+        return cls(arrays, description["predicate_ids"], description["authorities"])
+
+    def curie(self, position: int) -> str:
+        """
+        :param position: Position of a CURIE in the index
+        :return: CURIE
+        """
+        offsets = self.arrays["offsets"]
+        return self.arrays["text"][offsets[position] : offsets[position + 1]].tobytes().decode("utf-8")
+
+    def curies(self, positions: np.ndarray) -> np.ndarray:
+        """
+        :param positions: Positions of CURIEs in the index
+        :return: Object array of the CURIEs
+        """
+        if pa is None:
+            return np.array([self.curie(position) for position in positions], dtype=object)
+        if self._terms is None:
+            # zero copy view of the CURIE text
+            offsets, text = self.arrays["offsets"], self.arrays["text"]
+            self._terms = pa.LargeStringArray.from_buffers(self.size, pa.py_buffer(offsets), pa.py_buffer(text))
+        return self._terms.take(pa.array(positions, type=pa.int64())).to_numpy(zero_copy_only=False)
+
+    def positions(self, curies: np.ndarray) -> np.ndarray:
+        """
+        :param curies: Object array of distinct CURIEs
+        :return: int64 array of the position of each CURIE in the index, -1 for the CURIEs which are not
+        """
+        hashes = self.arrays["hashes"]
+        if not len(curies) or not len(hashes):
+            return np.full(len(curies), -1, dtype=np.int64)
+        query = pd.util.hash_array(curies)
+        positions = np.searchsorted(hashes, query)
+        found = hashes[np.minimum(positions, len(hashes) - 1)] == query
+        # compare the CURIEs themselves, moving on to the next CURIE of the same hash on a (rare) collision
+        unchecked = np.flatnonzero(found)
+        while len(unchecked):
+            mismatched = unchecked[self.curies(positions[unchecked]) != curies[unchecked]]
+            positions[mismatched] += 1
+            same_hash = positions[mismatched] < len(hashes)
+            same_hash[same_hash] = hashes[positions[mismatched[same_hash]]] == query[mismatched[same_hash]]
+            found[mismatched[~same_hash]] = False
+            unchecked = mismatched[same_hash]
+        return np.where(found, positions, -1)
+
+    def _resolved(self, predicate_ids: Optional[Iterable[str]]) -> np.ndarray:
+        """
+        :param predicate_ids: Predicates of the mappings to follow (default: all)
+        :return: Resolution of every CURIE of the index, following only the mappings of the predicates
+        """
+        if predicate_ids is None:
+            return self.arrays["resolved"]
+        codes = frozenset(self.predicate_ids.index(value) for value in predicate_ids if value in self.predicate_ids)
+        if codes == frozenset(range(len(self.predicate_ids))):
+            return self.arrays["resolved"]
+        if codes not in self._resolutions:
+            followed = np.isin(self.arrays["predicates"], list(codes))
+            self._resolutions[codes] = _resolution(
+                self.arrays["ranks"], self.arrays["subjects"][followed], self.arrays["objects"][followed]
+            )
+        return self._resolutions[codes]
+
+    def resolve_many(
+        self, curies: Union[Series, Iterable[Optional[str]]], predicate_ids: Optional[Iterable[str]] = None
+    ) -> Series:
+        """
+        Resolve CURIEs to their preferred gene identifier
+        :param curies: Series (or iterable) of CURIEs
+        :param predicate_ids: Predicates of the mappings to follow (default: all)
+        :return: Series of the preferred identifier of each CURIE (with the index of the CURIEs, if a Series),
+                 None for the CURIEs which are not in the index
+        """
+        if not isinstance(curies, Series):
+            curies = Series(list(curies), dtype=object)
+        codes, distinct = pd.factorize(np.asarray(curies, dtype=object))
+        positions = self.positions(np.asarray(distinct, dtype=object))
+        found = positions >= 0
+        resolved = np.full(len(distinct) + 1, None, dtype=object)
+        resolved[:-1][found] = self.curies(self._resolved(predicate_ids)[positions[found]])
+        # the missing values (code -1) resolve to the trailing None
+        return Series(resolved[codes], index=curies.index, dtype=object, name=curies.name)
+
+    def resolve(self, curie: str, predicate_ids: Optional[Iterable[str]] = None) -> Optional[str]:
+        """
+        :param curie: CURIE
+        :param predicate_ids: Predicates of the mappings to follow (default: all)
+        :return: Preferred gene identifier of the CURIE, None if it is not in the index
+        """
+        return self.resolve_many([curie], predicate_ids).iloc[0]
+
+    def _mapped(self, curie: str, direction: str, predicate_ids: Optional[Iterable[str]]) -> List[str]:
+        position = self.positions(np.array([curie], dtype=object))[0]
+        if position < 0:
+            return []
+        indptr, edges = self.arrays[f"{direction}_indptr"], self.arrays[f"{direction}_edges"]
+        mappings = edges[indptr[position] : indptr[position + 1]]
+        if predicate_ids is not None:
+            codes = [self.predicate_ids.index(value) for value in predicate_ids if value in self.predicate_ids]
+            mappings = mappings[np.isin(self.arrays["predicates"][mappings], codes)]
+        targets = self.arrays["objects" if direction == "out" else "subjects"][mappings]
+        return list(self.curies(targets))
+
+    def objects(self, curie: str, predicate_ids: Optional[Iterable[str]] = None) -> List[str]:
+        """
+        :param curie: Subject CURIE
+        :param predicate_ids: Predicates of the mappings to follow (default: all)
+        :return: Objects the subject is mapped to, in mapping order
+        """
+        return self._mapped(curie, "out", predicate_ids)
+
+    def subjects(self, curie: str, predicate_ids: Optional[Iterable[str]] = None) -> List[str]:
+        """
+        :param curie: Object CURIE
+        :param predicate_ids: Predicates of the mappings to follow (default: all)
+        :return: Subjects mapped to the object, in mapping order
+        """
+        return self._mapped(curie, "in", predicate_ids)
@@ -0,0 +1,250 @@
+"""
+Instrumentation of the pipeline stages: wall and CPU time, peak memory and row counts of each stage, together with
+the rows going in and out of each step of df_mappings, collected in a machine readable run report.
+
+Row counts are recorded against the stage (and mapping) running in the current context, so the mapping functions
+only call record_rows() and record_step(), which do nothing outside of an instrumented stage.
+"""
+
+import cProfile
+import json
+import platform
+import re
+import resource
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+PROFILERS: List[str] = ["cprofile", "pyinstrument"]
+
+
+def reset_peak_rss() -> bool:
+    """
+    Reset the peak resident set size of the process (Linux only)
+    :return: bool, True if the peak was reset, False if only the peak of the whole process lifetime is available
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as clear_refs:
+            clear_refs.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb() -> float:
+    """
+    :return: Peak resident set size of the process since the last reset_peak_rss(), in MB
+    """
+    try:
+        with open("/proc/self/status") as status:
+            return int(re.search(r"VmHWM:\s+(\d+) kB", status.read()).group(1)) / 1024
+    except (OSError, AttributeError):
+        # ru_maxrss is in kilobytes on Linux, in bytes on macOS
+        scale = 1024 * 1024 if platform.system() == "Darwin" else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+@dataclass
+class StageMetrics:
+    """
+    Measures of one pipeline stage
+    """
+
+    name: str
+    status: str = "running"
+    seconds: float = 0.0
+    cpu_seconds: float = 0.0
+    peak_rss_mb: Optional[float] = None
+    rows_in: int = 0
+    rows_out: int = 0
+    # rows in and out of each (mapping, step), summed over the chunks of the source
+    steps: Dict[Tuple[str, str], List[int]] = field(default_factory=dict)
+
+    def add_step(self, mapping: str, step: str, rows_in: int, rows_out: int):
+        counts = self.steps.setdefault((mapping, step), [0, 0])
+        counts[0] += rows_in
+        counts[1] += rows_out
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        :return: JSON serializable dictionary of the measures, with one entry per (mapping, step) under 'steps'
+        """
+        return {
+            "name": self.name,
+            "status": self.status,
+            "seconds": round(self.seconds, 4),
+            "cpu_seconds": round(self.cpu_seconds, 4),
+            "peak_rss_mb": None if self.peak_rss_mb is None else round(self.peak_rss_mb, 1),
+            "rows_in": self.rows_in,
+            "rows_out": self.rows_out,
+            "steps": [
+                {
+                    "mapping": mapping,
+                    "step": step,
+                    "rows_in": rows_in,
+                    "rows_out": rows_out,
+                    "rows_lost": rows_in - rows_out,
+                }
+                for (mapping, step), (rows_in, rows_out) in self.steps.items()
+            ],
+        }
+
+
+_current_stage: ContextVar[Optional[StageMetrics]] = ContextVar("current_stage", default=None)
+_current_mapping: ContextVar[str] = ContextVar("current_mapping", default="")
+
+
+@contextmanager
+def stage_metrics(name: str, exclusive: bool = True) -> Iterator[StageMetrics]:
+    """
+    Measure the code run in the context as one stage
+    :param name: Stage name
+    :param exclusive: The stage runs alone in its process, so that its peak memory can be told apart;
+                      otherwise the peak memory of the process is recorded
+    :return: StageMetrics, filled in when the context exits
+    """
+    metrics = StageMetrics(name)
+    if exclusive:
+        reset_peak_rss()
+    token = _current_stage.set(metrics)
+    start, cpu_start = time.perf_counter(), time.process_time()
+    try:
+        yield metrics
+        metrics.status = "ok"
+    except BaseException:
+        metrics.status = "failed"
+        raise
+    finally:
+        metrics.seconds = time.perf_counter() - start
+        metrics.cpu_seconds = time.process_time() - cpu_start
+        metrics.peak_rss_mb = peak_rss_mb()
+        _current_stage.reset(token)
+
+
+@contextmanager
+def mapping_context(name: str) -> Iterator[None]:
+    """
+    Record the steps run in the context against a mapping of the current stage
+    :param name: Mapping name
+    """
+    token = _current_mapping.set(name)
+    try:
+        yield
+    finally:
+        _current_mapping.reset(token)
+
+
+def record_rows(rows_in: int = 0, rows_out: int = 0):
+    """
+    Add to the rows in and out of the current stage, if any
+    """
+    metrics = _current_stage.get()
+    if metrics is not None:
+        metrics.rows_in += rows_in
+        metrics.rows_out += rows_out
+
+
+def record_step(step: str, rows_in: int, rows_out: int):
+    """
+    Add to the rows in and out of a step of the current mapping of the current stage, if any
+    """
+    metrics = _current_stage.get()
+    if metrics is not None:
+        metrics.add_step(_current_mapping.get(), step, rows_in, rows_out)
+
+
+def instrumented(name: str, function: Callable, *args, exclusive: bool = True, **kwargs) -> Tuple[Any, StageMetrics]:
+    """
+    Run a function as a measured stage, i.e. in a worker thread or process
+    :param name: Stage name
+    :param function: Function
+    :param exclusive: See stage_metrics()
+    :return: Tuple of the result of the function, and its StageMetrics
+    """
+    with stage_metrics(name, exclusive=exclusive) as metrics:
+        result = function(*args, **kwargs)
+    return result, metrics
+
+
+class RunReport:
+    """
+    Measures of the stages of a run, saved as JSON
+    """
+
+    def __init__(self, **details: Any):
+        self.started = datetime.now()
+        self.stages: List[StageMetrics] = []
+        self.details: Dict[str, Any] = dict(details)
+
+    @contextmanager
+    def stage(self, name: str, exclusive: bool = True) -> Iterator[StageMetrics]:
+        """
+        Measure the code run in the context as one stage of the run, see stage_metrics()
+        """
+        with stage_metrics(name, exclusive=exclusive) as metrics:
+            try:
+                yield metrics
+            finally:
+                self.stages.append(metrics)
+
+    def add(self, metrics: StageMetrics):
+        """
+        Add the measures of a stage run elsewhere, i.e. see instrumented()
+        """
+        self.stages.append(metrics)
+
+    def to_dict(self) -> Dict[str, Any]:
+        finished = datetime.now()
+        failed = [metrics.name for metrics in self.stages if metrics.status != "ok"]
+        return {
+            "started": self.started.isoformat(timespec="seconds"),
+            "finished": finished.isoformat(timespec="seconds"),
+            "status": "failed" if failed else "ok",
+            "seconds": round((finished - self.started).total_seconds(), 3),
+            "stages": [metrics.to_dict() for metrics in self.stages],
+            **self.details,
+        }
+
+    def save(self, path: str):
+        """
+        :param path: Path of the JSON run report
+        """
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w") as report_file:
+            json.dump(self.to_dict(), report_file, indent=2, default=str)
+
+
+@contextmanager
+def profiling(path: Optional[str], profiler: str = "cprofile") -> Iterator[None]:
+    """
+    Profile the code run in the context (in the calling thread only)
+    :param path: Path of the profile, a pstats file for cProfile and an HTML page for pyinstrument; None to not profile
+    :param profiler: 'cprofile' or 'pyinstrument' (an optional dependency)
+    """
+    if path is None:
+        yield
+        return
+    if profiler == "pyinstrument":
+        from pyinstrument import Profiler
+
+        pyinstrument_profiler = Profiler()
+        pyinstrument_profiler.start()
+        try:
+            yield
+        finally:
+            pyinstrument_profiler.stop()
+            Path(path).write_text(pyinstrument_profiler.output_html())
+    elif profiler == "cprofile":
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            profile.dump_stats(path)
+    else:
+        raise ValueError(f"Unknown profiler '{profiler}', expected one of {', '.join(PROFILERS)}")
@@ -1,22 +1,45 @@
-from os import sep
+from functools import partial
+from os import cpu_count, sep
+from typing import List, Optional
+
 import typer
 import pathlib
 
-from kghub_downloader.download_utils import download_from_yaml
-from prefixmaps import load_converter
-
-from monarch_gene_mapping.cli_utils import generate_gene_mappings
-from monarch_gene_mapping.uniprot_idmapping_preprocess import filter_uniprot_id_mapping_file
+# Only lightweight modules are imported here, so that the command line starts quickly: pandas, pyarrow
+# and prefixmaps are imported by the commands needing them
+from monarch_gene_mapping.defaults import (
+    DEFAULT_BENCHMARK_DIRECTORY,
+    DEFAULT_CACHE_DIRECTORY,
+    DEFAULT_DOWNLOAD_JOBS,
+    DEFAULT_TOLERANCE,
+)
+from monarch_gene_mapping.instrumentation import PROFILERS, RunReport, profiling
+from monarch_gene_mapping.mapping_spec import DEFAULT_MAPPING_SPEC
+from monarch_gene_mapping.uniprot_idmapping_preprocess import (
+    filter_uniprot_id_mapping_file,
+    index_source_file,
+    merge_shards,
+    prefilter_species,
+)
 
 typer_app = typer.Typer()
-converter = load_converter(["merged"])
+cache_app = typer.Typer(help="Manage the cache of parsed source files")
+typer_app.add_typer(cache_app, name="cache")
+
 
 @typer_app.command(name="download")
-def _download():
-    download_from_yaml(
-        yaml_file="monarch_gene_mapping/download.yaml",
-        output_dir=".",
-    )
+def _download(
+    jobs: int = typer.Option(DEFAULT_DOWNLOAD_JOBS, help="Number of files downloaded concurrently"),
+    force: bool = typer.Option(False, help="Download whole files, even if unchanged or partially downloaded"),
+    only: Optional[List[str]] = typer.Option(None, help="Only download the file of this tag (repeatable)"),
+):
+    from monarch_gene_mapping.downloads import DownloadError, download_files
+
+    try:
+        download_files(jobs=jobs, force=force, tags=only)
+    except (DownloadError, ValueError) as error:
+        print(f"\n{error}")
+        raise typer.Exit(code=1)
 
 
 @typer_app.command(name="preprocess-uniprot")
@@ -25,44 +48,378 @@ def preprocess_uniprot_mappings(
     source_filename: str = typer.Option("idmapping_selected.tab", help="Target File Name"),
     target_filename: str = typer.Option("idmapping_filtered.tsv", help="Target File Name"),
     number_of_lines: int = typer.Option(0, help="Number of Lines"),
+    workers: int = typer.Option(1, help="Number of filter processes"),
+    force: bool = typer.Option(False, help="Filter the whole file, even if its manifest says it is up to date"),
+    shard: Optional[str] = typer.Option(
+        None, help="Only filter the i-th of N shards of the file, given as i/N, into a partial file (see --merge)"
+    ),
+    merge: bool = typer.Option(False, help="Merge the partial files of the shards into the target file"),
+    index: bool = typer.Option(False, help="Only index the file for its shards, once before they run"),
 ):
-    filter_uniprot_id_mapping_file(
-        directory=directory,
-        source_filename=source_filename,
-        target_filename=target_filename,
-        number_of_lines=number_of_lines,
-    )
+    if index:
+        index_source_file(directory, source_filename)
+        return
+    if merge:
+        filtered = merge_shards(directory, source_filename, target_filename)
+    else:
+        try:
+            filtered = filter_uniprot_id_mapping_file(
+                directory=directory,
+                source_filename=source_filename,
+                target_filename=target_filename,
+                number_of_lines=number_of_lines,
+                workers=workers,
+                force=force,
+                shard=shard,
+            )
+        except ValueError as error:
+            print(f"\n{error}")
+            raise typer.Exit(code=1)
+    # i.e. for a pipeline running the shards to stop
+    if not filtered:
+        raise typer.Exit(code=1)
 
 
 @typer_app.command()
 def generate(
     output_dir=typer.Option("output", help="Output directory"),
     download: bool = typer.Option(False, help="Pass to first download required data"),
+    download_jobs: int = typer.Option(DEFAULT_DOWNLOAD_JOBS, help="Number of files downloaded concurrently"),
     preprocess_uniprot: bool = typer.Option(False, help="Filter out UniProt ID mapping data after download"),
+    workers: int = typer.Option(1, help="Number of filter processes used to preprocess UniProt data"),
+    cache: bool = typer.Option(True, help="Reuse parsed source files cached under the cache directory"),
+    cache_directory: str = typer.Option(DEFAULT_CACHE_DIRECTORY, help="Cache directory"),
+    jobs: int = typer.Option(1, help="Number of mapping stages run concurrently"),
+    executor: str = typer.Option("thread", help="Worker pool running concurrent mapping stages: thread or process"),
+    only: Optional[List[str]] = typer.Option(
+        None, help="Only generate this mapping (repeatable), saved as gene_mappings.<names>.sssom.tsv"
+    ),
+    spec: str = typer.Option(DEFAULT_MAPPING_SPEC, help="Mapping specification"),
+    dedup: bool = typer.Option(
+        True, help="Keep a mapping generated by several sources for the preferred one only (the first in the spec)"
+    ),
+    profile: bool = typer.Option(False, help="Profile the run, saved next to the mapping file"),
+    profiler: str = typer.Option("cprofile", help=f"Profiler: {' or '.join(PROFILERS)} (to be installed)"),
+    output_format: str = typer.Option(
+        "tsv", "--format", help="Comma separated output formats: tsv (SSSOM TSV), parquet and/or arrow (Arrow IPC)"
+    ),
+    compression: str = typer.Option("none", help="Compression of the mapping file: none, gzip or zstd"),
+    write_threads: int = typer.Option(cpu_count() or 1, help="Number of threads writing (compressing) the mappings"),
 ):
-    if download:
-        _download()
-        print("\nData download complete!\n")
-
-    # prefilter 'target' taxa in Uniprot data
-    if preprocess_uniprot:
-        filter_uniprot_id_mapping_file(
-            directory="data/uniprot",
-            source_filename="idmapping_selected.tab",
-            target_filename="idmapping_filtered.tsv",
-            number_of_lines=0,
+    if profiler not in PROFILERS:
+        raise typer.BadParameter(f"expected one of {', '.join(PROFILERS)}", param_hint="--profiler")
+
+    from monarch_gene_mapping.scheduler import EXECUTORS
+
+    if executor not in EXECUTORS:
+        raise typer.BadParameter(f"expected one of {', '.join(EXECUTORS)}", param_hint="--executor")
+
+    from monarch_gene_mapping.cli_utils import generate_gene_mappings
+    from monarch_gene_mapping.curie_utils import load_converter, standardize_curies
+    from monarch_gene_mapping.downloads import DownloadError, Downloads, load_download_entries
+    from monarch_gene_mapping.mapping_spec import load_mapping_spec
+    from monarch_gene_mapping.sssom_writer import (
+        COMPRESSIONS,
+        OUTPUT_FORMATS,
+        arrow_available,
+        curie_map,
+        mappings_table,
+        write_sssom_arrow,
+        write_sssom_parquet,
+        write_sssom_tsv,
+    )
+    from monarch_gene_mapping.validation import MAPPING_COLUMNS, MappingValidationError
+
+    if compression != "none" and compression not in COMPRESSIONS:
+        raise typer.BadParameter(f"expected none or one of {', '.join(COMPRESSIONS)}", param_hint="--compression")
+    formats = [name.strip() for name in output_format.split(",") if name.strip()]
+    if not formats or set(formats) - set(OUTPUT_FORMATS):
+        raise typer.BadParameter(
+            f"expected a comma separated list of {', '.join(OUTPUT_FORMATS)}", param_hint="--format"
+        )
+    if {"parquet", "arrow"} & set(formats) and not arrow_available():
+        raise typer.BadParameter(
+            "Parquet and Arrow outputs require pyarrow, please install it first", param_hint="--format"
         )
 
-    print("\nGenerating gene mapping...\n")
     pathlib.Path(output_dir).mkdir(parents=True, exist_ok=True)
-    mappings = generate_gene_mappings()
+    # a partial run must not overwrite the complete mapping file
+    output_name = f"gene_mappings.{'.'.join(only)}" if only else "gene_mappings"
+    output_files = {name: f"{output_dir}/{output_name}{OUTPUT_FORMATS[name]}" for name in formats}
+    if "tsv" in output_files:
+        output_files["tsv"] += COMPRESSIONS.get(compression, "")
+    report_file = f"{output_dir}/{output_name}.report.json"
+    issues_file = f"{output_dir}/{output_name}.issues.tsv"
+    release_file = f"{output_dir}/{output_name}.release.json"
+    changelog_file = f"{output_dir}/{output_name}.changelog.tsv.gz"
+    profile_file = f"{output_dir}/{output_name}.profile.{'html' if profiler == 'pyinstrument' else 'pstats'}"
+
+    run_report = RunReport(jobs=jobs, executor=executor, only=only, spec=spec)
+    try:
+        with profiling(profile_file if profile else None, profiler):
+            # prefilter 'target' taxa in Uniprot data, while it is downloaded if it is
+            prefilter = partial(
+                filter_uniprot_id_mapping_file,
+                directory="data/uniprot",
+                source_filename="idmapping_selected.tab",
+                target_filename="idmapping_filtered.tsv",
+                number_of_lines=0,
+                workers=workers,
+                species=set(prefilter_species(spec)),
+            )
+            if download:
+                try:
+                    with run_report.stage("download"), Downloads(load_download_entries(), jobs=download_jobs) as files:
+                        if preprocess_uniprot:
+                            # None if the UniProt file is unchanged, the prefilter then checking its manifest
+                            with run_report.stage("uniprot_prefilter", exclusive=False):
+                                prefilter(source_file=files.stream("uniprot"))
+                        run_report.details["downloads"] = files.wait()
+                except DownloadError as error:
+                    print(f"\n{error}")
+                    raise typer.Exit(code=1)
+                print("\nData download complete!\n")
+            elif preprocess_uniprot:
+                with run_report.stage("uniprot_prefilter"):
+                    prefilter()
+
+            with run_report.stage("load_converter"):
+                converter = load_converter(("merged",), cache_directory if cache else None)
+
+            print("\nGenerating gene mapping...\n")
+            try:
+                mappings = generate_gene_mappings(
+                    cache_directory=cache_directory if cache else None,
+                    jobs=jobs,
+                    executor=executor,
+                    only=only,
+                    spec_path=spec,
+                    converter=converter,
+                    run_report=run_report,
+                    deduplicate=dedup,
+                )
+            except MappingValidationError as error:
+                error.report.issues.to_csv(issues_file, sep="\t", index=False)
+                print(f"\n{error.report.summary()}\n\nOffending mappings saved in {issues_file}")
+                raise typer.Exit(code=1)
+
+            print("\nStandardizing CURIEs...\n")
+            with run_report.stage("standardize_curies") as metrics:
+                run_report.details["standardized_curies"] = standardize_curies(
+                    mappings, ["subject_id", "object_id"], converter
+                )
+                metrics.rows_in = metrics.rows_out = len(mappings)
+
+            metadata = {
+                "curie_map": curie_map(mappings, converter, MAPPING_COLUMNS),
+                **load_mapping_spec(spec).sssom_metadata,
+            }
+            if "tsv" in output_files:
+                with run_report.stage("write") as metrics:
+                    write_sssom_tsv(
+                        mappings,
+                        output_files["tsv"],
+                        metadata=metadata,
+                        compression=None if compression == "none" else compression,
+                        threads=write_threads,
+                    )
+                    metrics.rows_out = len(mappings)
+            if "parquet" in output_files or "arrow" in output_files:
+                with run_report.stage("write_arrow") as metrics:
+                    table = mappings_table(mappings, metadata)
+                    if "parquet" in output_files:
+                        write_sssom_parquet(table, output_files["parquet"])
+                    if "arrow" in output_files:
+                        write_sssom_arrow(table, output_files["arrow"])
+                    metrics.rows_out = table.num_rows
+            for output_file in output_files.values():
+                print(f"\nResults saved in {output_file}")
+
+            if run_report.details.get("shards"):
+                from monarch_gene_mapping.shards import (
+                    mapping_changelog,
+                    prune_shards,
+                    read_release,
+                    register_release,
+                    shard_directory,
+                    write_release,
+                )
+
+                shards = run_report.details["shards"]
+                with run_report.stage("changelog") as metrics:
+                    changelog, changes = mapping_changelog(
+                        read_release(release_file), shards, shard_directory(cache_directory)
+                    )
+                    if changelog is not None:
+                        standardize_curies(changelog, ["subject_id", "object_id"], converter)
+                        changelog.to_csv(
+                            changelog_file, sep="\t", index=False, compression={"method": "gzip", "mtime": 0}
+                        )
+                        metrics.rows_out = len(changelog)
+                    write_release(release_file, shards, changes)
+                    # the shards of the previous release are no longer needed, unless another release refers to them
+                    prune_shards(cache_directory, register_release(cache_directory, release_file, shards))
+                run_report.details["changes"] = changes
+                if changelog is None:
+                    print(f"\nFirst release, manifest saved in {release_file}")
+                else:
+                    changed = {name: change for name, change in changes.items() if change["status"] != "unchanged"}
+                    for name, change in changed.items():
+                        print(f"{name}: {change['status']}, +{change['added']} -{change['removed']} mappings")
+                    print(f"\n{len(changed)} mapping(s) changed since the previous release, see {changelog_file}")
+    finally:
+        run_report.save(report_file)
+        print(f"Run report saved in {report_file}")
+        if profile:
+            print(f"Profile saved in {profile_file}")
+
+
+@typer_app.command()
+def index(
+    mappings: str = typer.Option("output/gene_mappings.sssom.tsv", help="Mapping file: SSSOM TSV, .parquet or .arrow"),
+    output: Optional[str] = typer.Option(None, help="Index directory (default: output/gene_mappings.index)"),
+):
+    from monarch_gene_mapping.gene_index import GeneMappingIndex
+
+    output = output or f"{mappings.split('.sssom')[0]}.index"
+    gene_index = GeneMappingIndex.from_sssom(mappings)
+    gene_index.save(output)
+    print(f"Index of {len(gene_index)} mappings between {gene_index.size} CURIEs saved in {output}")
+
+
+@typer_app.command()
+def resolve(
+    curies: List[str] = typer.Argument(..., help="CURIEs to resolve to their preferred gene identifier"),
+    index_directory: str = typer.Option("output/gene_mappings.index", "--index", help="Index directory"),
+):
+    from monarch_gene_mapping.gene_index import GeneMappingIndex
+
+    resolved = GeneMappingIndex.load(index_directory).resolve_many(curies)
+    for curie, preferred in zip(curies, resolved):
+        print(f"{curie}\t{preferred or ''}")
+
+
+@typer_app.command()
+def serve(
+    mappings: str = typer.Option(
+        "output/gene_mappings.sssom.tsv", help="Mapping file (SSSOM TSV, .parquet or .arrow) or index directory"
+    ),
+    host: str = typer.Option("127.0.0.1", help="Host name or address to listen on"),
+    port: int = typer.Option(8008, help="Port to listen on"),
+    cache_size: int = typer.Option(4096, help="Number of responses kept in the LRU cache"),
+    reload_interval: float = typer.Option(5.0, help="Seconds between checks for a new mapping file, 0 to never reload"),
+):
+    import asyncio
+
+    from monarch_gene_mapping.service import MappingService
+
+    service = MappingService(mappings, cache_size=cache_size, reload_interval=reload_interval)
+    try:
+        asyncio.run(service.serve_forever(host, port))
+    except KeyboardInterrupt:
+        print("Stopped")
+
+
+@typer_app.command()
+def synthesize(
+    directory: str = typer.Option(DEFAULT_BENCHMARK_DIRECTORY, help="Root directory of the synthetic data"),
+    rows: int = typer.Option(100_000, help="Number of rows of each source file"),
+    seed: int = typer.Option(0, help="Random seed"),
+):
+    from monarch_gene_mapping.synthetic import generate_sources
+
+    paths = generate_sources(directory, rows=rows, seed=seed)
+    for source, path in paths.items():
+        print(f"{source}\t{path}")
+
 
-    print("\nStandardizing CURIEs...\n")
-    converter.pd_standardize_curie(mappings, column="subject_id", strict=True)
-    converter.pd_standardize_curie(mappings, column="object_id", strict=True)
+@typer_app.command()
+def bench(
+    directory: str = typer.Option(DEFAULT_BENCHMARK_DIRECTORY, help="Root directory of the synthetic data"),
+    rows: int = typer.Option(100_000, help="Number of rows of each synthetic source file"),
+    seed: int = typer.Option(0, help="Random seed of the synthetic data"),
+    stage: Optional[List[str]] = typer.Option(None, help="Only run this benchmark stage (repeatable)"),
+    save: Optional[str] = typer.Option(None, help="Save the results to this JSON file, i.e. as a new baseline"),
+    baseline: Optional[str] = typer.Option(None, help="Compare the results to this saved baseline"),
+    tolerance: float = typer.Option(DEFAULT_TOLERANCE, help="Relative slowdown or memory growth tolerated"),
+    source_rows: Optional[List[str]] = typer.Option(
+        None, help="Rows of the synthetic file of a source, i.e. alliance=5000000 for a full size file (repeatable)"
+    ),
+):
+    from monarch_gene_mapping.benchmark import (
+        compare_results,
+        format_results,
+        load_results,
+        run_benchmarks,
+        save_results,
+    )
+
+    try:
+        rows_by_source = {source: int(count) for source, count in (value.split("=") for value in source_rows or [])}
+    except ValueError:
+        raise typer.BadParameter("expected source=rows, i.e. alliance=5000000", param_hint="--source-rows")
+    results = run_benchmarks(directory, rows=rows, seed=seed, only=stage, source_rows=rows_by_source)
+    print(f"\n{format_results(results)}")
+    if save:
+        save_results(results, save)
+        print(f"\nResults saved in {save}")
+    if baseline:
+        reference = load_results(baseline)
+        if reference["rows"] != rows or reference.get("source_rows", {}) != rows_by_source:
+            print(
+                f"\nWarning: the baseline was run on {reference['rows']} rows "
+                f"({reference.get('source_rows', {})} by source), not {rows} ({rows_by_source})"
+            )
+        comparison = compare_results(results, reference, tolerance=tolerance)
+        print(f"\nComparison with {baseline}:\n{comparison.to_string(index=False)}")
+        regressions = comparison.loc[comparison["regression"]]
+        if not regressions.empty:
+            print(f"\n{len(regressions)} regression(s) beyond {tolerance:.0%}")
+            raise typer.Exit(code=1)
+
+
+@cache_app.command(name="list")
+def cache_list(cache_directory: str = typer.Option(DEFAULT_CACHE_DIRECTORY, help="Cache directory")):
+    from monarch_gene_mapping.source_cache import read_index
+
+    index = read_index(cache_directory)
+    if not index:
+        print(f"No cached source files in {cache_directory}")
+    for filename, entry in sorted(index.items()):
+        print(f"{filename}\t{entry['source']}\t{entry['rows']} rows\tcreated {entry['created']}")
+
+
+@cache_app.command(name="verify")
+def cache_verify(
+    cache_directory: str = typer.Option(DEFAULT_CACHE_DIRECTORY, help="Cache directory"),
+    checksum: bool = typer.Option(False, help="Recompute the checksum of every source file"),
+):
+    from monarch_gene_mapping.source_cache import cache_available, verify_cache
+
+    if not cache_available():
+        print("The source cache requires pyarrow, please install it first")
+        raise typer.Exit(code=1)
+    results = verify_cache(cache_directory, checksum=checksum)
+    for result in results:
+        print(f"{result['filename']}\t{result['status']}")
+    if any(result["status"] != "ok" for result in results):
+        raise typer.Exit(code=1)
+
+
+@cache_app.command(name="prune")
+def cache_prune(
+    cache_directory: str = typer.Option(DEFAULT_CACHE_DIRECTORY, help="Cache directory"),
+    remove_all: bool = typer.Option(False, "--all", help="Remove every cache entry"),
+):
+    from monarch_gene_mapping.source_cache import cache_available, prune_cache
 
-    mappings.to_csv(f"{output_dir}/gene_mappings.sssom.tsv", sep="\t", index=False)
-    print(f"\nResults saved in {output_dir}/gene_mappings.sssom.tsv")
+    if not cache_available():
+        print("The source cache requires pyarrow, please install it first")
+        raise typer.Exit(code=1)
+    removed = prune_cache(cache_directory, remove_all=remove_all)
+    for filename in removed:
+        print(f"Removed {filename}")
+    print(f"Removed {len(removed)} cache entries")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,164 @@
+"""
+Declarative specification of the gene mappings (see mappings.yaml) and the planning of their generation:
+which source files to read, which of their columns, and which mappings to generate from each of them.
+"""
+
+from dataclasses import dataclass, field, fields
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set
+
+import yaml
+
+DEFAULT_MAPPING_SPEC: str = str(Path(__file__).parent / "mappings.yaml")
+
+
+@dataclass
+class SourceSpec:
+    """
+    A source file, and how to read it
+    """
+
+    name: str
+    path: str
+    read_options: Dict[str, Any] = field(default_factory=dict)
+    chunked: bool = False
+    # preprocessing function name, the columns it needs and its keyword arguments
+    preprocess: Optional[Dict[str, Any]] = None
+    # Arrow IPC file of the columns of the source used by the mappings, written by its preprocessing and read
+    # instead of the source file while it is up to date
+    arrow: Optional[str] = None
+
+
+@dataclass
+class MappingSpec:
+    """
+    A mapping generated from one source, mostly made of df_mappings keyword arguments
+    """
+
+    name: str
+    description: str
+    source: str
+    subject_column: str
+    object_column: str
+    subject_curie_prefix: Optional[str] = None
+    object_curie_prefix: Optional[str] = None
+    predicate_id: str = "skos:exactMatch"
+    mapping_justification: str = "semapv:UnspecifiedMatching"
+    entity_delimiter: str = ";"
+    filter_column: Optional[str] = None
+    filter_ids: Optional[List[int]] = None
+    # columns holding delimiter separated lists to expand (with their delimiter) before mapping
+    explode: Dict[str, str] = field(default_factory=dict)
+    min_count: int = 0
+
+    def df_mappings_kwargs(self) -> Dict[str, Any]:
+        """
+        :return: Keyword arguments of df_mappings for this mapping
+        """
+        return {
+            "subject_column": self.subject_column,
+            "subject_curie_prefix": self.subject_curie_prefix,
+            "object_column": self.object_column,
+            "object_curie_prefix": self.object_curie_prefix,
+            "predicate_id": self.predicate_id,
+            "mapping_justification": self.mapping_justification,
+            "entity_delimiter": self.entity_delimiter,
+            "filter_column": self.filter_column,
+            "filter_ids": self.filter_ids,
+        }
+
+    def columns(self) -> List[str]:
+        """
+        :return: Source columns used by this mapping
+        """
+        columns = [self.subject_column, self.object_column, *self.explode]
+        if self.filter_column is not None:
+            columns.append(self.filter_column)
+        return columns
+
+
+@dataclass
+class MappingSpecification:
+    sources: Dict[str, SourceSpec]
+    mappings: List[MappingSpec]
+    uniprot_prefilter_taxa: List[int] = field(default_factory=list)
+    # SSSOM mapping set metadata written at the top of the mapping file
+    sssom_metadata: Dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass
+class SourcePlan:
+    """
+    Execution plan of one source file: read it once, with only the columns needed, to generate all its mappings
+    """
+
+    source: SourceSpec
+    mappings: List[MappingSpec]
+    usecols: List[str]
+
+
+def _from_dict(cls, values: Dict[str, Any]):
+    known = {spec_field.name for spec_field in fields(cls)}
+    unknown = set(values) - known
+    if unknown:
+        raise ValueError(f"Unknown {cls.__name__} key(s) {', '.join(sorted(unknown))} in {values.get('name')}")
+    return cls(**values)
+
+
+def load_mapping_spec(path: str = DEFAULT_MAPPING_SPEC) -> MappingSpecification:
+    """
+    Load and check a mapping specification
+    :param path: Path of the YAML mapping specification
+    :return: MappingSpecification
+    """
+    with open(path) as spec_file:
+        spec = yaml.safe_load(spec_file)
+
+    sources = {
+        name: _from_dict(SourceSpec, dict(source, name=name)) for name, source in (spec.get("sources") or {}).items()
+    }
+    mappings = [_from_dict(MappingSpec, mapping) for mapping in spec.get("mappings") or []]
+
+    names: Set[str] = set()
+    for mapping in mappings:
+        if mapping.name in names:
+            raise ValueError(f"Duplicate mapping name '{mapping.name}' in {path}")
+        names.add(mapping.name)
+        if mapping.source not in sources:
+            raise ValueError(f"Mapping '{mapping.name}' refers to unknown source '{mapping.source}' in {path}")
+
+    return MappingSpecification(
+        sources=sources,
+        mappings=mappings,
+        uniprot_prefilter_taxa=spec.get("uniprot_prefilter_taxa") or [],
+        sssom_metadata=spec.get("sssom_metadata") or {},
+    )
+
+
+def plan_mappings(spec: MappingSpecification, only: Optional[List[str]] = None) -> List[SourcePlan]:
+    """
+    Plan the generation of mappings: group them by source file, and collect the columns to read from each file
+    :param spec: Mapping specification
+    :param only: Names of the mappings to generate (default: all)
+    :return: List of SourcePlan, in the order each source first appears in the mappings
+    """
+    mappings = spec.mappings
+    if only:
+        unknown = set(only) - {mapping.name for mapping in mappings}
+        if unknown:
+            raise ValueError(
+                f"Unknown mapping(s) {', '.join(sorted(unknown))}, "
+                f"expected one of {', '.join(mapping.name for mapping in mappings)}"
+            )
+        mappings = [mapping for mapping in mappings if mapping.name in only]
+
+    plans: Dict[str, SourcePlan] = {}
+    for mapping in mappings:
+        source = spec.sources[mapping.source]
+        if source.name not in plans:
+            preprocess_columns = (source.preprocess or {}).get("columns", [])
+            plans[source.name] = SourcePlan(source=source, mappings=[], usecols=list(preprocess_columns))
+        plan = plans[source.name]
+        plan.mappings.append(mapping)
+        plan.usecols.extend(column for column in mapping.columns() if column not in plan.usecols)
+    return list(plans.values())
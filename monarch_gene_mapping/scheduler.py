@@ -0,0 +1,77 @@
+"""
+Scheduler running the independent mapping stages of generate_gene_mappings, sequentially or on a pool of workers.
+"""
+
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from sys import stderr
+from typing import Any, Callable, Dict, List, NamedTuple
+
+from pandas.core.frame import DataFrame
+
+EXECUTORS = {"thread": ThreadPoolExecutor, "process": ProcessPoolExecutor}
+
+
+class MappingStage(NamedTuple):
+    """
+    One mapping stage: a picklable function generating the mapping DataFrames of one source file
+    """
+
+    name: str
+    function: Callable[..., List[DataFrame]]
+
+
+class MappingStageError(Exception):
+    """
+    Raised when one or more mapping stages fail, the failures being kept in the errors dictionary (by stage name)
+    """
+
+    def __init__(self, errors: Dict[str, BaseException]):
+        self.errors = errors
+        details = "; ".join(f"{name}: {type(error).__name__}: {error}" for name, error in errors.items())
+        super().__init__(f"{len(errors)} mapping stage(s) failed - {details}")
+
+
+def run_stage(stage: MappingStage, **kwargs) -> List[DataFrame]:
+    """
+    Run a single mapping stage
+    :param stage: Mapping stage
+    :param kwargs: Keyword arguments of the stage function
+    :return: List of mapping DataFrames
+    """
+    return stage.function(**kwargs)
+
+
+def run_stages(
+    stages: List[MappingStage], jobs: int = 1, executor: str = "thread", **kwargs: Any
+) -> List[List[DataFrame]]:
+    """
+    Run mapping stages, concurrently if more than one job is requested
+    :param stages: Mapping stages
+    :param jobs: Number of stages run at the same time; 1 runs them one after the other in the calling thread
+    :param executor: Kind of worker pool, 'thread' or 'process'
+    :param kwargs: Keyword arguments passed to every stage function
+    :return: Mapping DataFrames of each stage, in the order of the stages whatever the order they complete in
+    """
+    if executor not in EXECUTORS:
+        raise ValueError(f"Unknown executor '{executor}', expected one of {', '.join(EXECUTORS)}")
+    if jobs <= 1:
+        results = []
+        for stage in stages:
+            try:
+                results.append(run_stage(stage, **kwargs))
+            except Exception as error:
+                raise MappingStageError({stage.name: error}) from error
+        return results
+
+    pool: Executor
+    with EXECUTORS[executor](max_workers=jobs) as pool:
+        futures = [pool.submit(run_stage, stage, **kwargs) for stage in stages]
+        errors: Dict[str, BaseException] = {}
+        for stage, future in zip(stages, futures):
+            error = future.exception()
+            if error is not None:
+                print(f"\nMapping stage '{stage.name}' failed: {type(error).__name__}: {error}", file=stderr)
+                errors[stage.name] = error
+    if errors:
+        raise MappingStageError(errors) from next(iter(errors.values()))
+    return [future.result() for future in futures]
@@ -0,0 +1,338 @@
+"""
+Local HTTP lookup service resolving CURIEs to their preferred gene identifier, over a GeneMappingIndex.
+
+The service is a small asyncio HTTP/1.1 server (no dependency beyond the standard library), keeping connections
+alive between requests:
+
+    GET  /resolve?curie=ENSEMBL:ENSG00000121410&curie=...   -> {"resolved": {"ENSEMBL:ENSG00000121410": "HGNC:5"}}
+    POST /resolve {"curies": [...], "predicate_ids": [...]} -> {"resolved": ["HGNC:5", null, ...]}
+    GET  /health                                            -> description of the index being served
+
+A POST body may also be a plain JSON list of CURIEs, batches being resolved at once by GeneMappingIndex.resolve_many().
+Responses are kept in an LRU cache, cleared when the index is reloaded. The service watches its mapping file (or
+index directory) and, when a new one appears, builds or loads its index in a worker thread and swaps it in, requests
+being served by the previous index in the meantime.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from monarch_gene_mapping.gene_index import DESCRIPTION_FILENAME, GeneMappingIndex
+
+DEFAULT_HOST: str = "127.0.0.1"
+DEFAULT_PORT: int = 8008
+CACHE_SIZE: int = 4096
+# responses larger than this are not cached, i.e. the responses of large batches
+CACHE_MAX_RESPONSE_BYTES: int = 64 * 1024
+RELOAD_INTERVAL: float = 5.0
+KEEP_ALIVE_TIMEOUT: float = 15.0
+MAX_HEADER_BYTES: int = 64 * 1024
+MAX_BODY_BYTES: int = 64 * 1024 * 1024
+# batches larger than this are resolved in a worker thread, not to hold up the other connections
+THREAD_BATCH_SIZE: int = 10_000
+
+REASONS: Dict[int, str] = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+}
+
+
+class HTTPError(Exception):
+    """
+    Error answered to the client with an HTTP status
+    """
+
+    def __init__(self, status: int, message: str):
+        self.status = status
+        self.message = message
+        super().__init__(message)
+
+
+class ResponseCache:
+    """
+    LRU cache of response bodies
+    """
+
+    def __init__(self, size: int = CACHE_SIZE):
+        self.size = size
+        self.entries: "OrderedDict[bytes, bytes]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: bytes) -> Optional[bytes]:
+        body = self.entries.get(key)
+        if body is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return body
+
+    def put(self, key: bytes, body: bytes):
+        if self.size <= 0 or len(body) > CACHE_MAX_RESPONSE_BYTES:
+            return
+        self.entries[key] = body
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+
+def _signature(path: str) -> Optional[Tuple[int, int, int]]:
+    """
+    :param path: Path of a mapping file or index directory
+    :return: Identity of the current version of the file (its description file for an index directory), None if
+             there is none
+    """
+    watched = Path(path) / DESCRIPTION_FILENAME if Path(path).is_dir() else Path(path)
+    try:
+        stat = watched.stat()
+    except OSError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+def load_index(path: str) -> GeneMappingIndex:
+    """
+    :param path: Path of a mapping file (SSSOM TSV, .parquet or .arrow) or of an index directory
+    :return: GeneMappingIndex, memory-mapped for an index directory, built in memory for a mapping file
+    """
+    if Path(path).is_dir():
+        return GeneMappingIndex.load(path)
+    return GeneMappingIndex.from_sssom(path)
+
+
+class MappingService:
+    """
+    HTTP lookup service over the index of a mapping file or index directory
+    """
+
+    def __init__(self, path: str, cache_size: int = CACHE_SIZE, reload_interval: float = RELOAD_INTERVAL):
+        """
+        :param path: Path of a mapping file (SSSOM TSV, .parquet or .arrow) or of an index directory
+        :param cache_size: Number of responses kept in the LRU cache
+        :param reload_interval: Seconds between checks for a new mapping file, 0 to never reload
+        """
+        self.path = path
+        self.cache = ResponseCache(cache_size)
+        self.reload_interval = reload_interval
+        self.signature = _signature(path)
+        self.index = load_index(path)
+        self.loaded = time.time()
+        self.reloads = 0
+        self.requests = 0
+        self.watcher: Optional[asyncio.Future] = None
+
+    def description(self) -> Dict[str, Any]:
+        """
+        :return: Description of the index being served, and counters of the service
+        """
+        return {
+            "status": "ok",
+            "path": self.path,
+            "loaded": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.loaded)),
+            "mappings": len(self.index),
+            "curies": self.index.size,
+            "predicate_ids": self.index.predicate_ids,
+            "reloads": self.reloads,
+            "requests": self.requests,
+            "cache": {"entries": len(self.cache.entries), "hits": self.cache.hits, "misses": self.cache.misses},
+        }
+
+    async def reload(self) -> bool:
+        """
+        Reload the index if its mapping file changed
+        :return: bool, True if the index was reloaded
+        """
+        signature = _signature(self.path)
+        if signature is None or signature == self.signature:
+            return False
+        try:
+            index = await asyncio.get_running_loop().run_in_executor(None, load_index, self.path)
+        except Exception as error:
+            # i.e. a file still being written, tried again on the next check
+            print(f"Could not reload {self.path}: {error}")
+            return False
+        self.index, self.signature, self.loaded = index, signature, time.time()
+        self.cache.clear()
+        self.reloads += 1
+        print(f"Reloaded {self.path}: {len(index)} mappings")
+        return True
+
+    async def watch(self):
+        """
+        Reload the index whenever its mapping file changes
+        """
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            await self.reload()
+
+    async def resolve(self, curies: List[Optional[str]], predicate_ids: Optional[List[str]]) -> List[Optional[str]]:
+        """
+        :param curies: CURIEs
+        :param predicate_ids: Predicates of the mappings to follow (default: all)
+        :return: Preferred identifier of each CURIE, None for the CURIEs which are not in the index
+        """
+        index = self.index
+        if len(curies) > THREAD_BATCH_SIZE:
+            resolved = await asyncio.get_running_loop().run_in_executor(None, index.resolve_many, curies, predicate_ids)
+        else:
+            resolved = index.resolve_many(curies, predicate_ids)
+        return resolved.tolist()
+
+    async def respond(self, method: str, target: str, body: bytes) -> bytes:
+        """
+        :param method: HTTP method
+        :param target: Request target, i.e. /resolve?curie=HGNC:5
+        :param body: Request body
+        :return: JSON response body
+        :raises HTTPError: if the request can't be answered
+        """
+        url = urlsplit(target)
+        if url.path == "/health":
+            return json.dumps(self.description()).encode("utf-8")
+        if url.path != "/resolve":
+            raise HTTPError(404, f"Unknown path {url.path}, expected /resolve or /health")
+
+        key = hashlib.blake2b(b"\0".join([method.encode(), target.encode(), body]), digest_size=16).digest()
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        if method == "GET":
+            query = parse_qs(url.query)
+            curies = query.get("curie", [])
+            resolved = await self.resolve(curies, query.get("predicate_id"))
+            response = {"resolved": dict(zip(curies, resolved))}
+        elif method == "POST":
+            try:
+                request = json.loads(body or b"null")
+            except ValueError as error:
+                raise HTTPError(400, f"Invalid JSON body: {error}")
+            if isinstance(request, list):
+                request = {"curies": request}
+            predicate_ids = request.get("predicate_ids") if isinstance(request, dict) else None
+            if (
+                not isinstance(request, dict)
+                or not isinstance(request.get("curies"), list)
+                or not all(curie is None or isinstance(curie, str) for curie in request["curies"])
+                # a string would be taken for a list of one-character predicates
+                or not (predicate_ids is None or isinstance(predicate_ids, list))
+                or not all(isinstance(predicate_id, str) for predicate_id in predicate_ids or [])
+            ):
+                raise HTTPError(400, 'Expected a JSON list of CURIEs, or {"curies": [...], "predicate_ids": [...]}')
+            response = {"resolved": await self.resolve(request["curies"], predicate_ids)}
+        else:
+            raise HTTPError(405, f"Unsupported method {method}, expected GET or POST")
+        response_body = json.dumps(response).encode("utf-8")
+        self.cache.put(key, response_body)
+        return response_body
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        Serve the requests of a connection, until the client closes it or stays idle
+        """
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), KEEP_ALIVE_TIMEOUT)
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+                    return
+                except asyncio.LimitOverrunError:
+                    await self._write(writer, 413, b'{"error": "Request header too large"}', keep_alive=False)
+                    return
+                request_line, *header_lines = head.decode("latin-1").split("\r\n")
+                try:
+                    method, target, version = request_line.split(" ")
+                    headers = {
+                        name.strip().lower(): value.strip()
+                        for name, value in (line.split(":", 1) for line in header_lines if line)
+                    }
+                    length = int(headers.get("content-length", 0))
+                    if length < 0:
+                        raise ValueError(f"Negative Content-Length {length}")
+                except ValueError:
+                    await self._write(writer, 400, b'{"error": "Malformed request"}', keep_alive=False)
+                    return
+                if length > MAX_BODY_BYTES:
+                    await self._write(writer, 413, b'{"error": "Request body too large"}', keep_alive=False)
+                    return
+                try:
+                    body = await asyncio.wait_for(reader.readexactly(length), KEEP_ALIVE_TIMEOUT) if length else b""
+                except asyncio.TimeoutError:
+                    return
+
+                connection = headers.get("connection", "").lower()
+                keep_alive = connection != "close" if version == "HTTP/1.1" else connection == "keep-alive"
+                self.requests += 1
+                try:
+                    status, response = 200, await self.respond(method, target, body)
+                except HTTPError as error:
+                    status, response = error.status, json.dumps({"error": error.message}).encode("utf-8")
+                except Exception as error:
+                    status, response = 500, json.dumps({"error": str(error)}).encode("utf-8")
+                await self._write(writer, status, response, keep_alive)
+                if not keep_alive:
+                    return
+        except (asyncio.IncompleteReadError, ConnectionError):
+            return
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _write(writer: asyncio.StreamWriter, status: int, body: bytes, keep_alive: bool):
+        head = (
+            f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode("latin-1") + body)
+        await writer.drain()
+
+    async def start(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT) -> asyncio.AbstractServer:
+        """
+        Start serving (and watching the mapping file, if reload_interval is set)
+        :param host: Host name or address to listen on
+        :param port: Port to listen on, 0 for any free port
+        :return: asyncio Server
+        """
+        server = await asyncio.start_server(self.handle, host, port, limit=MAX_HEADER_BYTES)
+        if self.reload_interval > 0:
+            self.watcher = asyncio.ensure_future(self.watch())
+        return server
+
+    def stop(self):
+        """
+        Stop watching the mapping file
+        """
+        if self.watcher is not None:
+            self.watcher.cancel()
+            self.watcher = None
+
+    async def serve_forever(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT):
+        """
+        Serve until interrupted
+        :param host: Host name or address to listen on
+        :param port: Port to listen on
+        """
+        server = await self.start(host, port)
+        addresses = ", ".join(f"{socket.getsockname()[0]}:{socket.getsockname()[1]}" for socket in server.sockets)
+        print(f"Serving {len(self.index)} mappings of {self.path} on {addresses} (pid {os.getpid()})")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.stop()
@@ -0,0 +1,270 @@
+"""
+Incremental regeneration of the gene mappings, and changelog between releases.
+
+The mappings generated from a source file are saved as Parquet shards (one per mapping) under the shards directory
+of the cache, keyed by the checksum of the source file, by the specification of the source and of the mapping, and by
+the version of the code generating the mappings.
+A source whose shards are all saved is not read again, its mappings being loaded from their shards, so that only the
+sources which changed since the previous run are recomputed.
+
+Each release (the mapping file saved by 'generate') lists the shards it is made of in a release manifest. Its
+changelog lists the mappings (subject_id, predicate_id, object_id triples) added and removed since the previous
+release, for each mapping whose shard changed, the shards which didn't change not being read at all.
+
+Shards require the optional pyarrow package; without it, every source is recomputed and no changelog is produced.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from dataclasses import asdict
+from datetime import datetime
+from functools import lru_cache
+from importlib.metadata import PackageNotFoundError, version
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+import pandas as pd
+from pandas.core.frame import DataFrame
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - exercised only without pyarrow
+    pa = None
+    pq = None
+
+from monarch_gene_mapping.mapping_spec import SourcePlan
+from monarch_gene_mapping.source_cache import read_index, source_fingerprint, write_index
+
+# Version of the shards, to be increased when the format of the shard files changes
+SHARD_FORMAT: int = 1
+# Modules generating the mappings of a shard, any change of their code invalidating the shards
+SHARD_MODULES: List[str] = ["cli_utils.py", "dedup.py", "mapping_spec.py", "source_cache.py"]
+SHARD_DIRECTORY: str = "shards"
+# Shards of the releases of every output directory sharing the cache, in the shard directory
+RELEASES_FILENAME: str = "releases.json"
+# Mapping specification keys which don't change the mappings generated
+UNKEYED_MAPPING_FIELDS: List[str] = ["description", "min_count"]
+
+TRIPLE_COLUMNS: List[str] = ["subject_id", "predicate_id", "object_id"]
+CHANGELOG_COLUMNS: List[str] = ["change", "source", "mapping", *TRIPLE_COLUMNS]
+
+# Serializes updates of the shard index, i.e. when several sources are mapped concurrently
+_index_lock = threading.Lock()
+
+
+def shards_available() -> bool:
+    """
+    :return: bool, True if the optional pyarrow dependency needed by the shards is installed
+    """
+    return pq is not None
+
+
+def shard_directory(cache_directory: str) -> Path:
+    """
+    :param cache_directory: Cache directory
+    :return: Directory of the mapping shards
+    """
+    return Path(cache_directory) / SHARD_DIRECTORY
+
+
+@lru_cache(maxsize=None)
+def code_fingerprint() -> str:
+    """
+    :return: Checksum of the package version and of the code of the modules generating the mappings (SHARD_MODULES)
+    """
+    try:
+        package_version = version("monarch_gene_mapping")
+    except PackageNotFoundError:
+        package_version = "unknown"
+    checksum = hashlib.sha256(package_version.encode("utf-8"))
+    for module in SHARD_MODULES:
+        checksum.update((Path(__file__).parent / module).read_bytes())
+    return checksum.hexdigest()
+
+
+def plan_shards(plan: SourcePlan, cache_directory: str) -> Optional[Dict[str, Dict[str, Any]]]:
+    """
+    Describe the shards of the mappings of a source plan, from the current state of its source file
+    :param plan: Source plan
+    :param cache_directory: Cache directory
+    :return: Dictionary of the shard of each mapping of the plan (its file name, key, source and mapping names, and
+             the fingerprint of the source file), None if the source file can't be read
+    """
+    source = plan.source
+    # checksums computed by the source cache or for earlier shards are reused
+    index = {**read_index(cache_directory), **read_index(str(shard_directory(cache_directory)))}
+    try:
+        fingerprint = source_fingerprint(source.path, index)
+    except OSError:
+        return None
+    # the Arrow IPC file of a source holds the same rows as the source file
+    source_spec = {name: value for name, value in asdict(source).items() if name not in ("path", "arrow")}
+    shards = {}
+    for mapping in plan.mappings:
+        mapping_spec = {name: value for name, value in asdict(mapping).items() if name not in UNKEYED_MAPPING_FIELDS}
+        description = {
+            "format": SHARD_FORMAT,
+            "code": code_fingerprint(),
+            "sha256": fingerprint["sha256"],
+            "source": source_spec,
+            "mapping": mapping_spec,
+        }
+        key = hashlib.sha256(json.dumps(description, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+        shards[mapping.name] = dict(
+            fingerprint,
+            filename=f"{mapping.name}.{key[:16]}.parquet",
+            key=key,
+            source_name=source.name,
+            mapping=mapping.name,
+        )
+    return shards
+
+
+def read_shard(directory: Path, shard: Dict[str, Any], columns: Optional[List[str]] = None) -> DataFrame:
+    """
+    :param directory: Shard directory
+    :param shard: Shard description, see plan_shards()
+    :param columns: Columns to read (default: all)
+    :return: DataFrame of the mappings of the shard
+    """
+    return pq.read_table(directory / shard["filename"], columns=columns, memory_map=True).to_pandas()
+
+
+def write_shard(directory: Path, shard: Dict[str, Any], mappings: DataFrame):
+    """
+    Save the mappings of a shard, and add the shard to the shard index
+    :param directory: Shard directory
+    :param shard: Shard description, see plan_shards()
+    :param mappings: DataFrame of mappings
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / shard["filename"]
+    temporary_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+    # the index is kept, for the mappings to be loaded as they were generated
+    pq.write_table(pa.Table.from_pandas(mappings), temporary_path)
+    os.replace(temporary_path, path)
+    with _index_lock:
+        index = read_index(str(directory))
+        index[shard["filename"]] = dict(shard, rows=len(mappings), created=datetime.now().isoformat(timespec="seconds"))
+        write_index(str(directory), index)
+
+
+def prune_shards(cache_directory: str, keep: Set[str]) -> List[str]:
+    """
+    Remove the shards which are not to be kept, i.e. which no release of the cache refers to (see register_release())
+    :param cache_directory: Cache directory
+    :param keep: File names of the shards to keep
+    :return: List of the removed shard file names
+    """
+    directory = shard_directory(cache_directory)
+    removed = []
+    with _index_lock:
+        index = read_index(str(directory))
+        for path in sorted(directory.glob("*.parquet")):
+            if path.name not in keep:
+                path.unlink()
+                index.pop(path.name, None)
+                removed.append(path.name)
+        if removed:
+            write_index(str(directory), index)
+    return removed
+
+
+def read_release(path: str) -> Optional[Dict[str, Any]]:
+    """
+    :param path: Path of a release manifest
+    :return: Release manifest, None if there is none
+    """
+    if not Path(path).exists():
+        return None
+    with open(path) as release_file:
+        return json.load(release_file)
+
+
+def write_release(path: str, shards: Dict[str, Dict[str, Any]], changes: Optional[Dict[str, Dict[str, Any]]]):
+    """
+    Atomically replace a release manifest
+    :param path: Path of the release manifest
+    :param shards: Shard of each mapping of the release, see plan_shards()
+    :param changes: Summary of the changes since the previous release, see mapping_changelog()
+    """
+    release = {"created": datetime.now().isoformat(timespec="seconds"), "shards": shards, "changes": changes}
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    with open(temporary_path, "w") as release_file:
+        json.dump(release, release_file, indent=2)
+    os.replace(temporary_path, path)
+
+
+def register_release(cache_directory: str, path: str, shards: Dict[str, Dict[str, Any]]) -> Set[str]:
+    """
+    Record the shards of a release in the list of releases of the cache (RELEASES_FILENAME), which every output
+    directory sharing the cache adds its releases to, the releases whose manifest is gone being dropped
+    :param cache_directory: Cache directory
+    :param path: Path of the release manifest
+    :param shards: Shard of each mapping of the release, see plan_shards()
+    :return: File names of the shards of every release of the cache
+    """
+    directory = shard_directory(cache_directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    releases_path = directory / RELEASES_FILENAME
+    with _index_lock:
+        releases = read_release(str(releases_path)) or {}
+        releases[str(Path(path).resolve())] = sorted(shard["filename"] for shard in shards.values())
+        releases = {release: filenames for release, filenames in releases.items() if Path(release).exists()}
+        temporary_path = releases_path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(temporary_path, "w") as releases_file:
+            json.dump(releases, releases_file, indent=2, sort_keys=True)
+        os.replace(temporary_path, releases_path)
+    return {filename for filenames in releases.values() for filename in filenames}
+
+
+def _triple_hashes(mappings: DataFrame) -> np.ndarray:
+    return pd.util.hash_pandas_object(mappings[TRIPLE_COLUMNS], index=False).to_numpy()
+
+
+def mapping_changelog(
+    previous: Optional[Dict[str, Any]], shards: Dict[str, Dict[str, Any]], directory: Path
+) -> Tuple[Optional[DataFrame], Dict[str, Dict[str, Any]]]:
+    """
+    List the mappings added and removed since the previous release
+    :param previous: Previous release manifest, see read_release()
+    :param shards: Shard of each mapping of the new release, see plan_shards()
+    :param directory: Shard directory
+    :return: Tuple of the changelog DataFrame (see CHANGELOG_COLUMNS, None without a previous release), and of a
+             summary of the changes of each mapping: its status (unchanged, changed, added, removed or unavailable,
+             the shard of the previous release being gone) with the number of mappings added and removed
+    """
+    if previous is None:
+        return None, {}
+    previous_shards = previous.get("shards", {})
+    changes: Dict[str, Dict[str, Any]] = {}
+    frames = []
+    for name in [*shards, *(name for name in previous_shards if name not in shards)]:
+        previous_shard, shard = previous_shards.get(name), shards.get(name)
+        if previous_shard is not None and shard is not None and previous_shard["filename"] == shard["filename"]:
+            changes[name] = {"status": "unchanged", "added": 0, "removed": 0}
+            continue
+        if previous_shard is not None and not (directory / previous_shard["filename"]).exists():
+            changes[name] = {"status": "unavailable", "added": None, "removed": None}
+            continue
+        empty = DataFrame({column: pd.Series(dtype=object) for column in TRIPLE_COLUMNS})
+        before = empty if previous_shard is None else read_shard(directory, previous_shard, TRIPLE_COLUMNS)
+        after = empty if shard is None else read_shard(directory, shard, TRIPLE_COLUMNS)
+        added = after.loc[~np.isin(_triple_hashes(after), _triple_hashes(before))]
+        removed = before.loc[~np.isin(_triple_hashes(before), _triple_hashes(after))]
+        source_name = (shard or previous_shard)["source_name"]
+        for change, triples in [("added", added), ("removed", removed)]:
+            frames.append(triples.astype(object).assign(change=change, source=source_name, mapping=name))
+        if previous_shard is None or shard is None:
+            status = "added" if previous_shard is None else "removed"
+        else:
+            # i.e. the source file changed, but none of the mappings of this shard
+            status = "changed" if len(added) or len(removed) else "unchanged"
+        changes[name] = {"status": status, "added": len(added), "removed": len(removed)}
+
+    changelog = pd.concat(frames, ignore_index=True) if frames else DataFrame(columns=CHANGELOG_COLUMNS)
+    return changelog[CHANGELOG_COLUMNS], changes
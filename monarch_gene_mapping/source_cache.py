@@ -0,0 +1,319 @@
+"""
+Local cache of parsed mapping source files.
+
+Each source file (Alliance, HGNC, gene2ensembl, filtered UniProt...) is parsed once with
+pandas and stored as a typed, column-pruned Parquet file under data/cache. Cache entries are
+keyed by the size, modification time and SHA-256 checksum of the source file, together with
+the pandas read options, so that later runs memory-map the Parquet file instead of parsing
+the (gzip compressed) TSV file again.
+
+A source may also come with an Arrow IPC file of the columns its mappings use, written by its preprocessing (i.e.
+idmapping_filtered.arrow, see uniprot_idmapping_preprocess.write_arrow_file()). While it was written from the
+current version of the source file, it is memory-mapped instead of parsing the source file or reading the cache.
+
+Parquet and Arrow support requires the optional pyarrow package; without it, sources are always parsed from scratch.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+from pandas.core.frame import DataFrame
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - exercised only without pyarrow
+    pa = None
+    pq = None
+
+from monarch_gene_mapping.defaults import DEFAULT_CACHE_DIRECTORY
+from monarch_gene_mapping.uniprot_idmapping_preprocess import ARROW_SOURCE_KEY, arrow_source
+
+INDEX_FILENAME: str = "index.json"
+
+CHECKSUM_BLOCK_SIZE: int = 8 * 1024 * 1024
+
+# Serializes updates of the cache index, i.e. when several sources are parsed concurrently
+_index_lock = threading.Lock()
+
+
+def cache_available() -> bool:
+    """
+    :return: bool, True if the optional pyarrow dependency needed by the source cache is installed
+    """
+    return pq is not None
+
+
+def file_checksum(path: Union[str, Path]) -> str:
+    """
+    Compute the SHA-256 checksum of a file
+    :param path: Path of the file
+    :return: Hexadecimal digest
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(CHECKSUM_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def read_index(cache_directory: str) -> Dict[str, Dict[str, Any]]:
+    """
+    Read the cache index, mapping cache file names to the description of their source
+    :param cache_directory: Directory holding the cache
+    :return: Dictionary of cache entries
+    """
+    index_path = Path(cache_directory) / INDEX_FILENAME
+    if not index_path.exists():
+        return {}
+    with open(index_path) as index_file:
+        return json.load(index_file)
+
+
+def write_index(cache_directory: str, index: Dict[str, Dict[str, Any]]):
+    """
+    Atomically replace the cache index
+    :param cache_directory: Directory holding the cache
+    :param index: Dictionary of cache entries
+    """
+    Path(cache_directory).mkdir(parents=True, exist_ok=True)
+    index_path = Path(cache_directory) / INDEX_FILENAME
+    temporary_path = index_path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(temporary_path, "w") as index_file:
+        json.dump(index, index_file, indent=2, sort_keys=True)
+    os.replace(temporary_path, index_path)
+
+
+def source_fingerprint(source: str, index: Optional[Dict[str, Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """
+    Describe the current state of a source file by its size, modification time and checksum.
+    The checksum of an indexed source with an unchanged size and modification time is reused rather than recomputed.
+    :param source: Path of the source file
+    :param index: Optional cache index to look up previously computed checksums in
+    :return: Dictionary with the path, size, mtime_ns and sha256 of the source
+    """
+    stat = os.stat(source)
+    fingerprint = {"source": str(source), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    for entry in (index or {}).values():
+        if all(entry.get(key) == value for key, value in fingerprint.items()):
+            fingerprint["sha256"] = entry["sha256"]
+            break
+    else:
+        fingerprint["sha256"] = file_checksum(source)
+    return fingerprint
+
+
+def cache_key(fingerprint: Dict[str, Any], read_options: Dict[str, Any]) -> str:
+    """
+    Key of a cache entry: the source checksum combined with the options it was parsed with
+    :param fingerprint: Source fingerprint, see source_fingerprint()
+    :param read_options: pd.read_csv keyword arguments
+    :return: Hexadecimal key
+    """
+    options = json.dumps(read_options, sort_keys=True, default=str)
+    return hashlib.sha256(f"{fingerprint['sha256']}\n{options}".encode("utf-8")).hexdigest()
+
+
+def _to_pandas(table, start: int = 0) -> DataFrame:
+    df = table.to_pandas()
+    # pyarrow restores missing values of plain object columns as None, pd.read_csv gives NaN
+    for column in df.columns[df.dtypes == object]:
+        df[column] = df[column].fillna(np.nan)
+    df.index = pd.RangeIndex(start, start + len(df))
+    return df
+
+
+def _iter_cached(path: Path, chunksize: int) -> Iterator[DataFrame]:
+    parquet_file = pq.ParquetFile(path, memory_map=True)
+    start = 0
+    for batch in parquet_file.iter_batches(batch_size=chunksize):
+        df = _to_pandas(pa.Table.from_batches([batch]), start)
+        start += len(df)
+        yield df
+
+
+def _iter_table(table, chunksize: int) -> Iterator[DataFrame]:
+    for start in range(0, table.num_rows, chunksize):
+        yield _to_pandas(table.slice(start, chunksize), start)
+
+
+def read_arrow(
+    path: str, source: str, usecols: Optional[List[str]] = None, chunksize: Optional[int] = None
+) -> Optional[Union[DataFrame, Iterator[DataFrame]]]:
+    """
+    Memory-map the Arrow IPC file of a source, if it was written from the current version of the source file
+    :param path: Path of the Arrow IPC file
+    :param source: Path of the source file
+    :param usecols: Columns to read (default: all)
+    :param chunksize: Optional number of rows per chunk
+    :return: DataFrame (or iterator of DataFrame chunks if chunksize is given) of the columns in the order of the
+             source file, as pd.read_csv reads them; None if the file is missing, out of date or lacks a column
+    """
+    if pa is None or not Path(path).exists() or not Path(source).exists():
+        return None
+    try:
+        table = pa.ipc.open_file(pa.memory_map(path)).read_all()
+    except (OSError, pa.ArrowException):
+        return None
+    if (table.schema.metadata or {}).get(ARROW_SOURCE_KEY) != json.dumps(arrow_source(source)).encode("utf-8"):
+        return None
+    if usecols is not None:
+        if set(usecols) - set(table.column_names):
+            return None
+        table = table.select([name for name in table.column_names if name in usecols])
+    if chunksize:
+        return _iter_table(table, chunksize)
+    return _to_pandas(table)
+
+
+def _iter_caching(
+    source: str,
+    cache_directory: str,
+    filename: str,
+    entry: Dict[str, Any],
+    read_options: Dict[str, Any],
+    chunksize: int,
+) -> Iterator[DataFrame]:
+    path = Path(cache_directory) / filename
+    temporary_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+    writer = None
+    caching = True
+    rows = 0
+    try:
+        for chunk in pd.read_csv(source, chunksize=chunksize, **read_options):
+            if caching:
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(temporary_path, table.schema)
+                try:
+                    writer.write_table(table.cast(writer.schema))
+                except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+                    # column types inferred from this chunk differ from the earlier ones: give up on caching
+                    caching = False
+            rows += len(chunk)
+            yield chunk
+        if caching and writer is not None:
+            writer.close()
+            writer = None
+            os.replace(temporary_path, path)
+            _add_entry(cache_directory, filename, dict(entry, rows=rows))
+    finally:
+        if writer is not None:
+            writer.close()
+        if temporary_path.exists():
+            temporary_path.unlink()
+
+
+def _add_entry(cache_directory: str, filename: str, entry: Dict[str, Any]):
+    with _index_lock:
+        index = read_index(cache_directory)
+        index[filename] = dict(entry, created=datetime.now().isoformat(timespec="seconds"))
+        write_index(cache_directory, index)
+
+
+def read_source(
+    source: str,
+    cache_directory: Optional[str] = DEFAULT_CACHE_DIRECTORY,
+    chunksize: Optional[int] = None,
+    arrow: Optional[str] = None,
+    **read_options,
+) -> Union[DataFrame, Iterator[DataFrame]]:
+    """
+    Drop-in replacement for pd.read_csv which goes through the local source cache.
+    :param source: Path of the (possibly gzip compressed) TSV source file
+    :param cache_directory: Directory holding the cache; None to disable caching
+    :param chunksize: Optional number of rows per chunk, as for pd.read_csv
+    :param arrow: Optional path of an Arrow IPC file of the source, read instead if up to date (see read_arrow())
+    :param read_options: pd.read_csv keyword arguments (prune columns with usecols to keep entries small)
+    :return: DataFrame, or iterator of DataFrame chunks if chunksize is given
+    """
+    if arrow is not None:
+        df = read_arrow(arrow, source, read_options.get("usecols"), chunksize)
+        if df is not None:
+            return df
+    if cache_directory is None or not cache_available():
+        return pd.read_csv(source, chunksize=chunksize, **read_options)
+
+    with _index_lock:
+        index = read_index(cache_directory)
+    fingerprint = source_fingerprint(source, index)
+    key = cache_key(fingerprint, read_options)
+    filename = f"{Path(source).name}.{key[:16]}.parquet"
+    path = Path(cache_directory) / filename
+    entry = dict(fingerprint, read_options=json.loads(json.dumps(read_options, default=str)), key=key)
+
+    if path.exists():
+        if chunksize:
+            return _iter_cached(path, chunksize)
+        return _to_pandas(pq.read_table(path, memory_map=True))
+
+    Path(cache_directory).mkdir(parents=True, exist_ok=True)
+    if chunksize:
+        return _iter_caching(source, cache_directory, filename, entry, read_options, chunksize)
+    df = pd.read_csv(source, **read_options)
+    temporary_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+    pq.write_table(pa.Table.from_pandas(df, preserve_index=False), temporary_path)
+    os.replace(temporary_path, path)
+    _add_entry(cache_directory, filename, dict(entry, rows=len(df)))
+    return df
+
+
+def verify_cache(cache_directory: str = DEFAULT_CACHE_DIRECTORY, checksum: bool = False) -> List[Dict[str, Any]]:
+    """
+    Check each cache entry against its cache file and its source file
+    :param cache_directory: Directory holding the cache
+    :param checksum: Also recompute the checksum of sources whose size and modification time are unchanged
+    :return: List of cache entries, each with an added 'filename' and 'status' ('ok', 'stale', 'missing source'
+             or 'corrupt'), plus one 'orphan' entry for each cache file missing from the index
+    """
+    index = read_index(cache_directory)
+    results = []
+    for filename, entry in sorted(index.items()):
+        path = Path(cache_directory) / filename
+        status = "ok"
+        if not Path(entry["source"]).exists():
+            status = "missing source"
+        else:
+            stat = os.stat(entry["source"])
+            if stat.st_size != entry["size"]:
+                status = "stale"
+            elif checksum or stat.st_mtime_ns != entry["mtime_ns"]:
+                if file_checksum(entry["source"]) != entry["sha256"]:
+                    status = "stale"
+        try:
+            if pq.ParquetFile(path).metadata.num_rows != entry["rows"]:
+                status = "corrupt"
+        except (OSError, pa.ArrowException):
+            status = "corrupt"
+        results.append(dict(entry, filename=filename, status=status))
+    for path in sorted(Path(cache_directory).glob("*.parquet")):
+        if path.name not in index:
+            results.append({"filename": path.name, "status": "orphan"})
+    return results
+
+
+def prune_cache(cache_directory: str = DEFAULT_CACHE_DIRECTORY, remove_all: bool = False) -> List[str]:
+    """
+    Remove cache entries which can no longer be used (stale, corrupt, orphaned or without a source file)
+    :param cache_directory: Directory holding the cache
+    :param remove_all: Remove every entry, whatever its status
+    :return: List of the removed cache file names
+    """
+    removed = []
+    with _index_lock:
+        index = read_index(cache_directory)
+        for result in verify_cache(cache_directory):
+            if remove_all or result["status"] != "ok":
+                (Path(cache_directory) / result["filename"]).unlink(missing_ok=True)
+                index.pop(result["filename"], None)
+                removed.append(result["filename"])
+        if Path(cache_directory).exists():
+            write_index(cache_directory, index)
+    return removed
@@ -0,0 +1,220 @@
+"""
+Writer of SSSOM TSV mapping files.
+
+The file starts with the SSSOM metadata block (YAML lines commented out with '#', i.e. the curie_map of the
+prefixes used, mapping_set_id and license), followed by the mappings as TSV. The mappings are written batch by
+batch: each batch is serialized with the Arrow CSV writer when the optional pyarrow package is installed (with
+pandas' to_csv otherwise, or when a batch holds values which need quoting, so that the output is always the one of
+to_csv), then optionally compressed. Batches are serialized and compressed in worker threads, both releasing the
+GIL, and written in order as consecutive gzip members or zstd frames, which decompress as a single stream.
+
+The mappings can also be saved, with pyarrow, as a Parquet file and/or an Arrow IPC file, sorted by subject_id so
+that the row group statistics let readers skip the subject prefixes they don't need, the term columns dictionary
+encoded and the SSSOM metadata kept in the schema metadata. The Arrow IPC file is uncompressed, to be memory-mapped.
+"""
+
+import gzip
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+import yaml
+from pandas.core.frame import DataFrame
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pa_csv
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - exercised only without pyarrow
+    pa = None
+    pc = None
+    pa_csv = None
+    pq = None
+
+from monarch_gene_mapping.curie_utils import split_curies
+
+# Compressions, with the suffix they add to the file name
+COMPRESSIONS: Dict[str, str] = {"gzip": ".gz", "zstd": ".zst"}
+GZIP_LEVEL: int = 6
+ZSTD_LEVEL: int = 3
+
+BATCH_SIZE: int = 250_000
+
+# Output formats, with the suffix of their file name; all but tsv require pyarrow
+OUTPUT_FORMATS: Dict[str, str] = {"tsv": ".sssom.tsv", "parquet": ".sssom.parquet", "arrow": ".sssom.arrow"}
+# Rows per Parquet row group (and Arrow record batch), small enough for the statistics to skip most of the file
+ROW_GROUP_SIZE: int = 100_000
+# Schema metadata key of the SSSOM metadata (as YAML) in Parquet and Arrow IPC files
+SSSOM_METADATA_KEY: bytes = b"sssom_metadata"
+
+# characters the Arrow CSV writer can't write unquoted, to_csv quoting the values holding them
+QUOTED_CHARACTERS: str = '[\t\r\n"]'
+
+
+def arrow_available() -> bool:
+    """
+    :return: bool, True if the optional pyarrow dependency needed by the Parquet and Arrow outputs is installed
+    """
+    return pa is not None
+
+
+def sssom_header(metadata: Dict[str, Any]) -> str:
+    """
+    :param metadata: SSSOM mapping set metadata
+    :return: Metadata block of an SSSOM TSV file
+    """
+    lines = yaml.safe_dump(metadata, sort_keys=False, default_flow_style=False, allow_unicode=True).splitlines()
+    return "".join(f"#{line}\n" for line in lines)
+
+
+def curie_map(mappings: DataFrame, converter: Any, columns: List[str]) -> Dict[str, str]:
+    """
+    :param mappings: DataFrame of mappings
+    :param converter: curies.Converter
+    :param columns: Columns of CURIEs
+    :return: Dictionary of the URI prefix of each CURIE prefix used in the columns, which the converter knows
+    """
+    prefixes = set()
+    for column in columns:
+        values = mappings[column]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            values = values.cat.categories
+        distinct, codes, _, invalid = split_curies(np.asarray(values, dtype=object), converter.delimiter)
+        prefixes.update(distinct[np.unique(codes[~invalid])])
+    return {prefix: converter.prefix_map[prefix] for prefix in sorted(prefixes) if prefix in converter.prefix_map}
+
+
+def _serialize(batch: DataFrame) -> bytes:
+    """
+    :param batch: DataFrame of mappings
+    :return: TSV lines of the mappings, as written by to_csv
+    """
+    if pa_csv is not None:
+        table = pa.Table.from_pandas(batch, preserve_index=False)
+        if all(pa.types.is_string(column.type) or pa.types.is_dictionary(column.type) for column in table.columns):
+            table = table.cast(pa.schema([pa.field(name, pa.string()) for name in table.column_names]))
+            if not any(pc.any(pc.match_substring_regex(column, QUOTED_CHARACTERS)).as_py() for column in table.columns):
+                sink = pa.BufferOutputStream()
+                options = pa_csv.WriteOptions(include_header=False, delimiter="\t", quoting_style="none")
+                pa_csv.write_csv(table, sink, options)
+                return sink.getvalue().to_pybytes()
+    return batch.to_csv(sep="\t", index=False, header=False).encode("utf-8")
+
+
+def _compressor(compression: Optional[str]) -> Callable[[bytes], bytes]:
+    if compression is None:
+        return lambda data: data
+    if compression == "gzip":
+        # a null timestamp keeps the archive identical from one run to the next
+        return lambda data: gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+    if compression == "zstd":
+        if pa is None:
+            raise ValueError("zstd compression requires pyarrow, please install it first")
+        codec = pa.Codec("zstd", compression_level=ZSTD_LEVEL)
+        return lambda data: codec.compress(data, asbytes=True)
+    raise ValueError(f"Unknown compression '{compression}', expected one of {', '.join(COMPRESSIONS)}")
+
+
+def _replace(path: str, write: Callable[[str], None]):
+    """
+    Write a file through a temporary file, replacing it atomically
+    :param path: Path of the file
+    :param write: Function writing the file at the path it is given
+    """
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    temporary_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        write(temporary_path)
+        os.replace(temporary_path, path)
+    finally:
+        Path(temporary_path).unlink(missing_ok=True)
+
+
+def write_sssom_tsv(
+    mappings: DataFrame,
+    path: str,
+    metadata: Optional[Dict[str, Any]] = None,
+    compression: Optional[str] = None,
+    threads: int = 1,
+    batch_size: int = BATCH_SIZE,
+):
+    """
+    Write mappings as an SSSOM TSV file, replacing it atomically
+    :param mappings: DataFrame of mappings, its columns being strings (or categoricals of strings)
+    :param path: Path of the file
+    :param metadata: SSSOM mapping set metadata written at the top of the file (none if omitted)
+    :param compression: None, 'gzip' or 'zstd' (which requires pyarrow)
+    :param threads: Number of threads serializing and compressing batches of mappings
+    :param batch_size: Number of mappings per batch
+    """
+    compress = _compressor(compression)
+    threads = max(threads, 1)
+    header = (sssom_header(metadata) if metadata else "") + "\t".join(mappings.columns) + "\n"
+
+    def block(start: int) -> bytes:
+        return compress(_serialize(mappings.iloc[start : start + batch_size]))
+
+    def write(temporary_path: str):
+        with open(temporary_path, "wb") as sssom_file, ThreadPoolExecutor(threads) as executor:
+            sssom_file.write(compress(header.encode("utf-8")))
+            pending: deque = deque()
+            for start in range(0, len(mappings), batch_size):
+                pending.append(executor.submit(block, start))
+                # bound the number of batches held in memory
+                if len(pending) >= 2 * threads:
+                    sssom_file.write(pending.popleft().result())
+            while pending:
+                sssom_file.write(pending.popleft().result())
+
+    _replace(path, write)
+
+
+def mappings_table(mappings: DataFrame, metadata: Optional[Dict[str, Any]] = None):
+    """
+    :param mappings: DataFrame of mappings
+    :param metadata: SSSOM mapping set metadata
+    :return: pyarrow Table of the mappings sorted by subject_id (keeping the order of the mappings of a subject),
+             categoricals being dictionary encoded, with the SSSOM metadata as schema metadata
+    """
+    if pa is None:
+        raise ValueError("Parquet and Arrow outputs require pyarrow, please install it first")
+    table = pa.Table.from_pandas(mappings, preserve_index=False)
+    table = table.take(pc.sort_indices(table, sort_keys=[("subject_id", "ascending")]))
+    schema_metadata = {SSSOM_METADATA_KEY: yaml.safe_dump(metadata or {}, sort_keys=False).encode("utf-8")}
+    return table.replace_schema_metadata(schema_metadata)
+
+
+def write_sssom_parquet(table, path: str, row_group_size: int = ROW_GROUP_SIZE):
+    """
+    Write mappings as a Parquet file, with dictionary encoding and row group statistics
+    :param table: pyarrow Table of mappings, see mappings_table()
+    :param path: Path of the file
+    :param row_group_size: Number of rows per row group
+    """
+    _replace(
+        path,
+        lambda temporary_path: pq.write_table(
+            table, temporary_path, row_group_size=row_group_size, use_dictionary=True, write_statistics=True
+        ),
+    )
+
+
+def write_sssom_arrow(table, path: str, batch_size: int = ROW_GROUP_SIZE):
+    """
+    Write mappings as an (uncompressed, memory-mappable) Arrow IPC file
+    :param table: pyarrow Table of mappings, see mappings_table()
+    :param path: Path of the file
+    :param batch_size: Number of rows per record batch
+    """
+
+    def write(temporary_path: str):
+        with pa.OSFile(temporary_path, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table, max_chunksize=batch_size)
+
+    _replace(path, write)
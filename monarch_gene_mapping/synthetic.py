@@ -0,0 +1,232 @@
+"""
+Deterministic synthetic versions of the mapping source files (Alliance, HGNC, gene2ensembl and the UniProt
+ID mapping archive), at any scale, for benchmarking and testing the mapping pipeline without downloading it.
+
+Files are written under a root directory with the layout of the real downloads (see download.yaml), so that
+the mapping specification reads them as they are. Rows are generated and written in blocks, each block from its
+own random generator seeded with (seed, source, block), so that the output only depends on the seed, the
+number of rows and the block size, and a 60M row file is written with the memory needed by a single block.
+"""
+
+import gzip
+import io
+import json
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+from pandas.core.frame import DataFrame
+
+from monarch_gene_mapping.cli_utils import UNIPROT_ID_MAPPING_SELECTED_COLUMNS
+
+BLOCK_SIZE: int = 1_000_000
+METADATA_FILENAME: str = "synthetic.json"
+
+ALLIANCE_COLUMNS: List[str] = [
+    "GeneID",
+    "GlobalCrossReferenceID",
+    "CrossReferenceCompleteURL",
+    "ResourceDescriptorPage",
+    "TaxonID",
+]
+HGNC_COLUMNS: List[str] = (
+    "hgnc_id symbol name locus_group locus_type status location location_sortable alias_symbol alias_name "
+    "prev_symbol prev_name gene_group gene_group_id date_approved_reserved date_symbol_changed date_name_changed "
+    "date_modified entrez_id ensembl_gene_id vega_id ucsc_id ena refseq_accession ccds_id uniprot_ids pubmed_id "
+    "mgd_id rgd_id lsdb cosmic omim_id mirbase homeodb snornabase bioparadigms_slc orphanet pseudogene.org horde_id "
+    "merops imgt iuphar kznf_gene_catalog mamit-trnadb cd lncrnadb enzyme_id intermediate_filament_db "
+    "rna_central_ids lncipedia gtrnadb agr mane_select gencc"
+).split()
+NCBI_COLUMNS: List[str] = [
+    "#tax_id",
+    "GeneID",
+    "Ensembl_gene_identifier",
+    "RNA_nucleotide_accession.version",
+    "Ensembl_rna_identifier",
+    "protein_accession.version",
+    "Ensembl_protein_identifier",
+]
+
+# Model organism gene CURIE prefixes of the Alliance file, with their taxon
+ALLIANCE_GENES: Dict[str, str] = {
+    "MGI:": "NCBITaxon:10090",
+    "RGD:": "NCBITaxon:10116",
+    "FB:FBgn": "NCBITaxon:7227",
+    "WB:WBGene": "NCBITaxon:6239",
+    "ZFIN:ZDB-GENE-": "NCBITaxon:7955",
+    "Xenbase:XB-GENE-": "NCBITaxon:8364",
+    "SGD:S": "NCBITaxon:559292",
+    "HGNC:": "NCBITaxon:9606",
+}
+ALLIANCE_XREFS: List[str] = ["ENSEMBL:ENSG", "NCBI_Gene:", "UniProtKB:P", "PANTHER:PTHR", "RNAcentral:URS"]
+
+# Taxa of the gene2ensembl and UniProt files: the ones mapped, and others filtered out along the way
+NCBI_TAXA: List[int] = [9031, 9615, 9913, 9823, 227321, 9606, 10090, 10116, 7955]
+UNIPROT_TAXA: List[int] = [9606, 10090, 9615, 9913, 9823, 10116, 9031, 7955, 7227, 562, 1280, 83333, 3702, 4577]
+
+
+def _strings(prefix: str, numbers: np.ndarray, width: int = 0) -> pd.Series:
+    numbers = pd.Series(numbers).astype(str)
+    return prefix + (numbers.str.zfill(width) if width else numbers)
+
+
+def _lists(rng: np.random.Generator, prefix: str, rows: int, share: float, delimiter: str) -> pd.Series:
+    """
+    Identifiers, a share of them being pairs of identifiers joined by the delimiter
+    """
+    values = _strings(prefix, rng.integers(1, 10**6, rows), 6)
+    pairs = rng.random(rows) < share
+    values[pairs] = values[pairs] + delimiter + _strings(prefix, rng.integers(1, 10**6, int(pairs.sum())), 6)
+    return values
+
+
+def _missing(rng: np.random.Generator, values: pd.Series, share: float) -> pd.Series:
+    return values.where(rng.random(len(values)) >= share)
+
+
+def alliance_block(rng: np.random.Generator, start: int, rows: int) -> DataFrame:
+    genes = np.array(list(ALLIANCE_GENES))[rng.integers(0, len(ALLIANCE_GENES), rows)]
+    gene_ids = pd.Series(genes, dtype=object) + pd.Series(rng.integers(1, 10**7, rows)).astype(str).str.zfill(7)
+    xrefs = pd.Series(np.array(ALLIANCE_XREFS)[rng.integers(0, len(ALLIANCE_XREFS), rows)], dtype=object)
+    xref_ids = xrefs + pd.Series(rng.integers(1, 10**8, rows)).astype(str)
+    # genes also cross reference themselves
+    itself = rng.random(rows) < 0.1
+    xref_ids[itself] = gene_ids[itself]
+    df = DataFrame(
+        {
+            "GeneID": gene_ids,
+            "GlobalCrossReferenceID": xref_ids,
+            "CrossReferenceCompleteURL": "https://example.org/" + xref_ids,
+            "ResourceDescriptorPage": "default",
+            "TaxonID": pd.Series(genes).map(ALLIANCE_GENES),
+        }
+    )
+    return df[ALLIANCE_COLUMNS]
+
+
+def hgnc_block(rng: np.random.Generator, start: int, rows: int) -> DataFrame:
+    df = DataFrame(index=range(rows), columns=HGNC_COLUMNS, dtype=object)
+    numbers = np.arange(start + 1, start + rows + 1)
+    df["hgnc_id"] = _strings("HGNC:", numbers)
+    df["symbol"] = _strings("GENE", numbers)
+    df["status"] = "Approved"
+    df["entrez_id"] = _missing(rng, _strings("", rng.integers(1, 10**6, rows)), 0.05)
+    df["ensembl_gene_id"] = _missing(rng, _strings("ENSG", rng.integers(1, 10**6, rows), 11), 0.1)
+    df["omim_id"] = _missing(rng, _lists(rng, "", rows, 0.05, "|"), 0.6)
+    df["uniprot_ids"] = _missing(rng, _lists(rng, "P", rows, 0.1, "|"), 0.5)
+    return df
+
+
+def ncbi_block(rng: np.random.Generator, start: int, rows: int) -> DataFrame:
+    df = DataFrame(
+        {
+            "#tax_id": np.array(NCBI_TAXA)[rng.integers(0, len(NCBI_TAXA), rows)],
+            "GeneID": rng.integers(1, 10**9, rows),
+            "Ensembl_gene_identifier": _strings("ENSGALG", rng.integers(1, 10**6, rows), 11),
+            "RNA_nucleotide_accession.version": _strings("NM_", rng.integers(1, 10**6, rows), 6) + ".1",
+            "Ensembl_rna_identifier": _strings("ENSGALT", rng.integers(1, 10**6, rows), 11) + ".1",
+            "protein_accession.version": _strings("NP_", rng.integers(1, 10**6, rows), 6) + ".1",
+            "Ensembl_protein_identifier": _strings("ENSGALP", rng.integers(1, 10**6, rows), 11) + ".1",
+        }
+    )
+    return df[NCBI_COLUMNS]
+
+
+def uniprot_block(rng: np.random.Generator, start: int, rows: int) -> DataFrame:
+    df = DataFrame(index=range(rows), columns=UNIPROT_ID_MAPPING_SELECTED_COLUMNS, dtype=object)
+    accessions = _strings("A0A", np.arange(start, start + rows), 7)
+    df["UniProtKB-AC"] = accessions
+    df["UniProtKB-ID"] = accessions + "_SYNTH"
+    df["GeneID"] = _missing(rng, _lists(rng, "", rows, 0.03, "; "), 0.3)
+    df["RefSeq"] = _missing(rng, _strings("XP_", rng.integers(1, 10**6, rows), 9) + ".1", 0.5)
+    df["GO"] = "GO:0005886; GO:0016021"
+    df["UniRef100"] = "UniRef100_" + accessions
+    df["NCBI-taxon"] = np.array(UNIPROT_TAXA)[rng.integers(0, len(UNIPROT_TAXA), rows)]
+    return df
+
+
+# Block generators and location (relative to the root directory) of each source file
+SOURCES: Dict[str, Callable[[np.random.Generator, int, int], DataFrame]] = {
+    "alliance": alliance_block,
+    "hgnc": hgnc_block,
+    "ncbi": ncbi_block,
+    "uniprot": uniprot_block,
+}
+SOURCE_PATHS: Dict[str, str] = {
+    "alliance": "data/alliance/GENECROSSREFERENCE_COMBINED.tsv.gz",
+    "hgnc": "data/hgnc/hgnc_complete_set.txt",
+    "ncbi": "data/ncbi/gene2ensembl.gz",
+    # the raw archive, to be filtered down to idmapping_filtered.tsv.gz by the UniProt prefilter
+    "uniprot": "data/uniprot/idmapping_selected.tab.gz",
+}
+
+
+def source_blocks(source: str, rows: int, seed: int = 0, block_size: int = BLOCK_SIZE) -> Iterator[DataFrame]:
+    """
+    Generate the rows of a synthetic source file, block by block
+    :param source: Source name, one of SOURCES
+    :param rows: Number of rows
+    :param seed: Random seed
+    :param block_size: Number of rows per block
+    :return: Iterator of DataFrame blocks
+    """
+    source_index = list(SOURCES).index(source)
+    for block, start in enumerate(range(0, rows, block_size)):
+        rng = np.random.default_rng([seed, source_index, block])
+        yield SOURCES[source](rng, start, min(block_size, rows - start))
+
+
+def _open_text(path: Path) -> io.TextIOBase:
+    if path.suffix == ".gz":
+        # a null gzip timestamp keeps the archive identical from one run to the next
+        return io.TextIOWrapper(gzip.GzipFile(filename=str(path), mode="wb", compresslevel=1, mtime=0))
+    return open(path, "w")
+
+
+def write_source(source: str, path: str, rows: int, seed: int = 0, block_size: int = BLOCK_SIZE):
+    """
+    Write a synthetic source file in the format of the real one
+    :param source: Source name, one of SOURCES
+    :param path: Path of the file, gzip compressed if it ends with .gz
+    :param rows: Number of rows
+    :param seed: Random seed
+    :param block_size: Number of rows generated at a time
+    """
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with _open_text(Path(path)) as file:
+        if source == "alliance":
+            file.write(
+                "#########################\n# Synthetic Alliance gene cross references\n#########################\n"
+            )
+        for block_number, block in enumerate(source_blocks(source, rows, seed, block_size)):
+            # the UniProt ID mapping archive lacks a header line
+            header = block_number == 0 and source != "uniprot"
+            block.to_csv(file, sep="\t", index=False, header=header)
+
+
+def generate_sources(
+    root: str, rows: int, seed: int = 0, sources: Optional[List[str]] = None, block_size: int = BLOCK_SIZE
+) -> Dict[str, str]:
+    """
+    Write synthetic source files under a root directory, unless the ones there were generated with the same settings
+    :param root: Root directory, the files being written to the paths of SOURCE_PATHS
+    :param rows: Number of rows of each source file
+    :param seed: Random seed
+    :param sources: Names of the sources to generate (default: all)
+    :param block_size: Number of rows generated at a time
+    :return: Dictionary of the paths of the source files, by source name
+    """
+    metadata_path = Path(root) / METADATA_FILENAME
+    metadata = json.loads(metadata_path.read_text()) if metadata_path.exists() else {}
+    paths = {}
+    for source in sources or list(SOURCES):
+        path = Path(root) / SOURCE_PATHS[source]
+        settings = {"rows": rows, "seed": seed}
+        if metadata.get(source) != settings or not path.exists():
+            print(f"Generating {rows} rows of synthetic {source} data in {path}")
+            write_source(source, str(path), rows, seed, block_size)
+            metadata[source] = settings
+            metadata_path.write_text(json.dumps(metadata, indent=2, sort_keys=True))
+        paths[source] = str(path)
+    return paths
@@ -5,63 +5,495 @@ mapping input file (i.e. data/uniprot/idmapping_selected.tab.gz)
 The script takes about 9 minutes to filter the input dataset containing
 ~60 million original entries, down to ~1.2 million (of taxon-specific) entries.
 """
-from os import sep
+
+from os import getpid, listdir, makedirs, remove, rmdir, sep, stat, replace
+from os.path import exists
 
 from sys import stderr
 import argparse
+import json
 
-from gzip import open as gzip_open, BadGzipFile
+from gzip import open as gzip_open, BadGzipFile, GzipFile
 
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing
 from datetime import datetime
+from functools import lru_cache, partial
+from hashlib import sha256
+from queue import Queue, Full
+from shutil import copyfile, copyfileobj
+from threading import Thread, Event
+import time
 
-from typing import Optional, List, Set
-
-# Hard-coded list of target species (TODO: externalize this list in a configuration file?)
-target_species: Set = {
-    "9606",  # Homo sapiens
-    "10090",  # Mus musculus (mouse)
-    "9615",  # Canis lupus familiaris - domestic dog
-    # "9685", # Felis catus - domestic cat
-    "9913",  # Bos taurus - cow
-    "9823",  # Sus scrofa - pig
-    "10116",  # Rattus norvegicus (Norway rat)
-    "9031",  # Gallus gallus
-    "8364",  # Xenopus tropicalis - tropical clawed frog
-    "7955",  # Danio rerio (Zebrafish)
-    "7227",  # Drosophila melanogaster (fruit fly)
-    "6239",  # Caenorhabditus elegans
-    "44689",  # Dictylostelium
-    "227321",  # Emericella nidulans (strain FGSC A4 etc.) (Aspergillus nidulans)
-    "4896",  # Schizosaccharomyces pombe ("fission" yeast)
-    "4932",  # Saccharomyces cerevisiae (baker's "budding" yeast)
-}
+from monarch_gene_mapping.instrumentation import record_rows
+from monarch_gene_mapping.mapping_spec import DEFAULT_MAPPING_SPEC, load_mapping_spec
+
+from typing import Any, Dict, Optional, List, Set, FrozenSet, Iterable, Iterator, Tuple
 
 # idmapping_selected.tab field 13 is column 12 in TSV array...
 UNIPROT_ID_MAPPING_NCBI_TAXON_COLUMN = 12
 
+# Columns of the Arrow IPC file written next to the filtered archive (the ones the mappings use), with their
+# position in the archive and their Arrow type
+ARROW_COLUMNS: Dict[str, Tuple[int, str]] = {
+    "UniProtKB-AC": (0, "string"),
+    "GeneID": (2, "string"),
+    "NCBI-taxon": (UNIPROT_ID_MAPPING_NCBI_TAXON_COLUMN, "int64"),
+}
+# Values read as missing, as pandas.read_csv does by default
+NA_VALUES: List[str] = [
+    "",
+    "#N/A",
+    "#N/A N/A",
+    "#NA",
+    "-1.#IND",
+    "-1.#QNAN",
+    "-NaN",
+    "-nan",
+    "1.#IND",
+    "1.#QNAN",
+    "<NA>",
+    "N/A",
+    "NA",
+    "NULL",
+    "NaN",
+    "None",
+    "n/a",
+    "nan",
+    "null",
+]
+# Schema metadata key of the size and modification time of the archive an Arrow IPC file was written from
+ARROW_SOURCE_KEY: bytes = b"source"
+
+
+@lru_cache(maxsize=None)
+def prefilter_species(spec_path: str = DEFAULT_MAPPING_SPEC) -> FrozenSet[str]:
+    """
+    Target species, configured as 'uniprot_prefilter_taxa' in the mapping specification (read on first use)
+    :param spec_path: str, path of the mapping specification
+    :return: FrozenSet[str], NCBI taxon identifiers kept by the prefilter
+    """
+    return frozenset(str(taxon) for taxon in load_mapping_spec(spec_path).uniprot_prefilter_taxa)
+
 
-def target_taxon(line: Optional[str]) -> bool:
+def target_taxon(line: Optional[str], species: Optional[Set[str]] = None) -> bool:
     if not line:
         return False
     part: List[str] = line.split("\t")
-    if part[UNIPROT_ID_MAPPING_NCBI_TAXON_COLUMN] in target_species:
+    if part[UNIPROT_ID_MAPPING_NCBI_TAXON_COLUMN] in (prefilter_species() if species is None else species):
         return True
     else:
         return False
 
 
-PROGRESS_MONITOR_INCR: int = 1000
+# Approximate size of the newline-aligned chunks of decompressed data handed to the filter workers
+CHUNK_SIZE: int = 32 * 1024 * 1024
+# Seconds between two progress messages
+PROGRESS_INTERVAL: float = 2.0
+
+# Number of chunks buffered between the decompression thread and the filter workers, per worker
+CHUNKS_IN_FLIGHT_PER_WORKER: int = 2
+
+# Approximate number of uncompressed bytes between two line boundaries of the shard index (and two access points of
+# its indexed_gzip index), the granularity of the shards of the source file
+INDEX_SPACING: int = CHUNK_SIZE
+
+
+def target_taxon_bytes(line: bytes, species: FrozenSet[bytes]) -> bool:
+    """
+    Byte-level equivalent of target_taxon(), which only splits the line as far as the NCBI taxon field.
+    :param line: bytes, one raw line of the idmapping selected file
+    :param species: FrozenSet[bytes], encoded NCBI taxon identifiers to keep
+    :return: bool, True if the line belongs to one of the target species
+    """
+    part: List[bytes] = line.split(b"\t", UNIPROT_ID_MAPPING_NCBI_TAXON_COLUMN + 1)
+    return len(part) > UNIPROT_ID_MAPPING_NCBI_TAXON_COLUMN and part[UNIPROT_ID_MAPPING_NCBI_TAXON_COLUMN] in species
+
+
+def filter_chunk(chunk: bytes, species: FrozenSet[bytes]) -> Tuple[bytes, int, int]:
+    """
+    Filters a newline-aligned chunk of raw idmapping selected data against the target list of taxa.
+    :param chunk: bytes, complete lines of the source file (the last line may lack its newline at end of file)
+    :param species: FrozenSet[bytes], encoded NCBI taxon identifiers to keep
+    :return: Tuple[bytes, int, int], kept lines (in their original order), number of lines read, number of lines kept
+    """
+    lines: List[bytes] = chunk.split(b"\n")
+    # a chunk ending with a newline leaves a trailing empty string behind
+    unterminated: bytes = lines.pop()
+    kept: List[bytes] = [line for line in lines if target_taxon_bytes(line, species)]
+    data: bytes = b"\n".join(kept) + b"\n" if kept else b""
+    lines_read: int = len(lines)
+    if unterminated:
+        lines_read += 1
+        if target_taxon_bytes(unterminated, species):
+            kept.append(unterminated)
+            data += unterminated
+    return data, lines_read, len(kept)
+
+
+class DigestReader:
+    """
+    Read-only binary file wrapper which feeds everything read through it into a hash (i.e. hashlib.sha256()).
+    """
+
+    def __init__(self, file, digest):
+        self.file = file
+        self.digest = digest
+        self.mode = "rb"
+
+    def read(self, size: int = -1) -> bytes:
+        data: bytes = self.file.read(size)
+        self.digest.update(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def open_indexed_archive(source_gz_file_path: str, **kwargs):
+    """
+    :param source_gz_file_path: str, path to the gzip compressed file
+    :param kwargs: indexed_gzip.IndexedGzipFile keyword arguments, i.e. spacing or index_file
+    :return: indexed_gzip.IndexedGzipFile of the archive, which seeks through access points instead of decompressing
+             everything before the offset sought; None without the optional indexed_gzip package
+    """
+    try:
+        import indexed_gzip
+    except ImportError:
+        return None
+    return indexed_gzip.IndexedGzipFile(source_gz_file_path, **kwargs)
+
+
+def read_chunks(
+    source_gz_file_path: str,
+    chunk_size: int = CHUNK_SIZE,
+    max_queued: int = 4,
+    digest=None,
+    source_file=None,
+    start: int = 0,
+    end: Optional[int] = None,
+    gzip_index: Optional[str] = None,
+) -> Iterator[bytes]:
+    """
+    Decompresses a gzip archive in a separate thread and yields its content as newline-aligned chunks.
+    The archive is opened immediately (so a missing file fails fast) but the thread only starts on first iteration.
+    :param source_gz_file_path: str, path to the gzip compressed source file
+    :param chunk_size: int, approximate size of each chunk (chunks always end on a line boundary)
+    :param max_queued: int, maximum number of chunks decompressed ahead of the consumer
+    :param digest: optional hashlib object updated with the compressed content of the archive as it is read
+    :param source_file: optional binary file object to read the archive from instead of its path, i.e. a
+                        monarch_gene_mapping.downloads.TransferReader reading it while it is downloaded
+    :param start: int, uncompressed offset of the first line read
+    :param end: Optional[int], uncompressed offset of the line the reading stops at (default: end of the archive)
+    :param gzip_index: Optional[str], path of an indexed_gzip index of the archive, to seek to start without
+                       decompressing what comes before it (see index_source_file())
+    :return: Iterator[bytes], chunks of complete lines
+    """
+    raw_file = None
+    source_gz_file = None
+    if gzip_index is not None and source_file is None and digest is None and exists(gzip_index):
+        source_gz_file = open_indexed_archive(source_gz_file_path, index_file=gzip_index)
+    if source_gz_file is None:
+        raw_file = source_file if source_file is not None else open(source_gz_file_path, mode="rb")
+        source_gz_file = GzipFile(fileobj=DigestReader(raw_file, digest) if digest is not None else raw_file, mode="rb")
+    chunks: Queue = Queue(maxsize=max(1, max_queued))
+    stop: Event = Event()
+    end_of_file = object()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                chunks.put(item, timeout=0.1)
+                return True
+            except Full:
+                continue
+        return False
+
+    def decompress():
+        try:
+            if start:
+                # an indexed archive seeks from the nearest access point, a GzipFile decompresses its way there
+                source_gz_file.seek(start)
+            remaining: Optional[int] = None if end is None else end - start
+            pending: bytes = b""
+            while remaining is None or remaining > 0:
+                block: bytes = source_gz_file.read(chunk_size if remaining is None else min(chunk_size, remaining))
+                if not block:
+                    break
+                if remaining is not None:
+                    remaining -= len(block)
+                boundary: int = block.rfind(b"\n")
+                if boundary < 0:
+                    pending += block
+                    continue
+                if not put(pending + block[: boundary + 1]):
+                    return
+                pending = block[boundary + 1 :]
+            if pending and not put(pending):
+                return
+            put(end_of_file)
+        except BaseException as exception:
+            # re-raised in the consuming thread
+            put(exception)
+
+    def consume() -> Iterator[bytes]:
+        decompressor = Thread(target=decompress, name="uniprot-decompress", daemon=True)
+        decompressor.start()
+        try:
+            while True:
+                item = chunks.get()
+                if item is end_of_file:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+            decompressor.join()
+            source_gz_file.close()
+            if raw_file is not None:
+                raw_file.close()
+
+    return consume()
+
+
+def filter_chunks(
+    chunks: Iterator[bytes], species: FrozenSet[bytes], workers: int = 1
+) -> Iterator[Tuple[bytes, int, int]]:
+    """
+    Filters chunks of raw idmapping selected data, fanning them out to a process pool when more than one worker is requested.
+    :param chunks: Iterator[bytes], newline-aligned chunks of the source file
+    :param species: FrozenSet[bytes], encoded NCBI taxon identifiers to keep
+    :param workers: int, number of filter processes; 1 (or less) filters in the calling process
+    :return: Iterator[Tuple[bytes, int, int]], filter_chunk() results, in the order of the input chunks
+    """
+    task = partial(filter_chunk, species=species)
+    if workers <= 1:
+        yield from map(task, chunks)
+        return
+
+    executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        # start the worker processes before the first chunk starts the decompression thread
+        executor.submit(task, b"").result()
+        pending: deque = deque()
+        for chunk in chunks:
+            pending.append(executor.submit(task, chunk))
+            # bound the number of chunks held in memory
+            if len(pending) >= workers * CHUNKS_IN_FLIGHT_PER_WORKER:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def filter_file(
+    source_gz_file_path: str,
+    target_gz_file_path: str,
+    species: Iterable[str],
+    number_of_lines: int = 0,
+    workers: int = 1,
+    append: bool = False,
+    digest=None,
+    source_file=None,
+    start: int = 0,
+    end: Optional[int] = None,
+    gzip_index: Optional[str] = None,
+) -> Tuple[int, int]:
+    """
+    Filters a gzip'd idmapping selected file into a gzip'd target file against a set of taxa.
+    :param source_gz_file_path: str, path of the input archive
+    :param target_gz_file_path: str, path of the output archive
+    :param species: Iterable[str], NCBI taxon identifiers to keep
+    :param number_of_lines: int, positive number of lines kept; 'all' lines kept if omitted or set to zero
+    :param workers: int, number of filter processes run alongside the decompression thread
+    :param append: bool, append the kept lines (as a new gzip member) to an existing target archive
+    :param digest: optional hashlib object updated with the compressed content of the input archive
+    :param source_file: optional binary file object to read the input archive from, see read_chunks()
+    :param start: int, uncompressed offset of the first line filtered, see read_chunks()
+    :param end: Optional[int], uncompressed offset of the line the filtering stops at, see read_chunks()
+    :param gzip_index: Optional[str], path of an indexed_gzip index of the input archive, see read_chunks()
+    :return: Tuple[int, int], number of lines read and number of lines kept
+    """
+    taxa: FrozenSet[bytes] = frozenset(taxon.encode("utf-8") for taxon in species)
+    n: int = 0
+    p: int = 0  # visible progress monitor
+    shown: float = 0.0  # time the progress was last shown, printing it for every chunk slows down the terminal
+    chunks = read_chunks(
+        source_gz_file_path,
+        chunk_size=CHUNK_SIZE,
+        max_queued=max(workers, 1) * CHUNKS_IN_FLIGHT_PER_WORKER,
+        digest=digest,
+        source_file=source_file,
+        start=start,
+        end=end,
+        gzip_index=gzip_index,
+    )
+    with gzip_open(target_gz_file_path, mode="ab" if append else "wb") as target_file, closing(chunks):
+        for data, lines_read, lines_kept in filter_chunks(chunks, taxa, workers=workers):
+            p += lines_read
+            if number_of_lines and n + lines_kept > number_of_lines:
+                # the line-by-line filter stopped right after writing the (number_of_lines + 1)th line
+                kept: List[bytes] = data.split(b"\n")
+                last: int = number_of_lines + 1 - n
+                target_file.write(b"\n".join(kept[:last]) + (b"\n" if last < len(kept) else b""))
+                n = number_of_lines + 1
+                break
+            target_file.write(data)
+            n += lines_kept
+            if time.monotonic() - shown >= PROGRESS_INTERVAL:
+                shown = time.monotonic()
+                print(f"{p} lines", end="\r")
+    # the final count, overwriting the last progress message
+    print(f"{p} lines")
+    record_rows(rows_in=p, rows_out=n)
+    return p, n
+
+
+def manifest_path(directory: str, target_filename: str) -> str:
+    """
+    :return: str, path of the manifest describing how the target archive was filtered
+    """
+    return f"{directory}{sep}{target_filename}.manifest.json"
+
+
+def read_manifest(path: str) -> Optional[Dict[str, Any]]:
+    if not exists(path):
+        return None
+    with open(path) as manifest_file:
+        return json.load(manifest_file)
+
+
+def write_manifest(path: str, manifest: Dict[str, Any]):
+    # shard processes may write the same manifest (i.e. the shard index) concurrently
+    temporary_path: str = f"{path}.{getpid()}.tmp"
+    with open(temporary_path, "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+    replace(temporary_path, path)
+
+
+def file_sha256(path: str) -> str:
+    digest = sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(CHUNK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def arrow_path(directory: str, target_filename: str) -> str:
+    """
+    :return: str, path of the Arrow IPC file of the target archive, i.e. idmapping_filtered.arrow
+    """
+    return f"{directory}{sep}{target_filename.rsplit('.', 1)[0]}.arrow"
+
+
+def arrow_source(target_gz_file_path: str) -> Dict[str, int]:
+    """
+    :return: Dict[str, int], size and modification time of the target archive, identifying the version an Arrow IPC
+             file was written from
+    """
+    target_stat = stat(target_gz_file_path)
+    return {"size": target_stat.st_size, "mtime_ns": target_stat.st_mtime_ns}
+
+
+def write_arrow_file(target_gz_file_path: str, arrow_file_path: str) -> Optional[int]:
+    """
+    Writes the columns of the filtered archive used by the mappings (see ARROW_COLUMNS) as an uncompressed Arrow IPC
+    file, to be memory-mapped by the mapping stage instead of parsing the archive. The file is left as it is if it
+    was written from the current version of the archive.
+    :param target_gz_file_path: str, path of the filtered archive
+    :param arrow_file_path: str, path of the Arrow IPC file
+    :return: Optional[int], number of rows of the Arrow IPC file, None without the optional pyarrow package
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.csv as pa_csv
+    except ImportError:
+        return None
+
+    source = json.dumps(arrow_source(target_gz_file_path)).encode("utf-8")
+    if exists(arrow_file_path):
+        try:
+            with pa.memory_map(arrow_file_path) as arrow_file:
+                reader = pa.ipc.open_file(arrow_file)
+                if (reader.schema.metadata or {}).get(ARROW_SOURCE_KEY) == source:
+                    return sum(reader.get_batch(i).num_rows for i in range(reader.num_record_batches))
+        except (OSError, pa.ArrowException):
+            pass
+
+    fields = {f"f{position}": (name, getattr(pa, type_name)()) for name, (position, type_name) in ARROW_COLUMNS.items()}
+    schema = pa.schema(
+        [pa.field(name, arrow_type) for name, arrow_type in fields.values()], metadata={ARROW_SOURCE_KEY: source}
+    )
+    convert_options = pa_csv.ConvertOptions(
+        include_columns=list(fields),
+        column_types={column: arrow_type for column, (_, arrow_type) in fields.items()},
+        null_values=NA_VALUES,
+        strings_can_be_null=True,
+    )
+    read_options = pa_csv.ReadOptions(autogenerate_column_names=True, block_size=CHUNK_SIZE)
+    parse_options = pa_csv.ParseOptions(delimiter="\t")
+    rows: int = 0
+    with gzip_open(target_gz_file_path, "rb") as target_file:
+        # the Arrow CSV reader fails on an empty file
+        empty: bool = not target_file.read(1)
+    temporary_path: str = f"{arrow_file_path}.tmp"
+    with pa.OSFile(temporary_path, "wb") as sink, pa.ipc.new_file(sink, schema) as writer:
+        if not empty:
+            with pa.input_stream(target_gz_file_path, compression="gzip") as stream:
+                batches = pa_csv.open_csv(stream, read_options, parse_options, convert_options)
+                for batch in batches:
+                    writer.write_batch(pa.RecordBatch.from_arrays(batch.columns, schema=schema))
+                    rows += batch.num_rows
+    replace(temporary_path, arrow_file_path)
+    return rows
+
+
+def source_unchanged(source_gz_file_path: str, manifest: Dict[str, Any]) -> bool:
+    """
+    Checks a source archive against the manifest of the previous filtering, using its size and modification time
+    and, if only the modification time differs (i.e. the same file was downloaded again), its checksum.
+    """
+    source_stat = stat(source_gz_file_path)
+    if source_stat.st_size != manifest["source_size"]:
+        return False
+    if source_stat.st_mtime_ns == manifest["source_mtime_ns"]:
+        return True
+    if file_sha256(source_gz_file_path) == manifest["source_sha256"]:
+        manifest["source_mtime_ns"] = source_stat.st_mtime_ns
+        return True
+    return False
 
 
 def filter_uniprot_id_mapping_file(
-    directory: str, source_filename: str, target_filename: str, number_of_lines: int = 0  # root file name only?
+    directory: str,
+    source_filename: str,
+    target_filename: str,
+    number_of_lines: int = 0,  # root file name only?
+    workers: int = 1,
+    species: Optional[Set[str]] = None,
+    force: bool = False,
+    source_file=None,
+    shard: Optional[str] = None,
 ) -> bool:
     """
     Filters contents of a UniProKB idmapping selected tab gzip'd archive against the target list of taxa.
+    A manifest written next to the target archive records the source archive and the taxa it was filtered on,
+    so that a later complete filtering of the same source is skipped, or only deals with the taxa which changed.
+    In shard mode, only a range of the source archive is filtered into a partial archive, see filter_shard().
     :param directory: str, location of source data file
     :param source_filename: str, root file name of input source data archive
     :param target_filename: str, root file name of output target data archive
     :param number_of_lines: int, positive number of lines parsed; 'all' lines parsed if omitted or set to zero
+    :param workers: int, number of filter processes run alongside the decompression thread
+    :param species: Optional[Set[str]], NCBI taxon identifiers to keep (default: prefilter_species())
+    :param force: bool, filter the whole source archive again, even if the manifest says it is unchanged
+    :param source_file: optional binary file object to read the source archive from (i.e. while it is downloaded,
+                        see monarch_gene_mapping.downloads.Downloads.stream()), the whole archive being filtered
+    :param shard: Optional[str], 'i/N' to only filter the i-th of N shards of the source archive, the partial
+                  archives of the N shards being merged into the target archive by merge_shards()
     :return: bool, True if filtering was successful; False if unsuccessful
     """
     if not directory:
@@ -72,32 +504,75 @@ def filter_uniprot_id_mapping_file(
     assert target_filename
     assert number_of_lines >= 0
 
-    print(
-        f"\nBegin file filtering '{number_of_lines if number_of_lines else 'all'}'"
-        + f" lines in '{source_filename}' at {datetime.now().isoformat()}. "
-        + f"\nPatience! This may take a little awhile!...\n"
-    )
+    if species is None:
+        species = prefilter_species()
+    species = set(species)
 
     # A standard gzip compressed TSV file
     source_gz_filename: str = f"{source_filename}.gz"
     source_gz_file_path: str = f"{directory_path}{sep}{source_gz_filename}"
     target_gz_filename: str = f"{target_filename}.gz"
     target_gz_file_path: str = f"{directory_path}{sep}{target_gz_filename}"
-    n: int = 0
-    p: int = 0  # visible progress monitor
-    print("Processing... ")
+    manifest_file_path: str = manifest_path(directory_path, target_filename)
+
     try:
-        with gzip_open(source_gz_file_path, mode="rt", encoding="utf-8") as source_gz_file:
-            with gzip_open(target_gz_file_path, mode="wt", encoding="utf-8") as target_file:
-                for line in source_gz_file:
-                    p += 1
-                    if target_taxon(line):
-                        print(line, file=target_file, end="")
-                        n += 1
-                    if number_of_lines and n > number_of_lines:
-                        break
-                    if not (p % PROGRESS_MONITOR_INCR):
-                        print(f"{p} lines", end="\r")
+        if shard is not None:
+            assert not number_of_lines and source_file is None, "a shard is filtered whole, from the source file"
+            filter_shard(directory_path, source_filename, target_filename, *parse_shard(shard), workers, species)
+            return True
+
+        manifest: Optional[Dict[str, Any]] = read_manifest(manifest_file_path)
+        if (
+            not force
+            and source_file is None
+            and not number_of_lines
+            and manifest is not None
+            and not manifest["number_of_lines"]
+            and exists(target_gz_file_path)
+            and source_unchanged(source_gz_file_path, manifest)
+        ):
+            updated: bool = update_filtered_file(
+                source_gz_file_path, target_gz_file_path, manifest_file_path, manifest, species, workers
+            )
+            write_arrow_file(target_gz_file_path, arrow_path(directory_path, target_filename))
+            return updated
+
+        print(
+            f"\nBegin file filtering '{number_of_lines if number_of_lines else 'all'}'"
+            + f" lines in '{source_filename}' at {datetime.now().isoformat()}. "
+            + f"\nPatience! This may take a little awhile!...\n"
+        )
+        print("Processing... ")
+        # an interrupted run must leave neither a truncated target archive, nor a manifest describing it as complete
+        if exists(manifest_file_path):
+            remove(manifest_file_path)
+        digest = sha256()
+        lines_read, lines_kept = filter_file(
+            source_gz_file_path,
+            f"{target_gz_file_path}.tmp",
+            species,
+            number_of_lines=number_of_lines,
+            workers=workers,
+            digest=digest,
+            source_file=source_file,
+        )
+        replace(f"{target_gz_file_path}.tmp", target_gz_file_path)
+        source_stat = stat(source_gz_file_path)
+        write_manifest(
+            manifest_file_path,
+            {
+                "source": source_gz_file_path,
+                "source_size": source_stat.st_size,
+                "source_mtime_ns": source_stat.st_mtime_ns,
+                # a partial run only hashes the part of the archive that was read
+                "source_sha256": digest.hexdigest() if not number_of_lines else None,
+                "target_species": sorted(species, key=int),
+                "number_of_lines": number_of_lines,
+                "lines_read": lines_read,
+                "lines_kept": lines_kept,
+                "created": datetime.now().isoformat(timespec="seconds"),
+            },
+        )
 
     except FileNotFoundError as fnf:
         print(f"\nFile '{source_gz_file_path}' not found, at {datetime.now().isoformat()}", file=stderr)
@@ -111,6 +586,309 @@ def filter_uniprot_id_mapping_file(
         return False
 
     print(f"\nFinished filtering file '{source_gz_file_path}' at {datetime.now().isoformat()}")
+    write_arrow_file(target_gz_file_path, arrow_path(directory_path, target_filename))
+    return True
+
+
+def update_filtered_file(
+    source_gz_file_path: str,
+    target_gz_file_path: str,
+    manifest_file_path: str,
+    manifest: Dict[str, Any],
+    species: Set[str],
+    workers: int = 1,
+) -> bool:
+    """
+    Brings a target archive filtered from an unchanged source archive up to date with a new set of taxa:
+    lines of the taxa no longer wanted are filtered out of the (small) target archive, and only the lines
+    of the newly added taxa are filtered out of the source archive, then appended to the target archive.
+    The updated archive is written to a temporary file which replaces the target archive once complete, before the
+    manifest is updated, so that an interrupted update leaves the target archive and its manifest as they were.
+    :return: bool, True if the update was successful
+    """
+    previous_species: Set[str] = set(manifest["target_species"])
+    removed: Set[str] = previous_species - species
+    added: Set[str] = species - previous_species
+    if not removed and not added:
+        print(f"\nFile '{target_gz_file_path}' is up to date with '{source_gz_file_path}', nothing to filter")
+        write_manifest(manifest_file_path, manifest)
+        return True
+
+    temporary_path: str = f"{target_gz_file_path}.tmp"
+    lines_kept: int = manifest["lines_kept"]
+    if removed:
+        print(f"\nRemoving taxa {', '.join(sorted(removed, key=int))} from '{target_gz_file_path}'")
+        _, lines_kept = filter_file(target_gz_file_path, temporary_path, previous_species & species, workers=workers)
+    else:
+        copyfile(target_gz_file_path, temporary_path)
+    if added:
+        print(
+            f"\nBegin filtering taxa {', '.join(sorted(added, key=int))} in '{source_gz_file_path}'"
+            + f" at {datetime.now().isoformat()}"
+        )
+        _, lines_added = filter_file(source_gz_file_path, temporary_path, added, workers=workers, append=True)
+        lines_kept += lines_added
+    replace(temporary_path, target_gz_file_path)
+
+    manifest["lines_kept"] = lines_kept
+    manifest["target_species"] = sorted(species, key=int)
+    manifest["created"] = datetime.now().isoformat(timespec="seconds")
+    write_manifest(manifest_file_path, manifest)
+    print(f"\nFinished updating file '{target_gz_file_path}' at {datetime.now().isoformat()}")
+    return True
+
+
+def index_path(directory: str, source_filename: str) -> str:
+    """
+    :return: str, path of the shard index of the source archive, see index_source_file()
+    """
+    return f"{directory}{sep}{source_filename}.gz.index.json"
+
+
+def index_source_file(directory: str, source_filename: str) -> Dict[str, Any]:
+    """
+    Indexes a source archive for its sharded filtering, in one pass over its content: the index lists uncompressed
+    offsets of line boundaries about INDEX_SPACING bytes apart, the shards being ranges between them. With the
+    optional indexed_gzip package, the access points of the archive are also exported next to the index (to the
+    '.gzidx' file), so that a shard seeks to its first line instead of decompressing everything before it.
+    The index is reused while the size and modification time of the source archive are unchanged.
+    :param directory: str, location of source data file
+    :param source_filename: str, root file name of input source data archive
+    :return: Dict[str, Any], the index
+    """
+    source_gz_file_path: str = f"{directory}{sep}{source_filename}.gz"
+    index_file_path: str = index_path(directory, source_filename)
+    source_stat = stat(source_gz_file_path)
+    index: Optional[Dict[str, Any]] = read_manifest(index_file_path)
+    if (
+        index is not None
+        and index["source_size"] == source_stat.st_size
+        and index["source_mtime_ns"] == source_stat.st_mtime_ns
+        and (index["gzip_index"] is None or exists(f"{directory}{sep}{index['gzip_index']}"))
+    ):
+        return index
+
+    print(f"\nIndexing file '{source_gz_file_path}' at {datetime.now().isoformat()}")
+    gzip_index: Optional[str] = f"{source_filename}.gz.gzidx"
+    # indexed_gzip access points must be further apart than the 32 KiB window of data they hold
+    source_gz_file = open_indexed_archive(source_gz_file_path, spacing=max(INDEX_SPACING, 64 * 1024))
+    if source_gz_file is None:
+        gzip_index = None
+        source_gz_file = gzip_open(source_gz_file_path, "rb")
+    offsets: List[int] = [0]
+    position: int = 0
+    with source_gz_file:
+        for block in iter(lambda: source_gz_file.read(CHUNK_SIZE), b""):
+            boundary: int = block.rfind(b"\n")
+            if boundary >= 0 and position + boundary + 1 - offsets[-1] >= INDEX_SPACING:
+                offsets.append(position + boundary + 1)
+            position += len(block)
+        if gzip_index is not None:
+            # the access points were built along the way
+            temporary_path: str = f"{directory}{sep}{gzip_index}.{getpid()}.tmp"
+            source_gz_file.export_index(temporary_path)
+            replace(temporary_path, f"{directory}{sep}{gzip_index}")
+    if position > offsets[-1]:
+        offsets.append(position)
+    index = {
+        "source": source_gz_file_path,
+        "source_size": source_stat.st_size,
+        "source_mtime_ns": source_stat.st_mtime_ns,
+        "source_sha256": file_sha256(source_gz_file_path),
+        "size": position,
+        "offsets": offsets,
+        "gzip_index": gzip_index,
+        "created": datetime.now().isoformat(timespec="seconds"),
+    }
+    write_manifest(index_file_path, index)
+    return index
+
+
+def parse_shard(shard: str) -> Tuple[int, int]:
+    """
+    :param shard: str, 'i/N' for the i-th of N shards (counting from 1)
+    :return: Tuple[int, int], shard number and number of shards
+    """
+    try:
+        number, shards = (int(part) for part in shard.split("/"))
+    except ValueError:
+        raise ValueError(f"Invalid shard '{shard}', expected i/N")
+    if not 1 <= number <= shards:
+        raise ValueError(f"Invalid shard '{shard}', expected i/N with 1 <= i <= N")
+    return number, shards
+
+
+def shard_range(index: Dict[str, Any], shard: int, shards: int) -> Tuple[int, int]:
+    """
+    :param index: Dict[str, Any], shard index of the source archive, see index_source_file()
+    :param shard: int, shard number (counting from 1)
+    :param shards: int, number of shards
+    :return: Tuple[int, int], uncompressed offsets of the first line of the shard and of the line following it
+    """
+    offsets: List[int] = index["offsets"]
+    ranges: int = len(offsets) - 1
+    return offsets[(shard - 1) * ranges // shards], offsets[shard * ranges // shards]
+
+
+def shard_directory(directory: str, target_filename: str) -> str:
+    """
+    :return: str, directory of the partial target archives of the shards
+    """
+    return f"{directory}{sep}{target_filename}.shards"
+
+
+def shard_filename(shard: int, shards: int) -> str:
+    """
+    :return: str, file name of the partial target archive of a shard, i.e. 00002-of-00008.tsv.gz
+    """
+    return f"{shard:05d}-of-{shards:05d}.tsv.gz"
+
+
+def filter_shard(
+    directory: str,
+    source_filename: str,
+    target_filename: str,
+    shard: int,
+    shards: int,
+    workers: int = 1,
+    species: Optional[Set[str]] = None,
+) -> Tuple[int, int]:
+    """
+    Filters one of N disjoint ranges of lines of a source archive into a partial target archive, with its manifest,
+    under the shard directory. The shards can run as separate processes, on separate hosts sharing the data
+    directory, merge_shards() then concatenating their partial archives into the target archive.
+    :param directory: str, location of source data file
+    :param source_filename: str, root file name of input source data archive
+    :param target_filename: str, root file name of output target data archive
+    :param shard: int, shard number (counting from 1)
+    :param shards: int, number of shards
+    :param workers: int, number of filter processes run alongside the decompression thread
+    :param species: Optional[Set[str]], NCBI taxon identifiers to keep (default: prefilter_species())
+    :return: Tuple[int, int], number of lines read and number of lines kept
+    """
+    if species is None:
+        species = prefilter_species()
+    index: Dict[str, Any] = index_source_file(directory, source_filename)
+    start, end = shard_range(index, shard, shards)
+    shards_path: str = shard_directory(directory, target_filename)
+    makedirs(shards_path, exist_ok=True)
+    # shards of an earlier run split in another number of shards would not be merged
+    for name in listdir(shards_path):
+        if f"-of-{shards:05d}." not in name:
+            remove(f"{shards_path}{sep}{name}")
+    shard_gz_file_path: str = f"{shards_path}{sep}{shard_filename(shard, shards)}"
+    shard_manifest_path: str = f"{shard_gz_file_path}.manifest.json"
+    # the manifest of a complete shard is written last, so that an interrupted shard is never merged
+    if exists(shard_manifest_path):
+        remove(shard_manifest_path)
+
+    print(
+        f"\nBegin filtering shard {shard}/{shards} (bytes {start} to {end}) of '{index['source']}'"
+        + f" at {datetime.now().isoformat()}"
+    )
+    gzip_index: Optional[str] = f"{directory}{sep}{index['gzip_index']}" if index["gzip_index"] else None
+    lines_read, lines_kept = filter_file(
+        index["source"], shard_gz_file_path, species, workers=workers, start=start, end=end, gzip_index=gzip_index
+    )
+    write_manifest(
+        shard_manifest_path,
+        {
+            "source": index["source"],
+            "source_size": index["source_size"],
+            "source_mtime_ns": index["source_mtime_ns"],
+            "shard": shard,
+            "shards": shards,
+            "start": start,
+            "end": end,
+            "target_species": sorted(species, key=int),
+            "lines_read": lines_read,
+            "lines_kept": lines_kept,
+            "created": datetime.now().isoformat(timespec="seconds"),
+        },
+    )
+    print(f"\nFinished filtering shard {shard}/{shards} of '{index['source']}' at {datetime.now().isoformat()}")
+    return lines_read, lines_kept
+
+
+def merge_shards(
+    directory: str, source_filename: str, target_filename: str, species: Optional[Set[str]] = None
+) -> bool:
+    """
+    Concatenates the partial target archives of the shards of a source archive, in order, into the target archive
+    (a gzip file may be made of several members), writing its manifest as a complete filtering would. The shards
+    are checked to cover the whole source archive, in its current version and for the same taxa, then removed.
+    :param directory: str, location of source data file
+    :param source_filename: str, root file name of input source data archive
+    :param target_filename: str, root file name of output target data archive
+    :param species: Optional[Set[str]], NCBI taxon identifiers the shards must have kept (default: prefilter_species())
+    :return: bool, True if the shards were merged; False if some are missing or out of date
+    """
+    if species is None:
+        species = prefilter_species()
+    shards_path: str = shard_directory(directory, target_filename)
+    index: Optional[Dict[str, Any]] = read_manifest(index_path(directory, source_filename))
+    names: List[str] = sorted(listdir(shards_path)) if exists(shards_path) else []
+    manifests: List[Dict[str, Any]] = [
+        read_manifest(f"{shards_path}{sep}{name}") for name in names if name.endswith(".manifest.json")
+    ]
+    if index is None or not manifests:
+        print(f"\nNo shards of '{source_filename}' to merge in '{shards_path}'", file=stderr)
+        return False
+    source_version: Tuple[int, int] = (index["source_size"], index["source_mtime_ns"])
+    # the source archive needn't be on the host merging the shards
+    if exists(index["source"]) and (stat(index["source"]).st_size, stat(index["source"]).st_mtime_ns) != source_version:
+        print(f"\nCannot merge the shards of '{source_filename}': it changed since it was indexed", file=stderr)
+        return False
+    shards: int = manifests[0]["shards"]
+    missing: List[int] = sorted(set(range(1, shards + 1)) - {manifest["shard"] for manifest in manifests})
+    stale: List[int] = [
+        manifest["shard"]
+        for manifest in manifests
+        if manifest["shards"] != shards
+        or (manifest["source_size"], manifest["source_mtime_ns"]) != source_version
+        or manifest["target_species"] != sorted(species, key=int)
+    ]
+    # each shard starts where the previous one ends, from the start to the end of the source archive
+    bounds: List[int] = [0, *(bound for manifest in manifests for bound in (manifest["start"], manifest["end"]))]
+    bounds.append(index["size"])
+    contiguous: bool = bounds[0::2] == bounds[1::2]
+    if missing or stale or not contiguous:
+        print(
+            f"\nCannot merge the shards of '{source_filename}' in '{shards_path}':"
+            + (f" missing shards {missing}" if missing else "")
+            + (f" shards {stale} are out of date" if stale else "")
+            + (" the shards don't cover the source file" if not missing and not stale else ""),
+            file=stderr,
+        )
+        return False
+
+    target_gz_file_path: str = f"{directory}{sep}{target_filename}.gz"
+    temporary_path: str = f"{target_gz_file_path}.{getpid()}.tmp"
+    with open(temporary_path, "wb") as target_file:
+        for manifest in manifests:
+            with open(f"{shards_path}{sep}{shard_filename(manifest['shard'], shards)}", "rb") as shard_file:
+                copyfileobj(shard_file, target_file, CHUNK_SIZE)
+    replace(temporary_path, target_gz_file_path)
+    write_manifest(
+        manifest_path(directory, target_filename),
+        {
+            "source": index["source"],
+            "source_size": index["source_size"],
+            "source_mtime_ns": index["source_mtime_ns"],
+            "source_sha256": index["source_sha256"],
+            "target_species": sorted(species, key=int),
+            "number_of_lines": 0,
+            "lines_read": sum(manifest["lines_read"] for manifest in manifests),
+            "lines_kept": sum(manifest["lines_kept"] for manifest in manifests),
+            "shards": shards,
+            "created": datetime.now().isoformat(timespec="seconds"),
+        },
+    )
+    for name in names:
+        remove(f"{shards_path}{sep}{name}")
+    rmdir(shards_path)
+    print(f"\nMerged {shards} shards into '{target_gz_file_path}' at {datetime.now().isoformat()}")
+    write_arrow_file(target_gz_file_path, arrow_path(directory, target_filename))
     return True
 
 
@@ -129,7 +907,10 @@ if __name__ == "__main__":
         help="Source root data file name (default: 'idmapping_selected.tab')",
     )
     parser.add_argument(
-        "-t", "--target", default="idmapping_filtered.tsv", help="Target root data file name (default: 'idmapping_filtered.tsv')"
+        "-t",
+        "--target",
+        default="idmapping_filtered.tsv",
+        help="Target root data file name (default: 'idmapping_filtered.tsv')",
     )
     parser.add_argument(
         "-n",
@@ -138,14 +919,48 @@ if __name__ == "__main__":
         default=0,
         help="Maximum (positive) number of lines to process; n == 0 implies 'process all' (default: 0 == 'all')",
     )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of filter processes run alongside the decompression thread (default: 1)",
+    )
+    parser.add_argument(
+        "-f",
+        "--force",
+        action="store_true",
+        help="Filter the whole source file, even if its manifest says the target file is up to date",
+    )
+    parser.add_argument(
+        "--shard",
+        help="Only filter the i-th of N shards of the source file, given as i/N, into a partial file (see --merge)",
+    )
+    parser.add_argument(
+        "--merge",
+        action="store_true",
+        help="Merge the partial files of the shards of the source file into the target file",
+    )
+    parser.add_argument(
+        "--index",
+        action="store_true",
+        help="Only index the source file for its shards, once before they run (otherwise each shard indexes it)",
+    )
 
     args = parser.parse_args()
 
-    if filter_uniprot_id_mapping_file(
+    if args.index:
+        index_source_file(args.directory, args.source)
+    elif args.merge:
+        merge_shards(args.directory, args.source, args.target)
+    elif filter_uniprot_id_mapping_file(
         directory=args.directory,
         source_filename=args.source,
         target_filename=args.target,
         number_of_lines=args.number_of_lines,
+        workers=args.workers,
+        force=args.force,
+        shard=args.shard,
     ):
         quantity: str = args.number_of_lines > 0 if args.number_of_lines else "All"
         print(
@@ -0,0 +1,224 @@
+"""
+Vectorized validation of generated mappings.
+
+Every check runs column-wide on the concatenated mappings DataFrame, and the offending rows are collected
+in a ValidationReport rather than failing on the first one. Identifier columns are checked with a single
+regular expression pass (on Arrow strings when the optional pyarrow package is installed), and only the
+values failing it are classified into the specific checks.
+"""
+
+import re
+from typing import Any, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from pandas.core.frame import DataFrame
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:  # pragma: no cover - exercised only without pyarrow
+    pa = None
+    pc = None
+
+MAPPING_COLUMNS: List[str] = ["subject_id", "predicate_id", "object_id", "mapping_justification"]
+# columns holding entity identifiers, whose CURIE prefixes are checked against the converter
+ID_COLUMNS: List[str] = ["subject_id", "object_id"]
+TRIPLE_COLUMNS: List[str] = ["subject_id", "predicate_id", "object_id"]
+
+# a prefix (letter first), a colon and a non-empty local identifier without whitespace or angle brackets
+CURIE_PATTERN: str = r"^[A-Za-z][A-Za-z0-9_.\-]*:[^\s<>]+$"
+
+# text left behind by missing values cast to str, as a whole identifier or as the local part of a CURIE
+NA_WORDS: List[str] = ["nan", "NaN", "None", "NA"]
+NA_PATTERN: str = r"<NA>|(?:^|:)(?:" + "|".join(NA_WORDS) + r")$"
+
+ERROR: str = "error"
+WARNING: str = "warning"
+
+ISSUE_COLUMNS: List[str] = ["check", "severity", "column", "row", *MAPPING_COLUMNS]
+
+
+class ValidationReport:
+    """
+    Offending rows of a mappings DataFrame, one row per failed check
+    (check, severity, column, positional row number and the content of the mapping)
+    """
+
+    def __init__(self, issues: DataFrame, rows: int):
+        self.issues = issues
+        self.rows = rows
+
+    @property
+    def errors(self) -> DataFrame:
+        return self.issues.loc[self.issues["severity"] == ERROR]
+
+    @property
+    def warnings(self) -> DataFrame:
+        return self.issues.loc[self.issues["severity"] == WARNING]
+
+    @property
+    def has_errors(self) -> bool:
+        return bool((self.issues["severity"] == ERROR).any())
+
+    def counts(self) -> DataFrame:
+        """
+        :return: DataFrame of the number of offending rows by check, severity and column
+        """
+        return self.issues.groupby(["check", "severity", "column"]).size().rename("count").reset_index()
+
+    def summary(self, examples: int = 3) -> str:
+        """
+        :param examples: Number of offending values shown for each check
+        :return: Human readable summary of the report
+        """
+        if self.issues.empty:
+            return f"All {self.rows} mappings are valid"
+        lines = [f"{len(self.errors)} errors and {len(self.warnings)} warnings in {self.rows} mappings:"]
+        for (check, severity, column), group in self.issues.groupby(["check", "severity", "column"], sort=False):
+            values = ", ".join(repr(value) for value in group[column].head(examples))
+            lines.append(f"  {severity} {check} in {column}: {len(group)} rows, i.e. {values}")
+        return "\n".join(lines)
+
+    def __str__(self) -> str:
+        return self.summary()
+
+
+class MappingValidationError(Exception):
+    """
+    Raised when generated mappings fail validation; the full ValidationReport is kept in the report attribute
+    """
+
+    def __init__(self, report: ValidationReport):
+        self.report = report
+        super().__init__(report.summary())
+
+
+def classify_value(value: Any) -> str:
+    """
+    Name the check failed by an identifier which does not match CURIE_PATTERN
+    :param value: Offending identifier
+    :return: 'missing', 'empty', 'na_text', 'whitespace' or 'malformed_curie'
+    """
+    if not isinstance(value, str):
+        if pd.isna(value):
+            return "missing"
+        value = str(value)
+    if value == "":
+        return "empty"
+    if re.search(NA_PATTERN, value):
+        return "na_text"
+    if re.search(r"\s", value):
+        return "whitespace"
+    return "malformed_curie"
+
+
+def _check_identifiers(values, converter: Optional[Any] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    :param values: Identifiers, as a pyarrow string array (a pandas Series without pyarrow)
+    :param converter: Optional converter to check the prefixes of the identifiers against
+    :return: Boolean masks of the identifiers failing CURIE_PATTERN (or ending with NA text),
+             and of the well-formed identifiers whose prefix is unknown to the converter
+    """
+    na_suffixes = tuple(f":{word}" for word in NA_WORDS)
+    unknown = np.zeros(len(values), dtype=bool)
+    if pc is None:
+        valid = values.str.match(CURIE_PATTERN, na=False)
+        valid &= ~values.str.endswith(na_suffixes, na=False)
+        if converter is not None:
+            for prefix in values[valid].str.split(":", n=1).str[0].unique():
+                if converter.standardize_prefix(prefix) is None:
+                    unknown |= (valid & values.str.startswith(f"{prefix}:", na=False)).to_numpy()
+        return ~valid.to_numpy(), unknown
+
+    valid = pc.fill_null(pc.match_substring_regex(values, CURIE_PATTERN), False)
+    for suffix in na_suffixes:
+        valid = pc.and_kleene(valid, pc.invert(pc.ends_with(values, suffix)))
+    if converter is not None:
+        prefixes = pc.unique(pc.list_element(pc.split_pattern(values.filter(valid), ":", max_splits=1), 0))
+        for prefix in prefixes.to_pylist():
+            if converter.standardize_prefix(prefix) is None:
+                unknown |= pc.and_kleene(valid, pc.starts_with(values, f"{prefix}:")).to_numpy(zero_copy_only=False)
+    return ~valid.to_numpy(zero_copy_only=False), unknown
+
+
+def _check_terms(values) -> Tuple[np.ndarray, Any]:
+    """
+    Check a column taking a handful of distinct values (predicates, justifications) one distinct value at a time
+    :param values: Terms, as a pyarrow string or dictionary array (a pandas Series without pyarrow)
+    :return: Boolean mask of the terms failing CURIE_PATTERN, and the terms dictionary encoded (None without pyarrow)
+    """
+    if pc is None:
+        codes, uniques = pd.factorize(values, use_na_sentinel=False)
+        return _check_identifiers(pd.Series(uniques, dtype=object))[0][codes], None
+    if pa.types.is_dictionary(values.type) and not values.null_count:
+        encoded = values
+    else:
+        encoded = pc.dictionary_encode(pc.cast(values, pa.string()), null_encoding="encode")
+    return _check_identifiers(encoded.dictionary)[0][encoded.indices.to_numpy(zero_copy_only=False)], encoded
+
+
+def _duplicated(columns: List[Any]) -> np.ndarray:
+    """
+    :param columns: Columns identifying a row, as pyarrow string arrays (pandas Series without pyarrow)
+    :return: Boolean mask of the rows repeating an earlier one
+    """
+    if pc is None:
+        return pd.concat(columns, axis=1).duplicated(keep="first").to_numpy()
+    # dictionary codes are numbered in order of first appearance, so a repeated row is one whose
+    # code does not exceed the largest code seen before it
+    keys = pc.binary_join_element_wise(*[pc.fill_null(pc.cast(column, pa.string()), "") for column in columns], "\t")
+    codes = pc.dictionary_encode(keys).indices.to_numpy(zero_copy_only=False)
+    previous = np.maximum.accumulate(np.concatenate([[-1], codes[:-1]]))
+    return codes <= previous
+
+
+def _issues(mappings: DataFrame, rows: np.ndarray, severity: str, check, column: str) -> DataFrame:
+    issues = mappings.iloc[rows][MAPPING_COLUMNS].reset_index(drop=True)
+    issues.insert(0, "row", rows)
+    issues.insert(0, "column", column)
+    issues.insert(0, "severity", severity)
+    issues.insert(0, "check", check)
+    return issues
+
+
+def validate_mappings(mappings: DataFrame, converter: Optional[Any] = None) -> ValidationReport:
+    """
+    Check generated mappings for missing values (including NA text left by casting), empty identifiers,
+    whitespace, malformed CURIEs, CURIE prefixes unknown to the converter, and duplicate mappings
+    :param mappings: DataFrame of mappings (subject_id, predicate_id, object_id, mapping_justification)
+    :param converter: Optional curies.Converter (i.e. prefixmaps.load_converter(["merged"])) to check
+                      the prefixes of subject and object identifiers against
+    :return: ValidationReport
+    """
+    found: List[DataFrame] = []
+    columns = {}
+    for column in MAPPING_COLUMNS:
+        values = mappings[column]
+        if pa is not None and column not in ID_COLUMNS and isinstance(values.dtype, pd.CategoricalDtype):
+            # already dictionary encoded
+            values = pa.array(values, from_pandas=True)
+        elif pa is not None:
+            values = pa.array(values.to_numpy(dtype=object), type=pa.string(), from_pandas=True)
+        unknown = None
+        if column in ID_COLUMNS:
+            invalid, unknown = _check_identifiers(values, converter)
+        else:
+            invalid, encoded = _check_terms(values)
+            if encoded is not None:
+                values = encoded
+        columns[column] = values
+
+        rows = np.flatnonzero(invalid)
+        if len(rows):
+            checks = [classify_value(value) for value in mappings[column].iloc[rows]]
+            found.append(_issues(mappings, rows, ERROR, checks, column))
+        if unknown is not None and unknown.any():
+            found.append(_issues(mappings, np.flatnonzero(unknown), ERROR, "unknown_prefix", column))
+
+    rows = np.flatnonzero(_duplicated([columns[column] for column in TRIPLE_COLUMNS]))
+    if len(rows):
+        found.append(_issues(mappings, rows, WARNING, "duplicate", "subject_id"))
+
+    issues = pd.concat(found, ignore_index=True) if found else pd.DataFrame(columns=ISSUE_COLUMNS)
+    return ValidationReport(issues, rows=len(mappings))
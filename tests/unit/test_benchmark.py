@@ -0,0 +1,38 @@
+"""
+Unit tests for the mapping pipeline benchmarks
+"""
+
+import pytest
+
+from monarch_gene_mapping.benchmark import compare_results, load_results, run_benchmarks, save_results
+
+
+def _results(rows_per_second, peak_rss_mb):
+    return {"rows": 10, "stages": {"stage": {"rows_per_second": rows_per_second, "peak_rss_mb": peak_rss_mb}}}
+
+
+def test_run_benchmarks(tmp_path):
+    results = run_benchmarks(str(tmp_path), rows=1000, only=["explode_column", "mapping:hgnc"])
+    assert list(results["stages"]) == ["explode_column", "mapping:hgnc"]
+    hgnc = results["stages"]["mapping:hgnc"]
+    assert hgnc["rows_in"] == 1000
+    assert hgnc["rows_out"] > 0
+    assert hgnc["rows_per_second"] > 0
+    assert hgnc["peak_rss_mb"] > 0
+
+    save_results(results, str(tmp_path / "baseline.json"))
+    assert load_results(str(tmp_path / "baseline.json")) == results
+
+    with pytest.raises(ValueError, match="Unknown benchmark stage"):
+        run_benchmarks(str(tmp_path), rows=1000, only=["nothing"])
+
+
+def test_compare_results():
+    baseline = _results(1000.0, 100.0)
+    comparison = compare_results(_results(900.0, 110.0), baseline, tolerance=0.2)
+    assert not comparison["regression"].any()
+
+    comparison = compare_results(_results(700.0, 130.0), baseline, tolerance=0.2).set_index("metric")
+    assert comparison.loc["rows_per_second", "regression"]
+    assert comparison.loc["peak_rss_mb", "regression"]
+    assert comparison.loc["rows_per_second", "change"] == -0.3
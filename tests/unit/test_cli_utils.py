@@ -1,10 +1,27 @@
 """
 Unit tests for the mapping generation framework
 """
+
+import shutil
+
+import numpy as np
 import pandas as pd
 import pytest
 
-from monarch_gene_mapping.cli_utils import df_mappings, explode_column, UNIPROT_ID_MAPPING_SELECTED_COLUMNS
+from monarch_gene_mapping import cli_utils
+from monarch_gene_mapping.cli_utils import (
+    concat_mappings,
+    df_mappings,
+    df_mappings_stream,
+    explode_column,
+    generate_gene_mappings,
+    preprocess_alliance_df,
+    run_source_plan,
+    split_values,
+    UNIPROT_ID_MAPPING_SELECTED_COLUMNS,
+)
+from monarch_gene_mapping.mapping_spec import load_mapping_spec, plan_mappings
+from monarch_gene_mapping.validation import MAPPING_COLUMNS
 
 
 def test_null_mapping():
@@ -21,8 +38,11 @@ def test_null_mapping():
     for row in mapped.itertuples():
         assert not ("NA" in row.subject_id)
         assert not ("NA" in row.object_id)
+
+
 test_null_mapping()
 
+
 def test_semicolon_in_id():
     uniprot_df = pd.read_csv("tests/resources/uniprot_test.tsv", names=UNIPROT_ID_MAPPING_SELECTED_COLUMNS, sep="\t")
     mapped = df_mappings(
@@ -38,3 +58,212 @@ def test_semicolon_in_id():
         filter_ids=[9031, 9615, 9913, 9823, 227321],
     )
     assert len(mapped) == 4
+
+
+def test_term_columns_are_categorical():
+    df = pd.DataFrame({"gene": ["1", "2"], "protein": ["P1", "P2"]})
+    exact = df_mappings(df, subject_column="gene", object_column="protein")
+    close = df_mappings(df, subject_column="gene", object_column="protein", predicate_id="skos:closeMatch")
+    assert isinstance(exact["predicate_id"].dtype, pd.CategoricalDtype)
+    assert isinstance(exact["mapping_justification"].dtype, pd.CategoricalDtype)
+
+    mappings = concat_mappings([exact, close])
+    # pd.concat would have fallen back to an object column
+    assert isinstance(mappings["predicate_id"].dtype, pd.CategoricalDtype)
+    assert mappings["predicate_id"].tolist() == ["skos:exactMatch"] * 2 + ["skos:closeMatch"] * 2
+    assert list(exact["predicate_id"].cat.categories) == ["skos:exactMatch"]
+
+
+@pytest.fixture(params=["pyarrow", "python"])
+def split_engine(request, monkeypatch):
+    if request.param == "pyarrow":
+        pytest.importorskip("pyarrow")
+    else:
+        monkeypatch.setattr(cli_utils, "pc", None)
+    return request.param
+
+
+def test_explode_column(split_engine):
+    df = pd.DataFrame(
+        {"id": ["1; 2", None, " 3", "4", "5;6;7", 8], "taxon": [1, 2, 3, 4, 5, 6]}, index=[10, 11, 12, 13, 14, 15]
+    )
+    exploded = explode_column(df, "id", ";")
+    assert exploded["id"].tolist()[:2] == ["1", "2"]
+    assert pd.isnull(exploded["id"].iloc[2])
+    assert exploded["id"].tolist()[3:] == ["3", "4", "5", "6", "7", "8"]
+    assert exploded.index.tolist() == [10, 10, 11, 12, 13, 14, 14, 14, 15]
+    assert exploded["taxon"].tolist() == [1, 1, 2, 3, 4, 5, 5, 5, 6]
+    # the source DataFrame is left as it was
+    assert df["id"].tolist()[2] == " 3"
+
+
+def test_split_values_without_lists(split_engine):
+    values = pd.Series(["P1", np.nan, "P3"], dtype=object)
+    flat, repeats = split_values(values, ";")
+    assert repeats is None
+    assert flat[0] == "P1" and pd.isnull(flat[1]) and flat[2] == "P3"
+
+    flat, repeats = split_values(pd.Series(["P1 ", "P2"], dtype="string"), ";")
+    assert repeats is None
+    assert flat.tolist() == ["P1", "P2"]
+
+
+@pytest.mark.parametrize("chunksize", [1, 2, 100])
+def test_df_mappings_stream(chunksize):
+    mapping_kwargs = dict(
+        subject_column="GeneID",
+        subject_curie_prefix="NCBIGene:",
+        predicate_id="skos:exactMatch",
+        object_column="UniProtKB-AC",
+        object_curie_prefix="UniProtKB:",
+        mapping_justification="semapv:UnspecifiedMatching",
+        filter_column="NCBI-taxon",
+        filter_ids=[9031, 9615, 9913, 9823, 227321],
+    )
+    read_kwargs = dict(names=UNIPROT_ID_MAPPING_SELECTED_COLUMNS, dtype={"GeneID": str}, sep="\t")
+    expected = df_mappings(df=pd.read_csv("tests/resources/uniprot_test.tsv", **read_kwargs), **mapping_kwargs)
+    chunks = pd.read_csv("tests/resources/uniprot_test.tsv", chunksize=chunksize, **read_kwargs)
+    streamed = pd.concat(df_mappings_stream(chunks=chunks, **mapping_kwargs))
+    pd.testing.assert_frame_equal(streamed, expected)
+
+
+def test_df_mappings_stream_drops_duplicates_across_chunks():
+    df = pd.DataFrame(
+        {
+            "GeneID": ["1", "2; 3", "1", "3", "4", "2"],
+            "Ensembl_gene_identifier": ["ENSG1", "ENSG2", "ENSG1", "ENSG2", None, "ENSG2"],
+        }
+    )
+    mapping_kwargs = dict(
+        subject_column="GeneID",
+        subject_curie_prefix="NCBIGene:",
+        object_column="Ensembl_gene_identifier",
+        object_curie_prefix="ENSEMBL:",
+    )
+    chunks = [df.iloc[start : start + 2] for start in range(0, len(df), 2)]
+    streamed = pd.concat(df_mappings_stream(chunks=chunks, **mapping_kwargs))
+    pd.testing.assert_frame_equal(streamed, df_mappings(df=df, **mapping_kwargs))
+    assert list(streamed["subject_id"]) == ["NCBIGene:1", "NCBIGene:2", "NCBIGene:3"]
+
+
+def test_run_source_plan(tmp_path, monkeypatch):
+    (tmp_path / "data" / "hgnc").mkdir(parents=True)
+    shutil.copy("tests/resources/hgnc_test.txt", tmp_path / "data" / "hgnc" / "hgnc_complete_set.txt")
+    hgnc_df = pd.read_csv("tests/resources/hgnc_test.txt", sep="\t", dtype="string")
+    expected = df_mappings(
+        df=explode_column(hgnc_df, "omim_id", "|"),
+        subject_column="hgnc_id",
+        object_column="omim_id",
+        object_curie_prefix="OMIM:",
+    )
+    [plan] = plan_mappings(load_mapping_spec(), only=["hgnc_to_omim"])
+    plan.mappings[0].min_count = 0
+    monkeypatch.chdir(tmp_path)
+    [mapped] = run_source_plan(plan, cache_directory=None)
+    pd.testing.assert_frame_equal(mapped, expected)
+
+
+def test_run_chunked_source_plan(tmp_path, monkeypatch):
+    (tmp_path / "data" / "uniprot").mkdir(parents=True)
+    uniprot_df = pd.read_csv("tests/resources/uniprot_test.tsv", names=UNIPROT_ID_MAPPING_SELECTED_COLUMNS, sep="\t")
+    uniprot_df.to_csv(tmp_path / "data" / "uniprot" / "idmapping_filtered.tsv.gz", sep="\t", header=False, index=False)
+    [plan] = plan_mappings(load_mapping_spec(), only=["uniprot_to_ncbi"])
+    assert plan.usecols == ["GeneID", "UniProtKB-AC", "NCBI-taxon"]
+    plan.mappings[0].min_count = 0
+    monkeypatch.setattr(cli_utils, "CHUNK_SIZE", 1)
+    monkeypatch.chdir(tmp_path)
+    [mapped] = run_source_plan(plan, cache_directory=None)
+    assert len(mapped) == 4
+
+
+def test_run_empty_chunked_source_plan(monkeypatch):
+    # i.e. the memory-mapped Arrow IPC file of an empty source file
+    monkeypatch.setattr(cli_utils, "read_source", lambda *args, **kwargs: iter([]))
+    [plan] = plan_mappings(load_mapping_spec(), only=["uniprot_to_ncbi"])
+    plan.mappings[0].min_count = -1
+    [mapped] = run_source_plan(plan, cache_directory=None)
+    assert mapped.empty and list(mapped.columns) == MAPPING_COLUMNS
+    # reported as too few mappings
+    plan.mappings[0].min_count = 0
+    with pytest.raises(AssertionError):
+        run_source_plan(plan, cache_directory=None)
+
+
+def test_run_source_plan_min_count(tmp_path, monkeypatch):
+    (tmp_path / "data" / "hgnc").mkdir(parents=True)
+    shutil.copy("tests/resources/hgnc_test.txt", tmp_path / "data" / "hgnc" / "hgnc_complete_set.txt")
+    [plan] = plan_mappings(load_mapping_spec(), only=["hgnc_to_ncbi"])
+    monkeypatch.chdir(tmp_path)
+    with pytest.raises(AssertionError):
+        run_source_plan(plan, cache_directory=None)
+
+
+TEST_MAPPING_SPEC = """
+sources:
+  hgnc:
+    path: tests/resources/hgnc_test.txt
+    read_options: {sep: "\\t", dtype: string}
+  uniprot:
+    path: tests/resources/uniprot_test.tsv
+    read_options: {sep: "\\t", names: UNIPROT_ID_MAPPING_SELECTED_COLUMNS, dtype: {GeneID: str}}
+    chunked: true
+mappings:
+  - {name: uniprot_to_ncbi, description: UniProtKB-NCBIGene, source: uniprot, subject_column: GeneID,
+     subject_curie_prefix: "NCBIGene:", object_column: UniProtKB-AC, object_curie_prefix: "UniProtKB:"}
+  - {name: hgnc_to_ncbi, description: HGNC-NCBI Gene, source: hgnc, subject_column: hgnc_id,
+     object_column: entrez_id, object_curie_prefix: "NCBIGene:"}
+  - {name: hgnc_to_omim, description: HGNC-OMIM, source: hgnc, explode: {omim_id: "|"}, subject_column: hgnc_id,
+     object_column: omim_id, object_curie_prefix: "OMIM:"}
+"""
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_generate_gene_mappings(tmp_path, jobs):
+    spec_path = tmp_path / "mappings.yaml"
+    spec_path.write_text(TEST_MAPPING_SPEC)
+    mappings = generate_gene_mappings(cache_directory=None, jobs=jobs, spec_path=str(spec_path))
+    assert list(mappings.columns) == ["subject_id", "predicate_id", "object_id", "mapping_justification"]
+    # mappings are concatenated in the order of the specification
+    assert mappings["subject_id"].iloc[0].startswith("NCBIGene:")
+    assert mappings["object_id"].iloc[-1].startswith("OMIM:")
+    assert len(mappings) == 4 + 9 + 4
+
+    only = generate_gene_mappings(cache_directory=None, jobs=jobs, only=["hgnc_to_omim"], spec_path=str(spec_path))
+    assert len(only) == 4
+
+
+@pytest.mark.parametrize("arrow", [True, False])
+def test_preprocess_alliance_df(arrow, monkeypatch):
+    if not arrow:
+        monkeypatch.setattr(cli_utils, "pc", None)
+    df = pd.DataFrame(
+        {
+            "GeneID": ["MGI:1", "MGI:2", "HGNC:3", "ZFIN:ZDB-GENE-4", "XMGI:5", "RGD:6", pd.NA, "MGI:8"],
+            "GlobalCrossReferenceID": [
+                "NCBI_Gene:11",
+                "PANTHER:PTHR1",
+                "ENSEMBL:ENSG3",
+                "UniProtKB:P4",
+                "ENSEMBL:ENSG5",
+                "RGD:6",
+                "ENSEMBL:ENSG7",
+                pd.NA,
+            ],
+            "TaxonID": ["NCBITaxon:10090", "NCBITaxon:10090", "NCBITaxon:9606", "NCBITaxon:7955", "NCBITaxon:1"]
+            + ["NCBITaxon:10116"] * 3,
+        },
+        index=range(10, 18),
+        dtype="string",
+    )
+    result = preprocess_alliance_df(
+        df,
+        exclude_taxon=["NCBITaxon:9606"],
+        include_curie=["MGI:", "RGD:", "ZFIN:"],
+        include_xref_curie=["ENSEMBL:", "NCBI_Gene:", "UniProtKB:", "RGD:"],
+    )
+    # CURIE prefixes are matched at the start of the CURIEs only, genes cross referencing themselves are left out
+    assert list(result.index) == [10, 13]
+    assert list(result["GlobalCrossReferenceID"]) == ["NCBIGene:11", "UniProtKB:P4"]
+    assert result["GlobalCrossReferenceID"].dtype == "string"
+    # the source DataFrame is left as it is
+    assert df.loc[10, "GlobalCrossReferenceID"] == "NCBI_Gene:11"
@@ -0,0 +1,96 @@
+"""
+Unit tests for the bulk standardization of CURIEs
+"""
+
+import pandas as pd
+import pytest
+from curies import Converter, Record
+from curies.api import CURIEStandardizationError
+
+from monarch_gene_mapping import curie_utils
+from monarch_gene_mapping.curie_utils import (
+    UnknownPrefixError,
+    converter_cache_path,
+    load_converter,
+    split_curies,
+    standardize_curies,
+)
+
+converter = Converter.from_extended_prefix_map(
+    [
+        Record(prefix="NCBIGene", prefix_synonyms=["ncbigene"], uri_prefix="http://identifiers.org/ncbigene/"),
+        Record(prefix="HGNC", prefix_synonyms=["hgnc"], uri_prefix="http://identifiers.org/hgnc/"),
+        Record(prefix="UniProtKB", uri_prefix="http://purl.uniprot.org/uniprot/"),
+    ]
+)
+
+
+@pytest.fixture(params=["pyarrow", "pandas"])
+def backend(request, monkeypatch):
+    if request.param == "pyarrow":
+        pytest.importorskip("pyarrow")
+    else:
+        monkeypatch.setattr(curie_utils, "pa", None)
+        monkeypatch.setattr(curie_utils, "pc", None)
+    return request.param
+
+
+def test_standardize_curies_as_the_converter(backend):
+    df = pd.DataFrame(
+        {
+            "subject_id": ["hgnc:5", "HGNC:7", "ncbigene:1:a", "HGNC:5"],
+            "object_id": ["UniProtKB:P1", "NCBIGene:2", "ncbigene:3", "UniProtKB:P1"],
+        }
+    )
+    expected = df.copy()
+    converter.pd_standardize_curie(expected, column="subject_id", strict=True)
+    converter.pd_standardize_curie(expected, column="object_id", strict=True)
+
+    changed = standardize_curies(df, ["subject_id", "object_id"], converter)
+    pd.testing.assert_frame_equal(df, expected)
+    assert list(df["subject_id"]) == ["HGNC:5", "HGNC:7", "NCBIGene:1:a", "HGNC:5"]
+    assert changed == {"subject_id": 2, "object_id": 1}
+
+
+def test_unknown_prefixes_reported_together(backend):
+    df = pd.DataFrame({"subject_id": ["HGNC:5", "FOO:1", "BAR:2", "FOO:3"]})
+    with pytest.raises(UnknownPrefixError) as error:
+        standardize_curies(df, ["subject_id"], converter)
+    assert error.value.prefixes == {"FOO": 2, "BAR": 1}
+    assert error.value.examples == {"FOO": "FOO:1", "BAR": "BAR:2"}
+    # callers of the converter's strict mode still catch it
+    assert isinstance(error.value, CURIEStandardizationError)
+
+
+@pytest.mark.parametrize("value", ["HGNC5", None])
+def test_not_a_curie_fails_as_the_converter(backend, value):
+    df = pd.DataFrame({"subject_id": ["HGNC:5", value]})
+    with pytest.raises(Exception) as expected:
+        converter.pd_standardize_curie(df.copy(), column="subject_id", strict=True)
+    with pytest.raises(expected.type):
+        standardize_curies(df, ["subject_id"], converter)
+
+
+def test_split_curies(backend):
+    prefixes, codes, identifiers, invalid = split_curies(pd.Series(["HGNC:5", "OMIM:1", "HGNC:a:b", "x"]).to_numpy())
+    assert list(prefixes[codes][:3]) == ["HGNC", "OMIM", "HGNC"]
+    assert list(curie_utils._take(identifiers, [0, 2])) == ["5", "a:b"]
+    assert list(invalid) == [False, False, False, True]
+
+
+def test_load_converter_cached(tmp_path):
+    path = converter_cache_path(("go",), str(tmp_path))
+    built = load_converter(("go",), str(tmp_path))
+    assert path.exists()
+    # built once per process
+    assert load_converter(("go",), str(tmp_path)) is built
+
+    load_converter.cache_clear()
+    cached = load_converter(("go",), str(tmp_path))
+    assert cached is not built
+    assert cached.prefix_map == built.prefix_map
+
+    # an unreadable cache file is rebuilt
+    load_converter.cache_clear()
+    path.write_bytes(b"not a pickle")
+    assert load_converter(("go",), str(tmp_path)).prefix_map == built.prefix_map
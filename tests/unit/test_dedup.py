@@ -0,0 +1,91 @@
+"""
+Unit tests for the deduplication of mappings on integer codes
+"""
+
+import pandas as pd
+import pytest
+
+from monarch_gene_mapping import dedup
+from monarch_gene_mapping.cli_utils import generate_gene_mappings, term_column
+from monarch_gene_mapping.dedup import deduplicate_sources, drop_duplicate_mappings, duplicated_mappings, mapping_keys
+from monarch_gene_mapping.instrumentation import RunReport
+
+
+@pytest.fixture(params=["pyarrow", "pandas"])
+def backend(request, monkeypatch):
+    if request.param == "pyarrow":
+        pytest.importorskip("pyarrow")
+    else:
+        monkeypatch.setattr(dedup, "pa", None)
+        monkeypatch.setattr(dedup, "pc", None)
+    return request.param
+
+
+def mappings(subjects, objects, predicate_id="skos:exactMatch"):
+    df = pd.DataFrame({"subject_id": subjects, "object_id": objects})
+    df.insert(1, "predicate_id", term_column(predicate_id, len(df)))
+    return df
+
+
+@pytest.mark.parametrize("dtype", [object, "string"])
+def test_drop_duplicate_mappings_as_pandas(backend, dtype):
+    df = mappings(
+        ["HGNC:1", "HGNC:1", "HGNC:2", None, None, "HGNC:1"],
+        ["OMIM:1", "OMIM:1", "OMIM:1", "OMIM:2", "OMIM:2", "OMIM:2"],
+    ).astype({"subject_id": dtype, "object_id": dtype})
+    pd.testing.assert_frame_equal(drop_duplicate_mappings(df), df.drop_duplicates())
+    assert list(duplicated_mappings(df, ["subject_id"])) == list(df.duplicated(["subject_id"]))
+
+
+def test_drop_duplicate_mappings_of_mixed_values(backend):
+    # GeneID columns read without a dtype hold numbers
+    df = pd.DataFrame({"subject_id": [1, "1", 1, 2.0], "object_id": ["a", "a", "a", "b"]})
+    pd.testing.assert_frame_equal(drop_duplicate_mappings(df), df.drop_duplicates())
+
+
+def test_mapping_keys_compacted(monkeypatch):
+    # keys are factorized before they would overflow
+    monkeypatch.setattr(dedup, "KEY_BOUND", 8)
+    df = mappings(["a", "b", "c", "a", "b"], ["x", "y", "z", "x", "z"])
+    keys = mapping_keys(df)
+    assert keys[0] == keys[3]
+    assert len(set(keys)) == 4
+
+
+def test_deduplicate_sources():
+    frames = {
+        "hgnc_to_ncbi": mappings(["HGNC:1", "HGNC:2"], ["NCBIGene:1", "NCBIGene:2"]),
+        "alliance": mappings(["HGNC:2", "MGI:1"], ["NCBIGene:2", "NCBIGene:3"]),
+        "uniprot_to_ncbi": mappings(["HGNC:1", "HGNC:2"], ["NCBIGene:1", "NCBIGene:2"], "skos:closeMatch"),
+    }
+    concatenated = pd.concat(frames.values())
+    kept, duplicates = deduplicate_sources(concatenated, list(frames), [len(frame) for frame in frames.values()])
+    # the mapping of the first (preferred) source is kept, only the triples are compared
+    assert list(kept["subject_id"]) == ["HGNC:1", "HGNC:2", "MGI:1", "HGNC:1", "HGNC:2"]
+    assert duplicates == {"hgnc_to_ncbi": 0, "alliance": 1, "uniprot_to_ncbi": 0}
+
+
+TEST_MAPPING_SPEC = """
+sources:
+  hgnc:
+    path: tests/resources/hgnc_test.txt
+    read_options: {sep: "\\t", dtype: string}
+mappings:
+  - {name: hgnc_to_ncbi, description: HGNC-NCBI Gene, source: hgnc, subject_column: hgnc_id,
+     object_column: entrez_id, object_curie_prefix: "NCBIGene:"}
+  - {name: hgnc_to_ncbi_again, description: HGNC-NCBI Gene, source: hgnc, subject_column: hgnc_id,
+     object_column: entrez_id, object_curie_prefix: "NCBIGene:", mapping_justification: semapv:ManualMappingCuration}
+"""
+
+
+def test_generate_gene_mappings_deduplicated(tmp_path):
+    spec_path = tmp_path / "mappings.yaml"
+    spec_path.write_text(TEST_MAPPING_SPEC)
+    run_report = RunReport()
+    mappings = generate_gene_mappings(cache_directory=None, spec_path=str(spec_path), run_report=run_report)
+    assert len(mappings) == 9
+    assert set(mappings["mapping_justification"]) == {"semapv:UnspecifiedMatching"}
+    assert run_report.details["duplicates"] == {"hgnc_to_ncbi": 0, "hgnc_to_ncbi_again": 9}
+
+    kept = generate_gene_mappings(cache_directory=None, spec_path=str(spec_path), deduplicate=False)
+    assert len(kept) == 18
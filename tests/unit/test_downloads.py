@@ -0,0 +1,229 @@
+"""
+Unit tests for the concurrent, resumable downloads, against a local stand-in HTTP server
+"""
+
+import gzip
+import hashlib
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from monarch_gene_mapping import downloads
+from monarch_gene_mapping.downloads import (
+    DownloadEntry,
+    DownloadError,
+    Downloads,
+    download_file,
+    download_files,
+    load_download_entries,
+)
+from monarch_gene_mapping.uniprot_idmapping_preprocess import filter_uniprot_id_mapping_file
+
+LAST_MODIFIED = "Wed, 01 Jan 2025 00:00:00 GMT"
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """
+    Serves the files of its server, honouring conditional and Range requests as a download server does
+    """
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append(dict(self.headers))
+        if self.path not in server.files:
+            self.send_error(404)
+            return
+        body = server.files[self.path]
+        etag = f'"{hashlib.md5(body).hexdigest()}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        start = 0
+        ranged = self.headers.get("Range")
+        if ranged and self.headers.get("If-Range") in (None, etag):
+            start = int(ranged.split("=")[1].split("-")[0])
+            if start >= len(body):
+                self.send_error(416)
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{len(body) - 1}/{len(body)}")
+        else:
+            self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", LAST_MODIFIED)
+        self.send_header("Content-Length", str(len(body) - start))
+        self.end_headers()
+
+        # the connection is cut once after this position, i.e. a transfer cut short
+        cut = server.cuts.pop(self.path, None)
+        if cut is not None:
+            self.wfile.write(body[start:cut])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        # the rest of the file is held back until the gate opens
+        gate = server.gates.get(self.path)
+        if gate is not None:
+            middle = start + (len(body) - start) // 2
+            self.wfile.write(body[start:middle])
+            self.wfile.flush()
+            gate.wait(10)
+            start = middle
+        self.wfile.write(body[start:])
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setattr(downloads, "RETRY_DELAY", 0)
+    http_server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    http_server.files, http_server.cuts, http_server.gates, http_server.requests = {}, {}, {}, []
+    thread = threading.Thread(target=http_server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+    thread.start()
+    http_server.url = f"http://127.0.0.1:{http_server.server_address[1]}"
+    yield http_server
+    for gate in http_server.gates.values():
+        gate.set()
+    http_server.shutdown()
+    http_server.server_close()
+
+
+def _entry(server, name: str, body: bytes, **kwargs) -> DownloadEntry:
+    server.files[f"/{name}"] = body
+    return DownloadEntry(url=f"{server.url}/{name}", local_name=f"data/{name}", tag=name, **kwargs)
+
+
+def test_download_then_unchanged(server, tmp_path):
+    body = bytes(range(256)) * 1000
+    entry = _entry(server, "file.bin", body)
+    downloaded = download_file(entry, str(tmp_path))
+    assert downloaded["status"] == "downloaded"
+    assert (tmp_path / "data" / "file.bin").read_bytes() == body
+    assert not (tmp_path / "data" / "file.bin.part").exists()
+    state = json.loads((tmp_path / "data" / "file.bin.download.json").read_text())
+    assert state["sha256"] == downloaded["sha256"] == hashlib.sha256(body).hexdigest()
+    assert state["last_modified"] == LAST_MODIFIED
+
+    unchanged = download_file(entry, str(tmp_path))
+    assert (unchanged["status"], unchanged["bytes"], unchanged["size"]) == ("unchanged", 0, len(body))
+    assert server.requests[-1]["If-None-Match"] == state["etag"]
+
+    # a changed file is downloaded again
+    server.files["/file.bin"] = body[::-1]
+    assert download_file(entry, str(tmp_path))["status"] == "downloaded"
+    assert (tmp_path / "data" / "file.bin").read_bytes() == body[::-1]
+
+
+def test_resume_partial_transfer(server, tmp_path):
+    body = bytes(range(256)) * 1000
+    entry = _entry(server, "file.bin", body)
+    # a previous run cut short
+    server.cuts["/file.bin"] = 100_000
+    with pytest.raises(DownloadError):
+        download_file(entry, str(tmp_path), retries=0)
+    assert (tmp_path / "data" / "file.bin.part").stat().st_size == 100_000
+
+    downloaded = download_file(entry, str(tmp_path))
+    assert (downloaded["status"], downloaded["bytes"]) == ("resumed", len(body) - 100_000)
+    assert server.requests[-1]["Range"] == "bytes=100000-"
+    assert (tmp_path / "data" / "file.bin").read_bytes() == body
+    assert downloaded["sha256"] == hashlib.sha256(body).hexdigest()
+
+
+def test_transfer_cut_short_resumed(server, tmp_path):
+    body = bytes(range(256)) * 1000
+    entry = _entry(server, "file.bin", body)
+    server.cuts["/file.bin"] = 12_345
+    downloaded = download_file(entry, str(tmp_path))
+    assert downloaded["status"] == "downloaded"
+    assert [request.get("Range") for request in server.requests] == [None, "bytes=12345-"]
+    assert (tmp_path / "data" / "file.bin").read_bytes() == body
+
+
+def test_partial_transfer_of_a_changed_file(server, tmp_path):
+    entry = _entry(server, "file.bin", b"a" * 1000)
+    server.cuts["/file.bin"] = 500
+    with pytest.raises(DownloadError):
+        download_file(entry, str(tmp_path), retries=0)
+    # If-Range no longer matches, the new file is sent whole
+    server.files["/file.bin"] = b"b" * 800
+    downloaded = download_file(entry, str(tmp_path))
+    assert (downloaded["status"], downloaded["bytes"]) == ("downloaded", 800)
+    assert (tmp_path / "data" / "file.bin").read_bytes() == b"b" * 800
+
+
+def test_checksum_verified(server, tmp_path):
+    entry = _entry(server, "file.bin", b"data", sha256="0" * 64)
+    with pytest.raises(DownloadError, match="checksum"):
+        download_file(entry, str(tmp_path))
+    assert not (tmp_path / "data" / "file.bin").exists()
+    assert not (tmp_path / "data" / "file.bin.part").exists()
+
+    entry.sha256 = hashlib.sha256(b"data").hexdigest()
+    assert download_file(entry, str(tmp_path))["status"] == "downloaded"
+
+
+def test_download_files_concurrently(server, tmp_path):
+    entries = [_entry(server, f"file{i}.bin", bytes([i]) * 10_000) for i in range(3)]
+    download_yaml = tmp_path / "download.yaml"
+    download_yaml.write_text(json.dumps([vars(entry) for entry in entries]))
+    assert [entry.tag for entry in load_download_entries(str(download_yaml), tags=["file1.bin"])] == ["file1.bin"]
+    with pytest.raises(ValueError):
+        load_download_entries(str(download_yaml), tags=["unknown"])
+
+    results = download_files(str(download_yaml), str(tmp_path), jobs=3)
+    assert [result["status"] for result in results] == ["downloaded"] * 3
+    for i in range(3):
+        assert (tmp_path / "data" / f"file{i}.bin").read_bytes() == bytes([i]) * 10_000
+    # a failed download is reported once the others are finished
+    del server.files["/file0.bin"]
+    (tmp_path / "data" / "file0.bin.download.json").unlink()
+    with pytest.raises(DownloadError, match="404"):
+        download_files(str(download_yaml), str(tmp_path), jobs=3)
+
+
+def test_stream_while_downloading(server, tmp_path):
+    body = bytes(range(256)) * 4000
+    entry = _entry(server, "file.bin", body)
+    server.gates["/file.bin"] = gate = threading.Event()
+    with Downloads([entry], str(tmp_path)) as files:
+        reader = files.stream("file.bin")
+        head = reader.read(1000)
+        # read while the second half of the file is held back
+        assert not files.transfers["file.bin"].finished
+        gate.set()
+        data = head + b"".join(iter(lambda: reader.read(65536), b""))
+        reader.close()
+        [result] = files.wait()
+    assert data == body
+    assert result["status"] == "downloaded"
+
+    # an unchanged file isn't streamed
+    with Downloads([entry], str(tmp_path)) as files:
+        assert files.stream("file.bin") is None
+
+
+def test_prefilter_streamed_download(server, tmp_path):
+    fields = [[""] * 22 for _ in range(3000)]
+    for i, line in enumerate(fields):
+        line[0], line[12] = f"Q{i:05d}", ["10090", "654924", "9606"][i % 3]
+    lines = ["\t".join(line) + "\n" for line in fields]
+    entry = _entry(server, "idmapping_selected.tab.gz", gzip.compress("".join(lines).encode()))
+    with Downloads([entry], str(tmp_path)) as files:
+        assert filter_uniprot_id_mapping_file(
+            directory=str(tmp_path / "data"),
+            source_filename="idmapping_selected.tab",
+            target_filename="idmapping_filtered.tsv",
+            source_file=files.stream("idmapping_selected.tab.gz"),
+        )
+        files.wait()
+    with gzip.open(tmp_path / "data" / "idmapping_filtered.tsv.gz", "rt") as target_file:
+        assert target_file.readlines() == [line for line in lines if line.split("\t")[12] != "654924"]
+    manifest = json.loads((tmp_path / "data" / "idmapping_filtered.tsv.manifest.json").read_text())
+    assert manifest["source_sha256"] == hashlib.sha256(server.files["/idmapping_selected.tab.gz"]).hexdigest()
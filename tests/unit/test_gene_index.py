@@ -0,0 +1,98 @@
+"""
+Unit tests for the lookup index of the gene mappings
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from monarch_gene_mapping import gene_index
+from monarch_gene_mapping.gene_index import GeneMappingIndex, prefix_ranks
+from monarch_gene_mapping.sssom_writer import write_sssom_tsv
+
+
+@pytest.fixture(params=["pyarrow", "numpy"])
+def backend(request, monkeypatch):
+    if request.param == "pyarrow":
+        pytest.importorskip("pyarrow")
+    else:
+        monkeypatch.setattr(gene_index, "pa", None)
+    return request.param
+
+
+def _mappings() -> pd.DataFrame:
+    rows = [
+        ("MGI:1", "skos:exactMatch", "ENSEMBL:M1"),
+        ("MGI:1", "skos:exactMatch", "UniProtKB:P1"),
+        ("HGNC:5", "skos:exactMatch", "NCBIGene:5"),
+        ("HGNC:5", "skos:closeMatch", "ENSEMBL:H5"),
+        ("NCBIGene:5", "skos:exactMatch", "ENSEMBL:H5"),
+        ("NCBIGene:1", "skos:exactMatch", "ENSEMBL:M1"),
+        ("NCBIGene:9", "skos:exactMatch", "UniProtKB:P9"),
+    ]
+    return pd.DataFrame(rows, columns=["subject_id", "predicate_id", "object_id"])
+
+
+def test_prefix_ranks():
+    curies = np.array(["HGNC:1", "NCBIGene:2", "ENSEMBL:3", "ZFIN:ZDB-GENE-1", "invalid"], dtype=object)
+    assert list(prefix_ranks(curies)) == [0, 1, 2, 0, 2]
+
+
+def test_resolve_preferred_identifier(backend):
+    index = GeneMappingIndex.from_mappings(_mappings())
+    assert (len(index), index.size) == (7, 9)
+    # naming authority first, then NCBIGene, a CURIE being resolved by itself when it is preferred
+    assert index.resolve("ENSEMBL:M1") == "MGI:1"
+    assert index.resolve("NCBIGene:5") == "HGNC:5"
+    assert index.resolve("HGNC:5") == "HGNC:5"
+    assert index.resolve("UniProtKB:P9") == "NCBIGene:9"
+    assert index.resolve("ENSEMBL:unknown") is None
+
+    # only following exact matches
+    assert index.resolve("ENSEMBL:H5") == "HGNC:5"
+    assert index.resolve("ENSEMBL:H5", predicate_ids=["skos:exactMatch"]) == "NCBIGene:5"
+
+    curies = pd.Series(["UniProtKB:P1", None, "FOO:1", "UniProtKB:P1", "NCBIGene:1"], index=[5, 4, 3, 2, 1])
+    resolved = index.resolve_many(curies)
+    assert list(resolved.index) == [5, 4, 3, 2, 1]
+    # a single mapping is followed: NCBIGene:1 is only mapped to ENSEMBL:M1
+    assert list(resolved) == ["MGI:1", None, None, "MGI:1", "NCBIGene:1"]
+
+
+def test_subjects_and_objects(backend):
+    index = GeneMappingIndex.from_mappings(_mappings())
+    assert index.objects("HGNC:5") == ["NCBIGene:5", "ENSEMBL:H5"]
+    assert index.objects("HGNC:5", predicate_ids=["skos:closeMatch"]) == ["ENSEMBL:H5"]
+    assert index.subjects("ENSEMBL:M1") == ["MGI:1", "NCBIGene:1"]
+    assert index.subjects("MGI:1") == []
+
+
+def test_hash_collision(monkeypatch):
+    index = GeneMappingIndex.from_mappings(_mappings())
+    # every CURIE sharing the same hash
+    monkeypatch.setattr(pd.util, "hash_array", lambda values: np.zeros(len(values), dtype=np.uint64))
+    index.arrays["hashes"] = np.zeros(index.size, dtype=np.uint64)
+    assert index.resolve("ENSEMBL:M1") == "MGI:1"
+    assert index.resolve("ENSEMBL:unknown") is None
+
+
+def test_save_and_load(tmp_path):
+    mappings = _mappings()
+    write_sssom_tsv(mappings, str(tmp_path / "mappings.sssom.tsv"), metadata={"license": "https://example.org"})
+    GeneMappingIndex.from_sssom(str(tmp_path / "mappings.sssom.tsv")).save(str(tmp_path / "mappings.index"))
+    # replaced
+    GeneMappingIndex.from_mappings(mappings).save(str(tmp_path / "mappings.index"))
+
+    index = GeneMappingIndex.load(str(tmp_path / "mappings.index"))
+    assert isinstance(index.arrays["hashes"], np.memmap)
+    assert index.predicate_ids == ["skos:exactMatch", "skos:closeMatch"]
+    assert list(index.resolve_many(mappings["object_id"])) == [
+        "MGI:1",
+        "MGI:1",
+        "HGNC:5",
+        "HGNC:5",
+        "HGNC:5",
+        "MGI:1",
+        "NCBIGene:9",
+    ]
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["mappings.index", "mappings.sssom.tsv"]
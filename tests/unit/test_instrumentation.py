@@ -0,0 +1,95 @@
+"""
+Unit tests for the instrumentation of the pipeline stages
+"""
+
+import json
+import pstats
+
+import pandas as pd
+import pytest
+
+from monarch_gene_mapping.cli_utils import df_mappings
+from monarch_gene_mapping.instrumentation import (
+    RunReport,
+    instrumented,
+    mapping_context,
+    profiling,
+    record_rows,
+    record_step,
+    stage_metrics,
+)
+
+
+def test_stage_metrics():
+    with stage_metrics("stage") as metrics:
+        record_rows(rows_in=10)
+        record_rows(rows_out=4)
+        sum(range(10000))
+    assert metrics.status == "ok"
+    assert (metrics.rows_in, metrics.rows_out) == (10, 4)
+    assert metrics.seconds > 0
+    assert metrics.peak_rss_mb > 0
+
+    with pytest.raises(ZeroDivisionError):
+        with stage_metrics("failing") as metrics:
+            1 / 0
+    assert metrics.status == "failed"
+
+    # nothing is recorded outside of a stage
+    record_rows(rows_in=1)
+    record_step("step", 1, 0)
+
+
+def test_record_steps_of_df_mappings():
+    df = pd.DataFrame(
+        {
+            "gene": ["HGNC:1", "HGNC:2", "HGNC:2", None],
+            "proteins": ["P1|P2", "P3", "P3", "P4"],
+            "taxon": [9606, 9606, 9606, 10090],
+        }
+    )
+    with mapping_context("hgnc_to_uniprot"):
+        result, metrics = instrumented(
+            "hgnc",
+            df_mappings,
+            df,
+            subject_column="gene",
+            object_column="proteins",
+            object_curie_prefix="UniProtKB:",
+            predicate_id="skos:exactMatch",
+            entity_delimiter="|",
+            filter_column="taxon",
+            filter_ids=[9606],
+        )
+    steps = {step["step"]: step for step in metrics.to_dict()["steps"]}
+    assert {step["mapping"] for step in steps.values()} == {"hgnc_to_uniprot"}
+    assert (steps["taxon_filter"]["rows_in"], steps["taxon_filter"]["rows_out"]) == (4, 3)
+    assert steps["dedup"]["rows_lost"] == 1
+    assert (steps["explode"]["rows_in"], steps["explode"]["rows_out"]) == (2, 3)
+    assert steps["final_dedup"]["rows_out"] == len(result) == 3
+
+
+def test_run_report(tmp_path):
+    report = RunReport(jobs=1)
+    with report.stage("download"):
+        pass
+    with pytest.raises(RuntimeError):
+        with report.stage("write"):
+            raise RuntimeError("disk full")
+    report.save(str(tmp_path / "report.json"))
+
+    saved = json.loads((tmp_path / "report.json").read_text())
+    assert saved["status"] == "failed"
+    assert saved["jobs"] == 1
+    assert [(stage["name"], stage["status"]) for stage in saved["stages"]] == [("download", "ok"), ("write", "failed")]
+
+
+def test_profiling(tmp_path):
+    path = tmp_path / "run.pstats"
+    with profiling(str(path), "cprofile"):
+        sorted(range(1000), reverse=True)
+    assert pstats.Stats(str(path)).total_calls > 0
+
+    with pytest.raises(ValueError, match="Unknown profiler"):
+        with profiling(str(path), "perf"):
+            pass
@@ -0,0 +1,54 @@
+"""
+Unit tests for the mapping specification and planner
+"""
+
+import pytest
+
+from monarch_gene_mapping.mapping_spec import load_mapping_spec, plan_mappings
+from monarch_gene_mapping.uniprot_idmapping_preprocess import prefilter_species
+
+
+def test_mapping_spec():
+    spec = load_mapping_spec()
+    assert [mapping.name for mapping in spec.mappings] == [
+        "alliance",
+        "hgnc_to_ncbi",
+        "hgnc_to_omim",
+        "hgnc_to_uniprot",
+        "hgnc_to_ensembl",
+        "ncbi_to_ensembl",
+        "uniprot_to_ncbi",
+    ]
+    assert "10090" in prefilter_species() and "9685" not in prefilter_species()
+    assert {"mapping_set_id", "license"} <= set(spec.sssom_metadata)
+
+
+def test_plan_reads_each_source_once():
+    plans = plan_mappings(load_mapping_spec())
+    assert [plan.source.name for plan in plans] == ["alliance", "hgnc", "ncbi", "uniprot"]
+    [hgnc] = [plan for plan in plans if plan.source.name == "hgnc"]
+    assert len(hgnc.mappings) == 4
+    assert hgnc.usecols == ["hgnc_id", "entrez_id", "omim_id", "uniprot_ids", "ensembl_gene_id"]
+    [alliance] = [plan for plan in plans if plan.source.name == "alliance"]
+    assert alliance.usecols == ["GeneID", "GlobalCrossReferenceID", "TaxonID"]
+
+
+def test_plan_only():
+    [plan] = plan_mappings(load_mapping_spec(), only=["hgnc_to_ncbi"])
+    assert [mapping.name for mapping in plan.mappings] == ["hgnc_to_ncbi"]
+    assert plan.usecols == ["hgnc_id", "entrez_id"]
+    with pytest.raises(ValueError):
+        plan_mappings(load_mapping_spec(), only=["hgnc_to_nowhere"])
+
+
+def test_unknown_spec_key(tmp_path):
+    spec_path = tmp_path / "mappings.yaml"
+    spec_path.write_text("sources:\n  s:\n    path: s.tsv\nmappings:\n  - name: m\n    source: s\n    subjects: a\n")
+    with pytest.raises(ValueError):
+        load_mapping_spec(str(spec_path))
+
+
+def test_prefilter_species_of_spec(tmp_path):
+    spec_path = tmp_path / "mappings.yaml"
+    spec_path.write_text("sources: {}\nmappings: []\nuniprot_prefilter_taxa: [9606, 10090]\n")
+    assert prefilter_species(str(spec_path)) == {"9606", "10090"}
@@ -0,0 +1,64 @@
+"""
+Unit tests for the mapping stage scheduler
+"""
+
+import time
+from typing import List
+
+import pandas as pd
+import pytest
+from typer.testing import CliRunner
+
+from monarch_gene_mapping.main import typer_app
+from monarch_gene_mapping.scheduler import MappingStage, MappingStageError, run_stages
+
+
+def _mappings(count: int, delay: float = 0.0, prefix: str = "X") -> List[pd.DataFrame]:
+    time.sleep(delay)
+    return [pd.DataFrame({"subject_id": [f"{prefix}:{i}" for i in range(count)]})]
+
+
+def _slow(prefix: str = "X") -> List[pd.DataFrame]:
+    return _mappings(3, delay=0.2, prefix=prefix)
+
+
+def _fast(prefix: str = "X") -> List[pd.DataFrame]:
+    return _mappings(2, prefix=prefix)
+
+
+def _broken(prefix: str = "X") -> List[pd.DataFrame]:
+    raise ValueError("broken source")
+
+
+def _too_few(prefix: str = "X") -> List[pd.DataFrame]:
+    assert False, "Expected more mappings"
+
+
+@pytest.mark.parametrize("jobs,executor", [(1, "thread"), (3, "thread"), (2, "process")])
+def test_run_stages_keeps_stage_order(jobs, executor):
+    stages = [MappingStage("slow", _slow), MappingStage("fast", _fast)]
+    results = run_stages(stages, jobs=jobs, executor=executor, prefix="P")
+    assert [len(result[0]) for result in results] == [3, 2]
+    assert list(results[0][0]["subject_id"]) == ["P:0", "P:1", "P:2"]
+
+
+@pytest.mark.parametrize("jobs", [1, 3])
+def test_run_stages_errors(jobs):
+    stages = [MappingStage("broken", _broken), MappingStage("too_few", _too_few), MappingStage("fine", _fast)]
+    with pytest.raises(MappingStageError) as error:
+        run_stages(stages, jobs=jobs)
+    # sequential runs stop at the first failure, concurrent runs report every failed stage
+    expected = ["broken"] if jobs == 1 else ["broken", "too_few"]
+    assert list(error.value.errors) == expected
+    assert isinstance(error.value.errors["broken"], ValueError)
+    if jobs > 1:
+        assert isinstance(error.value.errors["too_few"], AssertionError)
+
+
+def test_unknown_executor():
+    with pytest.raises(ValueError, match="thread, process"):
+        run_stages([MappingStage("fast", _fast)], executor="fiber")
+    # rejected by the command line before anything runs
+    result = CliRunner().invoke(typer_app, ["generate", "--executor", "fiber"])
+    assert result.exit_code == 2
+    assert "thread, process" in result.output
@@ -0,0 +1,135 @@
+"""
+Unit tests for the HTTP lookup service
+"""
+
+import asyncio
+import http.client
+import json
+import os
+import socket
+import threading
+
+import pandas as pd
+import pytest
+
+from monarch_gene_mapping import service as service_module
+from monarch_gene_mapping.service import MappingService, ResponseCache
+from monarch_gene_mapping.sssom_writer import write_sssom_tsv
+
+
+def _write_mappings(path, rows):
+    mappings = pd.DataFrame(rows, columns=["subject_id", "predicate_id", "object_id"])
+    write_sssom_tsv(mappings, str(path))
+
+
+@pytest.fixture
+def served(tmp_path):
+    """
+    Service over a mapping file, run in a background event loop, with a client connection to it
+    """
+    path = tmp_path / "mappings.sssom.tsv"
+    _write_mappings(
+        path, [("HGNC:5", "skos:exactMatch", "NCBIGene:5"), ("NCBIGene:5", "skos:exactMatch", "ENSEMBL:E5")]
+    )
+    service = MappingService(str(path), cache_size=2, reload_interval=0)
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    server = asyncio.run_coroutine_threadsafe(service.start(port=0), loop).result()
+    connection = http.client.HTTPConnection("127.0.0.1", server.sockets[0].getsockname()[1], timeout=10)
+    yield service, connection, loop
+    connection.close()
+    asyncio.run_coroutine_threadsafe(_shutdown(server), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    loop.close()
+
+
+async def _shutdown(server):
+    server.close()
+    # the handlers of the connections still open
+    tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def _request(connection, method, target, body=None):
+    connection.request(method, target, body=None if body is None else json.dumps(body))
+    response = connection.getresponse()
+    return response.status, json.loads(response.read())
+
+
+def test_resolve(served):
+    service, connection, _ = served
+    # the same kept alive connection for every request
+    assert _request(connection, "GET", "/resolve?curie=ENSEMBL:E5&curie=FOO:1") == (
+        200,
+        {"resolved": {"ENSEMBL:E5": "NCBIGene:5", "FOO:1": None}},
+    )
+    curies = ["NCBIGene:5", "ENSEMBL:E5", None] * 5000
+    assert _request(connection, "POST", "/resolve", {"curies": curies}) == (
+        200,
+        {"resolved": ["HGNC:5", "NCBIGene:5", None] * 5000},
+    )
+    assert _request(connection, "POST", "/resolve", ["NCBIGene:5"]) == (200, {"resolved": ["HGNC:5"]})
+    assert _request(connection, "GET", "/resolve?curie=ENSEMBL:E5&curie=FOO:1")[0] == 200
+
+    status, health = _request(connection, "GET", "/health")
+    assert (status, health["mappings"], health["requests"]) == (200, 2, 5)
+    # the large batch response is not cached
+    assert health["cache"] == {"entries": 2, "hits": 1, "misses": 3}
+
+
+@pytest.mark.parametrize(
+    "method, target, body, status",
+    [
+        ("GET", "/mappings", None, 404),
+        ("DELETE", "/resolve", None, 405),
+        ("POST", "/resolve", {"curie": "HGNC:5"}, 400),
+        ("POST", "/resolve", [["HGNC:5"]], 400),
+        ("POST", "/resolve", {"curies": ["HGNC:5"], "predicate_ids": "skos:exactMatch"}, 400),
+        ("POST", "/resolve", {"curies": ["HGNC:5"], "predicate_ids": [1]}, 400),
+    ],
+)
+def test_errors(served, method, target, body, status):
+    _, connection, _ = served
+    assert _request(connection, method, target, body)[0] == status
+    # the connection is still usable
+    assert _request(connection, "POST", "/resolve", ["NCBIGene:5"]) == (200, {"resolved": ["HGNC:5"]})
+
+
+def test_malformed_body(served, monkeypatch):
+    _, connection, _ = served
+    monkeypatch.setattr(service_module, "KEEP_ALIVE_TIMEOUT", 0.2)
+    with socket.create_connection((connection.host, connection.port), timeout=10) as client:
+        client.sendall(b"POST /resolve HTTP/1.1\r\nContent-Length: -1\r\n\r\n")
+        assert client.recv(1024).startswith(b"HTTP/1.1 400 ")
+    # a client stopping partway through its body is disconnected
+    with socket.create_connection((connection.host, connection.port), timeout=10) as client:
+        client.sendall(b'POST /resolve HTTP/1.1\r\nContent-Length: 10\r\n\r\n["HG')
+        assert client.recv(1024) == b""
+
+
+def test_reload(served):
+    service, connection, loop = served
+    assert _request(connection, "POST", "/resolve", ["ENSEMBL:E5"]) == (200, {"resolved": ["NCBIGene:5"]})
+    assert not asyncio.run_coroutine_threadsafe(service.reload(), loop).result()
+
+    # a new mapping file, replacing the previous one
+    new_path = f"{service.path}.new"
+    _write_mappings(new_path, [("HGNC:5", "skos:exactMatch", "ENSEMBL:E5")])
+    os.replace(new_path, service.path)
+    assert asyncio.run_coroutine_threadsafe(service.reload(), loop).result()
+    assert _request(connection, "POST", "/resolve", ["ENSEMBL:E5"]) == (200, {"resolved": ["HGNC:5"]})
+    assert _request(connection, "GET", "/health")[1]["reloads"] == 1
+
+
+def test_response_cache():
+    cache = ResponseCache(size=2)
+    cache.put(b"a", b"1")
+    cache.put(b"b", b"2")
+    assert cache.get(b"a") == b"1"
+    cache.put(b"c", b"3")
+    # least recently used first out
+    assert (cache.get(b"b"), cache.get(b"a"), cache.get(b"c")) == (None, b"1", b"3")
@@ -0,0 +1,160 @@
+"""
+Unit tests for the mapping shards and the changelog between releases
+"""
+
+import shutil
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from monarch_gene_mapping import shards as shards_module
+from monarch_gene_mapping.cli_utils import generate_gene_mappings
+from monarch_gene_mapping.instrumentation import RunReport
+from monarch_gene_mapping.mapping_spec import load_mapping_spec, plan_mappings
+from monarch_gene_mapping.shards import (
+    SHARD_MODULES,
+    code_fingerprint,
+    mapping_changelog,
+    plan_shards,
+    prune_shards,
+    read_release,
+    register_release,
+    shard_directory,
+    write_release,
+    write_shard,
+)
+
+TEST_MAPPING_SPEC = """
+sources:
+  hgnc:
+    path: {directory}/hgnc_test.txt
+    read_options: {{sep: "\\t", dtype: string}}
+  uniprot:
+    path: {directory}/uniprot_test.tsv
+    read_options: {{sep: "\\t", names: UNIPROT_ID_MAPPING_SELECTED_COLUMNS, dtype: {{GeneID: str}}}}
+    chunked: true
+mappings:
+  - {{name: uniprot_to_ncbi, description: UniProtKB-NCBIGene, source: uniprot, subject_column: GeneID,
+     subject_curie_prefix: "NCBIGene:", object_column: UniProtKB-AC, object_curie_prefix: "UniProtKB:"}}
+  - {{name: hgnc_to_ncbi, description: HGNC-NCBI Gene, source: hgnc, subject_column: hgnc_id,
+     object_column: entrez_id, object_curie_prefix: "NCBIGene:", min_count: {min_count}}}
+"""
+
+
+def _spec(tmp_path, min_count=0) -> str:
+    for filename in ["hgnc_test.txt", "uniprot_test.tsv"]:
+        if not (tmp_path / filename).exists():
+            shutil.copy(f"tests/resources/{filename}", tmp_path / filename)
+    spec_path = tmp_path / "mappings.yaml"
+    spec_path.write_text(TEST_MAPPING_SPEC.format(directory=tmp_path, min_count=min_count))
+    return str(spec_path)
+
+
+def _shards(tmp_path, cache_directory, min_count=0):
+    plans = plan_mappings(load_mapping_spec(_spec(tmp_path, min_count)))
+    return {name: shard for plan in plans for name, shard in plan_shards(plan, cache_directory).items()}
+
+
+def test_shard_keys(tmp_path):
+    cache_directory = str(tmp_path / "cache")
+    shards = _shards(tmp_path, cache_directory)
+    assert shards["hgnc_to_ncbi"]["filename"].startswith("hgnc_to_ncbi.")
+    # the minimum count doesn't change the mappings
+    assert _shards(tmp_path, cache_directory, min_count=2) == shards
+
+    with open(tmp_path / "hgnc_test.txt", "a") as hgnc_file:
+        hgnc_file.write("\n")
+    changed = _shards(tmp_path, cache_directory)
+    assert changed["hgnc_to_ncbi"]["key"] != shards["hgnc_to_ncbi"]["key"]
+    assert changed["uniprot_to_ncbi"]["key"] == shards["uniprot_to_ncbi"]["key"]
+
+
+def test_shard_keys_change_with_the_code(tmp_path, monkeypatch):
+    cache_directory = str(tmp_path / "cache")
+    shards = _shards(tmp_path, cache_directory)
+    monkeypatch.setattr(shards_module, "code_fingerprint", lambda: "changed")
+    changed = _shards(tmp_path, cache_directory)
+    assert all(changed[name]["key"] != shard["key"] for name, shard in shards.items())
+    # the fingerprint covers the package version and the code of every module generating the mappings
+    assert len(code_fingerprint()) == 64
+    assert all((Path(shards_module.__file__).parent / module).exists() for module in SHARD_MODULES)
+
+
+def test_generate_gene_mappings_reuses_shards(tmp_path, monkeypatch):
+    cache_directory = str(tmp_path / "cache")
+    spec_path = _spec(tmp_path)
+    run_report = RunReport()
+    mappings = generate_gene_mappings(cache_directory=cache_directory, spec_path=spec_path, run_report=run_report)
+    assert not any(shard["reused"] for shard in run_report.details["shards"].values())
+
+    hgnc = pd.read_csv(tmp_path / "hgnc_test.txt", sep="\t", dtype=str)
+    hgnc.iloc[1:].to_csv(tmp_path / "hgnc_test.txt", sep="\t", index=False)
+    run_report = RunReport()
+    updated = generate_gene_mappings(cache_directory=cache_directory, spec_path=spec_path, run_report=run_report)
+    assert {name: shard["reused"] for name, shard in run_report.details["shards"].items()} == {
+        "uniprot_to_ncbi": True,
+        "hgnc_to_ncbi": False,
+    }
+    # the same mappings as generated from scratch
+    pd.testing.assert_frame_equal(updated, generate_gene_mappings(cache_directory=None, spec_path=spec_path))
+    assert len(updated) == len(mappings) - 1
+
+
+def test_mapping_changelog(tmp_path):
+    cache_directory = str(tmp_path / "cache")
+    directory = shard_directory(cache_directory)
+    columns = ["subject_id", "predicate_id", "object_id"]
+    first = _shards(tmp_path, cache_directory)
+    write_shard(
+        directory,
+        first["hgnc_to_ncbi"],
+        pd.DataFrame([["HGNC:1", "skos:exactMatch", "NCBIGene:1"]] * 2, columns=columns),
+    )
+    write_shard(
+        directory,
+        first["uniprot_to_ncbi"],
+        pd.DataFrame([["NCBIGene:1", "skos:exactMatch", "UniProtKB:P1"]], columns=columns),
+    )
+    assert mapping_changelog(None, first, directory) == (None, {})
+    write_release(str(tmp_path / "gene_mappings.release.json"), first, None)
+
+    with open(tmp_path / "hgnc_test.txt", "a") as hgnc_file:
+        hgnc_file.write("\n")
+    second = _shards(tmp_path, cache_directory)
+    write_shard(
+        directory,
+        second["hgnc_to_ncbi"],
+        pd.DataFrame(
+            [["HGNC:2", "skos:exactMatch", "NCBIGene:2"], ["HGNC:1", "skos:exactMatch", "NCBIGene:1"]], columns=columns
+        ),
+    )
+    changelog, changes = mapping_changelog(
+        read_release(str(tmp_path / "gene_mappings.release.json")), second, directory
+    )
+    assert changes == {
+        "uniprot_to_ncbi": {"status": "unchanged", "added": 0, "removed": 0},
+        "hgnc_to_ncbi": {"status": "changed", "added": 1, "removed": 0},
+    }
+    assert changelog.values.tolist() == [["added", "hgnc", "hgnc_to_ncbi", "HGNC:2", "skos:exactMatch", "NCBIGene:2"]]
+
+    # a mapping dropped from the specification
+    _, changes = mapping_changelog({"shards": first}, {"uniprot_to_ncbi": second["uniprot_to_ncbi"]}, directory)
+    assert changes["hgnc_to_ncbi"] == {"status": "removed", "added": 0, "removed": 2}
+
+    # the shards of a release of another output directory sharing the cache are kept
+    (tmp_path / "staging").mkdir()
+    write_release(str(tmp_path / "staging" / "gene_mappings.release.json"), first, None)
+    register_release(cache_directory, str(tmp_path / "staging" / "gene_mappings.release.json"), first)
+    write_release(str(tmp_path / "gene_mappings.release.json"), second, changes)
+    keep = register_release(cache_directory, str(tmp_path / "gene_mappings.release.json"), second)
+    assert prune_shards(cache_directory, keep) == []
+
+    # only the shards of the releases are kept
+    shutil.rmtree(tmp_path / "staging")
+    keep = register_release(cache_directory, str(tmp_path / "gene_mappings.release.json"), second)
+    assert prune_shards(cache_directory, keep) == [first["hgnc_to_ncbi"]["filename"]]
+    _, changes = mapping_changelog({"shards": first}, second, directory)
+    assert changes["hgnc_to_ncbi"]["status"] == "unavailable"
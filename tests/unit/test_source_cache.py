@@ -0,0 +1,97 @@
+"""
+Unit tests for the cache of parsed source files
+"""
+
+import gzip
+import os
+import shutil
+
+import pandas as pd
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from monarch_gene_mapping.cli_utils import UNIPROT_ID_MAPPING_SELECTED_COLUMNS
+from monarch_gene_mapping.source_cache import prune_cache, read_arrow, read_index, read_source, verify_cache
+from monarch_gene_mapping.uniprot_idmapping_preprocess import arrow_path, filter_uniprot_id_mapping_file
+
+HGNC_READ_OPTIONS = dict(sep="\t", dtype="string", usecols=["hgnc_id", "entrez_id", "omim_id"])
+UNIPROT_READ_OPTIONS = dict(
+    sep="\t",
+    names=UNIPROT_ID_MAPPING_SELECTED_COLUMNS,
+    usecols=["UniProtKB-AC", "GeneID", "NCBI-taxon"],
+    dtype={"GeneID": str},
+)
+
+
+def test_read_source(tmp_path):
+    source = shutil.copy("tests/resources/hgnc_test.txt", tmp_path)
+    expected = pd.read_csv(source, **HGNC_READ_OPTIONS)
+    cache_directory = str(tmp_path / "cache")
+    # the first read parses the source file, the second one reads the cached copy
+    for _ in range(2):
+        pd.testing.assert_frame_equal(
+            read_source(source, cache_directory=cache_directory, **HGNC_READ_OPTIONS), expected
+        )
+    assert len(read_index(cache_directory)) == 1
+    # different read options give a different cache entry
+    read_source(source, cache_directory=cache_directory, sep="\t", dtype="string")
+    assert len(read_index(cache_directory)) == 2
+
+
+def test_read_source_chunks(tmp_path):
+    source = shutil.copy("tests/resources/uniprot_test.tsv", tmp_path)
+    expected = list(pd.read_csv(source, chunksize=1, **UNIPROT_READ_OPTIONS))
+    cache_directory = str(tmp_path / "cache")
+    for _ in range(2):
+        chunks = list(read_source(source, cache_directory=cache_directory, chunksize=1, **UNIPROT_READ_OPTIONS))
+        assert len(chunks) == len(expected)
+        for chunk, expected_chunk in zip(chunks, expected):
+            pd.testing.assert_frame_equal(chunk, expected_chunk)
+    assert [entry["rows"] for entry in read_index(cache_directory).values()] == [2]
+
+
+def test_verify_and_prune_cache(tmp_path):
+    source = shutil.copy("tests/resources/hgnc_test.txt", tmp_path)
+    cache_directory = str(tmp_path / "cache")
+    read_source(source, cache_directory=cache_directory, **HGNC_READ_OPTIONS)
+    assert [result["status"] for result in verify_cache(cache_directory)] == ["ok"]
+
+    with open(source, "a") as source_file:
+        source_file.write("HGNC:0\n")
+    assert [result["status"] for result in verify_cache(cache_directory)] == ["stale"]
+    assert len(prune_cache(cache_directory)) == 1
+    assert read_index(cache_directory) == {}
+    assert not [name for name in os.listdir(cache_directory) if name.endswith(".parquet")]
+
+
+def test_read_arrow_file(tmp_path):
+    fields = [[""] * 22 for _ in range(5)]
+    for i, line in enumerate(fields):
+        line[0], line[2], line[12] = f"Q{i:05d}", ["1; 2", "", "3", "NA", "4"][i], "9606"
+    with gzip.open(tmp_path / "idmapping_selected.tab.gz", "wt") as source_file:
+        source_file.writelines("\t".join(line) + "\n" for line in fields)
+    assert filter_uniprot_id_mapping_file(
+        directory=str(tmp_path), source_filename="idmapping_selected.tab", target_filename="idmapping_filtered.tsv"
+    )
+    source, arrow = str(tmp_path / "idmapping_filtered.tsv.gz"), arrow_path(str(tmp_path), "idmapping_filtered.tsv")
+    assert (tmp_path / "idmapping_filtered.arrow").exists()
+
+    # the Arrow IPC file is read as pd.read_csv reads the archive
+    pd.testing.assert_frame_equal(
+        read_arrow(arrow, source, UNIPROT_READ_OPTIONS["usecols"]), pd.read_csv(source, **UNIPROT_READ_OPTIONS)
+    )
+    expected = list(pd.read_csv(source, chunksize=2, **UNIPROT_READ_OPTIONS))
+    chunks = list(read_source(source, cache_directory=None, chunksize=2, arrow=arrow, **UNIPROT_READ_OPTIONS))
+    assert len(chunks) == len(expected) == 3
+    for chunk, expected_chunk in zip(chunks, expected):
+        pd.testing.assert_frame_equal(chunk, expected_chunk)
+    # missing columns aren't read from it
+    assert read_arrow(arrow, source, ["UniProtKB-AC", "UniProtKB-ID"]) is None
+
+    # an Arrow IPC file out of date isn't read
+    with gzip.open(source, "at") as target_file:
+        target_file.write("\t".join(["Q99999", "", "5"] + [""] * 9 + ["9606"] + [""] * 9) + "\n")
+    assert read_arrow(arrow, source, UNIPROT_READ_OPTIONS["usecols"]) is None
+    df = read_source(source, cache_directory=None, arrow=arrow, **UNIPROT_READ_OPTIONS)
+    assert list(df["UniProtKB-AC"])[-1] == "Q99999"
@@ -0,0 +1,127 @@
+"""
+Unit tests for the SSSOM TSV writer
+"""
+
+import gzip
+
+import pandas as pd
+import pytest
+import yaml
+from curies import Converter
+from typer.testing import CliRunner
+
+from monarch_gene_mapping import sssom_writer
+from monarch_gene_mapping.cli_utils import concat_mappings, df_mappings
+from monarch_gene_mapping.main import typer_app
+from monarch_gene_mapping.sssom_writer import (
+    SSSOM_METADATA_KEY,
+    curie_map,
+    mappings_table,
+    sssom_header,
+    write_sssom_arrow,
+    write_sssom_parquet,
+    write_sssom_tsv,
+)
+
+
+@pytest.fixture(params=["pyarrow", "pandas"])
+def backend(request, monkeypatch):
+    if request.param == "pyarrow":
+        pytest.importorskip("pyarrow")
+    else:
+        monkeypatch.setattr(sssom_writer, "pa_csv", None)
+    return request.param
+
+
+def _mappings():
+    df = pd.DataFrame({"gene": ["1", "2", "3", "4"], "protein": ["P1", "P2", "P3", "P4"]})
+    exact = df_mappings(df, subject_column="gene", object_column="protein", subject_curie_prefix="NCBIGene:")
+    close = df_mappings(df, subject_column="gene", object_column="protein", predicate_id="skos:closeMatch")
+    return concat_mappings([exact, close])
+
+
+@pytest.mark.parametrize("batch_size", [1, 3, 100])
+def test_write_sssom_tsv_as_to_csv(tmp_path, backend, batch_size):
+    mappings = _mappings()
+    # values to_csv quotes
+    mappings.iloc[1, 2] = 'P"2'
+    mappings.iloc[2, 2] = "P\t3"
+    mappings.to_csv(tmp_path / "expected.tsv", sep="\t", index=False)
+
+    write_sssom_tsv(mappings, str(tmp_path / "mappings.sssom.tsv"), threads=2, batch_size=batch_size)
+    assert (tmp_path / "mappings.sssom.tsv").read_bytes() == (tmp_path / "expected.tsv").read_bytes()
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def test_sssom_metadata_header(tmp_path):
+    mappings = _mappings()
+    converter = Converter.from_prefix_map(
+        {"NCBIGene": "https://identifiers.org/ncbigene/", "skos": "http://www.w3.org/2004/02/skos/core#"}
+    )
+    metadata = {"curie_map": curie_map(mappings, converter, list(mappings.columns)), "license": "https://example.org"}
+    assert metadata["curie_map"] == {
+        "NCBIGene": "https://identifiers.org/ncbigene/",
+        "skos": "http://www.w3.org/2004/02/skos/core#",
+    }
+    assert sssom_header(metadata).startswith("#curie_map:\n#  NCBIGene:")
+
+    path = tmp_path / "mappings.sssom.tsv"
+    write_sssom_tsv(mappings, str(path), metadata=metadata)
+    lines = path.read_text().splitlines()
+    header = [line[1:] for line in lines if line.startswith("#")]
+    assert yaml.safe_load("\n".join(header)) == metadata
+    assert pd.read_csv(path, sep="\t", comment="#").equals(mappings.reset_index(drop=True).astype(str))
+
+
+@pytest.mark.parametrize("compression", ["gzip", "zstd"])
+def test_compressed_sssom_tsv(tmp_path, compression):
+    if compression == "zstd":
+        pa = pytest.importorskip("pyarrow")
+    mappings = _mappings()
+    write_sssom_tsv(mappings, str(tmp_path / "mappings.sssom.tsv"))
+    path = tmp_path / f"mappings.sssom.tsv{sssom_writer.COMPRESSIONS[compression]}"
+    write_sssom_tsv(mappings, str(path), compression=compression, threads=2, batch_size=3)
+
+    if compression == "gzip":
+        content = gzip.decompress(path.read_bytes())
+    else:
+        content = pa.CompressedInputStream(pa.BufferReader(path.read_bytes()), "zstd").read()
+    # batches written as consecutive gzip members (zstd frames) decompress as a single stream
+    assert content == (tmp_path / "mappings.sssom.tsv").read_bytes()
+
+    with pytest.raises(ValueError, match="Unknown compression"):
+        write_sssom_tsv(mappings, str(path), compression="bzip2")
+
+
+def test_write_sssom_parquet_and_arrow(tmp_path):
+    pa = pytest.importorskip("pyarrow")
+    pq = pytest.importorskip("pyarrow.parquet")
+    mappings = _mappings()
+    metadata = {"curie_map": {"NCBIGene": "http://identifiers.org/ncbigene/"}, "license": "https://example.org"}
+    table = mappings_table(mappings, metadata)
+    expected = mappings.sort_values("subject_id", kind="stable", ignore_index=True)
+
+    write_sssom_parquet(table, str(tmp_path / "mappings.sssom.parquet"), row_group_size=3)
+    parquet_file = pq.ParquetFile(tmp_path / "mappings.sssom.parquet")
+    assert parquet_file.metadata.num_row_groups == 3
+    # sorted by subject_id, so that the row group statistics tell the subjects apart
+    statistics = [parquet_file.metadata.row_group(i).column(0).statistics for i in range(3)]
+    assert all(statistics[i].max <= statistics[i + 1].min for i in range(2))
+    assert pa.types.is_dictionary(parquet_file.schema_arrow.field("predicate_id").type)
+    assert yaml.safe_load(parquet_file.schema_arrow.metadata[SSSOM_METADATA_KEY]) == metadata
+    result = parquet_file.read().to_pandas()
+    pd.testing.assert_frame_equal(result.astype(str), expected.astype(str))
+
+    write_sssom_arrow(table, str(tmp_path / "mappings.sssom.arrow"), batch_size=3)
+    arrow_table = pa.ipc.open_file(pa.memory_map(str(tmp_path / "mappings.sssom.arrow"))).read_all()
+    assert arrow_table.equals(table)
+    assert yaml.safe_load(arrow_table.schema.metadata[SSSOM_METADATA_KEY]) == metadata
+
+
+def test_arrow_formats_without_pyarrow(monkeypatch, tmp_path):
+    monkeypatch.setattr(sssom_writer, "pa", None)
+    # rejected by the command line before anything runs
+    result = CliRunner().invoke(typer_app, ["generate", "--format", "tsv,parquet", "--output-dir", str(tmp_path)])
+    assert result.exit_code == 2
+    assert "require pyarrow" in result.output
+    assert not list(tmp_path.iterdir())
@@ -0,0 +1,44 @@
+"""
+Import time budget of the command line: its help and preprocess-uniprot paths must not import pandas, pyarrow or
+prefixmaps, nor build the prefix map converter
+"""
+
+import subprocess
+import sys
+
+import pytest
+
+HEAVY_MODULES = ["pandas", "numpy", "pyarrow", "prefixmaps", "curies"]
+
+# generous, the command line imports in about 0.15 s
+IMPORT_BUDGET_SECONDS = 1.5
+
+
+def _import_times(code: str) -> dict:
+    """
+    :return: Cumulative import time of each module imported by the code, in seconds
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True, check=False
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, cumulative, module = line.split("|")
+            if cumulative.strip().isdigit():
+                times[module.strip()] = int(cumulative) / 1e6
+    return times
+
+
+@pytest.mark.parametrize(
+    "arguments",
+    [["--help"], ["preprocess-uniprot", "--help"], ["generate", "--help"]],
+)
+def test_command_line_startup(arguments):
+    times = _import_times(
+        "from monarch_gene_mapping.main import typer_app\n"
+        f"try:\n    typer_app({arguments!r})\nexcept SystemExit:\n    pass"
+    )
+    assert "monarch_gene_mapping.main" in times
+    assert not [module for module in HEAVY_MODULES if module in times]
+    assert times["monarch_gene_mapping.main"] < IMPORT_BUDGET_SECONDS
@@ -0,0 +1,48 @@
+"""
+Unit tests for the synthetic source file generator
+"""
+
+import filecmp
+from dataclasses import replace
+
+import pandas as pd
+import pytest
+
+from monarch_gene_mapping.cli_utils import run_source_plan
+from monarch_gene_mapping.mapping_spec import load_mapping_spec, plan_mappings
+from monarch_gene_mapping.synthetic import SOURCES, generate_sources, source_blocks
+from monarch_gene_mapping.uniprot_idmapping_preprocess import filter_uniprot_id_mapping_file
+
+
+def test_source_blocks_are_deterministic():
+    for source in SOURCES:
+        first = pd.concat(source_blocks(source, 250, seed=1, block_size=100))
+        second = pd.concat(source_blocks(source, 250, seed=1, block_size=100))
+        assert len(first) == 250
+        pd.testing.assert_frame_equal(first, second)
+    other = pd.concat(source_blocks("uniprot", 250, seed=2, block_size=100))
+    assert not other["GeneID"].equals(first["GeneID"])
+
+
+def test_generate_sources(tmp_path):
+    paths = generate_sources(str(tmp_path / "first"), rows=300, block_size=128)
+    again = generate_sources(str(tmp_path / "second"), rows=300, block_size=128)
+    for source in SOURCES:
+        assert filecmp.cmp(paths[source], again[source], shallow=False)
+
+
+@pytest.mark.parametrize("source", ["alliance", "hgnc", "ncbi", "uniprot"])
+def test_synthetic_sources_map(tmp_path, source):
+    generate_sources(str(tmp_path), rows=2000, sources=[source])
+    if source == "uniprot":
+        filter_uniprot_id_mapping_file(
+            str(tmp_path / "data" / "uniprot"), "idmapping_selected.tab", "idmapping_filtered.tsv"
+        )
+    [plan] = [plan for plan in plan_mappings(load_mapping_spec()) if plan.source.name == source]
+    plan = replace(
+        plan,
+        source=replace(plan.source, path=str(tmp_path / plan.source.path)),
+        mappings=[replace(mapping, min_count=0) for mapping in plan.mappings],
+    )
+    for mappings in run_source_plan(plan, cache_directory=None):
+        assert len(mappings) > 0
@@ -1,11 +1,22 @@
 """
 Unit tests for the UniProt ID mapping preprocessing
 """
-from typing import Tuple
+
+import gzip
+from typing import List, Tuple
 
 import pytest
 
-from monarch_gene_mapping.uniprot_idmapping_preprocess import target_taxon
+from monarch_gene_mapping import uniprot_idmapping_preprocess
+from monarch_gene_mapping.uniprot_idmapping_preprocess import (
+    filter_chunk,
+    filter_uniprot_id_mapping_file,
+    index_source_file,
+    merge_shards,
+    parse_shard,
+    read_manifest,
+    target_taxon,
+)
 
 
 @pytest.mark.parametrize(
@@ -31,3 +42,207 @@ from monarch_gene_mapping.uniprot_idmapping_preprocess import target_taxon
 )
 def test_target_taxon(query: Tuple[str, bool]):
     assert target_taxon(query[0]) is query[1]
+
+
+def _write_source_file(directory, n: int = 3000) -> List[str]:
+    taxa = ["10090", "654924", "9823", "559292", "9606", "83333"]
+    lines = []
+    for i in range(n):
+        fields = [""] * 22
+        fields[0] = f"Q{i:05d}"
+        fields[2] = f"{i}; {i + 1}"
+        fields[12] = taxa[i % len(taxa)]
+        lines.append("\t".join(fields) + "\n")
+    with gzip.open(directory / "idmapping_selected.tab.gz", "wt") as source_file:
+        source_file.writelines(lines)
+    return lines
+
+
+def _expected_lines(lines: List[str], number_of_lines: int = 0) -> List[str]:
+    # reference implementation: the original line-by-line text filter
+    expected = []
+    for line in lines:
+        if target_taxon(line):
+            expected.append(line)
+        if number_of_lines and len(expected) > number_of_lines:
+            break
+    return expected
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+@pytest.mark.parametrize("number_of_lines", [0, 5, 1200])
+def test_filter_uniprot_id_mapping_file(tmp_path, monkeypatch, workers: int, number_of_lines: int):
+    # small chunks, so that the file spans many chunks
+    monkeypatch.setattr(uniprot_idmapping_preprocess, "CHUNK_SIZE", 4096)
+    lines = _write_source_file(tmp_path)
+    assert filter_uniprot_id_mapping_file(
+        directory=str(tmp_path),
+        source_filename="idmapping_selected.tab",
+        target_filename="idmapping_filtered.tsv",
+        number_of_lines=number_of_lines,
+        workers=workers,
+    )
+    with gzip.open(tmp_path / "idmapping_filtered.tsv.gz", "rt") as target_file:
+        assert target_file.readlines() == _expected_lines(lines, number_of_lines)
+
+
+def test_filter_chunk_unterminated_last_line():
+    species = frozenset([b"9606"])
+    fields = [b""] * 22
+    fields[12] = b"9606"
+    line = b"\t".join(fields)
+    assert filter_chunk(line + b"\n" + line, species) == (line + b"\n" + line, 2, 2)
+    assert filter_chunk(b"short\tline\n", species) == (b"", 1, 0)
+
+
+def test_filter_missing_source_file(tmp_path):
+    assert not filter_uniprot_id_mapping_file(
+        directory=str(tmp_path), source_filename="missing.tab", target_filename="idmapping_filtered.tsv"
+    )
+    assert not (tmp_path / "idmapping_filtered.tsv.gz").exists()
+
+
+def _filter(directory, **kwargs) -> List[str]:
+    assert filter_uniprot_id_mapping_file(
+        directory=str(directory),
+        source_filename="idmapping_selected.tab",
+        target_filename="idmapping_filtered.tsv",
+        **kwargs,
+    )
+    with gzip.open(directory / "idmapping_filtered.tsv.gz", "rt") as target_file:
+        return target_file.readlines()
+
+
+def test_filter_skipped_when_unchanged(tmp_path, monkeypatch):
+    lines = _write_source_file(tmp_path)
+    assert _filter(tmp_path) == _expected_lines(lines)
+    manifest = read_manifest(str(tmp_path / "idmapping_filtered.tsv.manifest.json"))
+    assert manifest["lines_read"] == len(lines)
+    assert manifest["lines_kept"] == len(_expected_lines(lines))
+
+    def fail(*args, **kwargs):
+        raise AssertionError("the source file should not be filtered again")
+
+    monkeypatch.setattr(uniprot_idmapping_preprocess, "filter_file", fail)
+    assert _filter(tmp_path) == _expected_lines(lines)
+
+
+def test_filter_updated_when_species_change(tmp_path):
+    lines = _write_source_file(tmp_path)
+    _filter(tmp_path, species={"10090", "9823"})
+
+    # only the lines of the added taxon are filtered out of the source file, and appended
+    updated = _filter(tmp_path, species={"10090", "9823", "9606"})
+    assert sorted(updated) == sorted(line for line in lines if line.split("\t")[12] in {"10090", "9823", "9606"})
+    manifest = read_manifest(str(tmp_path / "idmapping_filtered.tsv.manifest.json"))
+    assert manifest["target_species"] == ["9606", "9823", "10090"]
+    assert manifest["lines_kept"] == len(updated)
+
+    # removed taxa are filtered out of the target file
+    assert _filter(tmp_path, species={"9606"}) == [line for line in lines if line.split("\t")[12] == "9606"]
+
+
+def test_filter_repeated_when_source_changes(tmp_path):
+    _write_source_file(tmp_path)
+    _filter(tmp_path)
+    lines = _write_source_file(tmp_path, n=100)
+    assert _filter(tmp_path) == _expected_lines(lines)
+
+
+@pytest.fixture(params=["indexed_gzip", "gzip"])
+def archive_access(request, monkeypatch):
+    if request.param == "indexed_gzip":
+        pytest.importorskip("indexed_gzip")
+    else:
+        monkeypatch.setattr(uniprot_idmapping_preprocess, "open_indexed_archive", lambda *args, **kwargs: None)
+    # small ranges, so that the file is split in many shards
+    monkeypatch.setattr(uniprot_idmapping_preprocess, "CHUNK_SIZE", 4096)
+    monkeypatch.setattr(uniprot_idmapping_preprocess, "INDEX_SPACING", 4096)
+    return request.param
+
+
+@pytest.mark.parametrize("shards", [1, 3, 40])
+def test_filter_shards_merged(tmp_path, monkeypatch, archive_access, shards: int):
+    lines = _write_source_file(tmp_path)
+    index = index_source_file(str(tmp_path), "idmapping_selected.tab")
+    assert (index["gzip_index"] is not None) is (archive_access == "indexed_gzip")
+    # the shards may run in any order, i.e. as separate processes
+    for shard in reversed(range(1, shards + 1)):
+        assert filter_uniprot_id_mapping_file(
+            directory=str(tmp_path),
+            source_filename="idmapping_selected.tab",
+            target_filename="idmapping_filtered.tsv",
+            shard=f"{shard}/{shards}",
+        )
+    assert merge_shards(str(tmp_path), "idmapping_selected.tab", "idmapping_filtered.tsv")
+    with gzip.open(tmp_path / "idmapping_filtered.tsv.gz", "rt") as target_file:
+        assert target_file.readlines() == _expected_lines(lines)
+    assert not (tmp_path / "idmapping_filtered.tsv.shards").exists()
+    manifest = read_manifest(str(tmp_path / "idmapping_filtered.tsv.manifest.json"))
+    assert (manifest["lines_read"], manifest["shards"]) == (len(lines), shards)
+
+    # the merged file is up to date with the source file
+    def fail(*args, **kwargs):
+        raise AssertionError("the source file should not be filtered again")
+
+    monkeypatch.setattr(uniprot_idmapping_preprocess, "filter_file", fail)
+    assert _filter(tmp_path) == _expected_lines(lines)
+
+
+def test_merge_incomplete_shards(tmp_path, monkeypatch, archive_access):
+    _write_source_file(tmp_path)
+    for shard in ["1/3", "3/3"]:
+        assert filter_uniprot_id_mapping_file(
+            directory=str(tmp_path),
+            source_filename="idmapping_selected.tab",
+            target_filename="idmapping_filtered.tsv",
+            shard=shard,
+        )
+    assert not merge_shards(str(tmp_path), "idmapping_selected.tab", "idmapping_filtered.tsv")
+    # a shard filtered for other taxa isn't merged either
+    assert filter_uniprot_id_mapping_file(
+        directory=str(tmp_path),
+        source_filename="idmapping_selected.tab",
+        target_filename="idmapping_filtered.tsv",
+        shard="2/3",
+        species={"9606"},
+    )
+    assert not merge_shards(str(tmp_path), "idmapping_selected.tab", "idmapping_filtered.tsv")
+    assert not (tmp_path / "idmapping_filtered.tsv.gz").exists()
+
+
+@pytest.mark.parametrize("shard", ["0/3", "4/3", "2", "a/b"])
+def test_parse_invalid_shard(shard: str):
+    with pytest.raises(ValueError):
+        parse_shard(shard)
+
+
+def test_interrupted_filter_leaves_no_stale_manifest(tmp_path, monkeypatch):
+    lines = _write_source_file(tmp_path)
+    filtered = _filter(tmp_path, species={"10090"})
+    manifest_path = tmp_path / "idmapping_filtered.tsv.manifest.json"
+    manifest = read_manifest(str(manifest_path))
+    filter_file = uniprot_idmapping_preprocess.filter_file
+
+    def interrupted(source, target, *args, **kwargs):
+        # the run stops after writing part of the target
+        with gzip.open(target, "ab") as target_file:
+            target_file.write(lines[0].encode())
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(uniprot_idmapping_preprocess, "filter_file", interrupted)
+    # an interrupted update leaves the target archive and its manifest as they were
+    with pytest.raises(KeyboardInterrupt):
+        _filter(tmp_path, species={"10090", "9606"})
+    with gzip.open(tmp_path / "idmapping_filtered.tsv.gz", "rt") as target_file:
+        assert target_file.readlines() == filtered
+    assert read_manifest(str(manifest_path)) == manifest
+
+    # an interrupted complete filtering leaves no manifest describing the target archive as up to date
+    with pytest.raises(KeyboardInterrupt):
+        _filter(tmp_path, species={"10090"}, force=True)
+    assert not manifest_path.exists()
+    monkeypatch.setattr(uniprot_idmapping_preprocess, "filter_file", filter_file)
+    assert _filter(tmp_path, species={"10090", "9606"}) == [
+        line for line in lines if line.split("\t")[12] in {"10090", "9606"}
+    ]
@@ -0,0 +1,111 @@
+"""
+Unit tests for the validation of generated mappings
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from monarch_gene_mapping import validation
+from monarch_gene_mapping.validation import MappingValidationError, classify_value, validate_mappings
+
+
+class _Converter:
+    """
+    Stand-in for curies.Converter, knowing a fixed set of prefixes
+    """
+
+    def __init__(self, prefixes):
+        self.prefixes = prefixes
+
+    def standardize_prefix(self, prefix):
+        return prefix if prefix in self.prefixes else None
+
+
+def _mappings(subjects, objects, predicate="skos:exactMatch"):
+    return pd.DataFrame(
+        {
+            "subject_id": subjects,
+            "predicate_id": predicate,
+            "object_id": objects,
+            "mapping_justification": "semapv:UnspecifiedMatching",
+        }
+    )
+
+
+@pytest.fixture(params=["pyarrow", "pandas"])
+def backend(request, monkeypatch):
+    if request.param == "pyarrow":
+        pytest.importorskip("pyarrow")
+    else:
+        monkeypatch.setattr(validation, "pa", None)
+        monkeypatch.setattr(validation, "pc", None)
+    return request.param
+
+
+def test_valid_mappings(backend):
+    mappings = _mappings(["HGNC:5", "HGNC:7"], ["OMIM:138670", "UniProtKB:P01023"])
+    report = validate_mappings(mappings, _Converter({"HGNC", "OMIM", "UniProtKB"}))
+    assert not report.has_errors
+    assert report.issues.empty
+    assert str(report) == "All 2 mappings are valid"
+
+
+def test_invalid_mappings(backend):
+    mappings = _mappings(
+        ["HGNC:5", "HGNC:<NA>", "HGNC:7", "", None, "HGNC:1 ", "HGNC", "FOO:1", "HGNC:5"],
+        ["OMIM:1", "OMIM:2", "OMIM:nan", "OMIM:4", "OMIM:5", "OMIM:6", "OMIM:7", "OMIM:8", "OMIM:1"],
+    )
+    report = validate_mappings(mappings, _Converter({"HGNC", "OMIM"}))
+    assert report.has_errors
+    issues = report.issues.set_index(["column", "row"])
+    assert issues.loc[("subject_id", 1), "check"] == "na_text"
+    assert issues.loc[("object_id", 2), "check"] == "na_text"
+    assert issues.loc[("subject_id", 3), "check"] == "empty"
+    assert issues.loc[("subject_id", 4), "check"] == "missing"
+    assert issues.loc[("subject_id", 5), "check"] == "whitespace"
+    assert issues.loc[("subject_id", 6), "check"] == "malformed_curie"
+    assert issues.loc[("subject_id", 7), "check"] == "unknown_prefix"
+    assert list(report.warnings["row"]) == [8]
+    assert list(report.warnings["check"]) == ["duplicate"]
+    assert len(report.errors) == 7
+    assert report.counts()["count"].sum() == 8
+    # the offending mappings are kept in the report
+    assert report.issues.loc[report.issues["check"] == "unknown_prefix", "object_id"].item() == "OMIM:8"
+
+
+def test_duplicates_need_the_same_predicate(backend):
+    mappings = pd.concat(
+        [_mappings(["HGNC:5"], ["UniProtKB:P1"]), _mappings(["HGNC:5"], ["UniProtKB:P1"], "skos:closeMatch")]
+    )
+    report = validate_mappings(mappings)
+    assert report.issues.empty
+
+
+def test_invalid_predicate(backend):
+    mappings = _mappings(["HGNC:5", "HGNC:7"], ["OMIM:1", "OMIM:2"], predicate="exactMatch")
+    report = validate_mappings(mappings)
+    assert set(report.errors["column"]) == {"predicate_id"}
+    assert list(report.errors["row"]) == [0, 1]
+
+
+def test_mapping_validation_error(backend):
+    report = validate_mappings(_mappings(["HGNC:<NA>"], ["OMIM:1"]))
+    error = MappingValidationError(report)
+    assert error.report is report
+    assert "na_text in subject_id: 1 rows" in str(error)
+
+
+@pytest.mark.parametrize(
+    "value,check",
+    [
+        (np.nan, "missing"),
+        (pd.NA, "missing"),
+        ("", "empty"),
+        ("NA", "na_text"),
+        ("A: 1", "whitespace"),
+        ("1", "malformed_curie"),
+    ],
+)
+def test_classify_value(value, check):
+    assert classify_value(value) == check